@@ -0,0 +1,131 @@
+"""
+Shared pools of API clients for the Gemini and ChatGPT runners.
+
+Concurrent stages (asyncio chains, best-of-N samples, retries) all need a
+client at once. `ClientPool` keeps a fixed number of clients and hands each
+thread the same one every time, round-robin, so threads do not queue on a
+single client's connection-pool lock and every client keeps its connections
+warm. Clients are built on first use.
+
+For OpenAI each client gets its own httpx connection pool with keep-alive,
+a connection limit and default timeouts; `timeout=` on a single request
+overrides them. The Gemini SDK talks gRPC over one HTTP/2 channel shared by
+the process, which already multiplexes concurrent calls over kept-alive
+connections, so its pool holds per-thread GenerativeModel objects and
+deadlines are set per request with `request_options`.
+
+Building a pool is free: the SDKs are imported and the API key is read when
+the first client is created, so importing a runner needs neither.
+"""
+import threading
+
+
+class ClientPool:
+    """
+    A fixed number of API clients shared by all threads.
+
+    Args:
+        factory: Zero-argument function returning a new client
+        size: Number of clients; each thread is assigned one of them round-robin
+    """
+
+    def __init__(self, factory, size: int = 1):
+        if size < 1:
+            raise ValueError(f"Client pool size must be at least 1, not {size}")
+        self.factory = factory
+        self.size = size
+        self._clients = [None] * size
+        self._next = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get(self):
+        """Return the client assigned to the current thread, creating it on first use."""
+        index = getattr(self._local, "index", None)
+        with self._lock:
+            if index is None:
+                index = self._local.index = self._next % self.size
+                self._next += 1
+            if self._clients[index] is None:
+                self._clients[index] = self.factory()
+            return self._clients[index]
+
+    def close(self):
+        """Close every client that was created (and has a close method)."""
+        with self._lock:
+            clients, self._clients = self._clients, [None] * self.size
+        for client in clients:
+            if client is not None and hasattr(client, "close"):
+                client.close()
+
+
+def openai_pool(
+    get_api_key,
+    base_url: str = None,
+    size: int = 1,
+    max_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    timeout: float = 600.0,
+    connect_timeout: float = 10.0
+) -> ClientPool:
+    """
+    Build a pool of OpenAI clients with tuned HTTP connection pools.
+
+    Retries are left to rate_limiter, so the clients do not retry on their own.
+
+    Args:
+        get_api_key: Zero-argument function returning the OpenAI API key, called for each new client
+        base_url: OpenAI-compatible endpoint, or None for api.openai.com
+        size: Number of clients
+        max_connections: Open connections allowed across the whole pool
+        keepalive_expiry: Seconds an idle connection is kept open for reuse
+        timeout: Default seconds a request may take (for streams: between chunks)
+        connect_timeout: Seconds allowed to open a connection
+
+    Returns:
+        ClientPool: Pool of openai.OpenAI clients
+    """
+    per_client = max(1, max_connections // size)
+
+    def make_client():
+        import httpx
+        from openai import OpenAI
+
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=per_client,
+                max_keepalive_connections=per_client,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+        return OpenAI(api_key=get_api_key(), base_url=base_url, http_client=http_client, max_retries=0)
+
+    return ClientPool(make_client, size)
+
+
+def gemini_pool(model_name: str, size: int = 1, get_api_key=None) -> ClientPool:
+    """
+    Build a pool of Gemini GenerativeModel objects.
+
+    Args:
+        model_name: Gemini model name
+        size: Number of model objects
+        get_api_key: Zero-argument function returning the API key; genai.configure is called with it
+            before the first model object is built (None if the caller configures the SDK itself)
+
+    Returns:
+        ClientPool: Pool of genai.GenerativeModel objects
+    """
+    configured = []
+
+    def make_model():
+        import google.generativeai as genai
+
+        # ClientPool builds clients under its lock, so the SDK is configured exactly once
+        if get_api_key is not None and not configured:
+            genai.configure(api_key=get_api_key())
+            configured.append(True)
+        return genai.GenerativeModel(model_name)
+
+    return ClientPool(make_model, size)
@@ -0,0 +1,89 @@
+"""
+Best-of-N sampling for the SEIR model stages.
+
+Outputs vary from run to run, so a stage can draw N samples in parallel and
+keep the one the local validator (seir_validator) scores best. As soon as one
+sample passes every rule the others are abandoned: queued samples are never
+sent, and streaming samples stop at their next chunk. Non-streaming calls
+that are already in flight finish in the background and are discarded.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import seir_validator
+import streaming
+import xml_patch
+
+
+def sample_best(generate, n: int, validate, label: str = "") -> tuple:
+    """
+    Draw up to `n` samples in parallel and return the best-scoring one.
+
+    Args:
+        generate: Function taking the sample index (0-based) and returning a response or "ERROR: ..."
+        n: Number of samples
+        validate: Function returning the list of seir_validator.Issue objects for a response
+        label: Stage name used in progress messages
+
+    Returns:
+        tuple: (response, issues) of the best sample; if every sample failed, the first error and []
+    """
+    cancel = threading.Event()
+
+    def run(index):
+        streaming.set_cancel_event(cancel)
+        try:
+            return generate(index)
+        finally:
+            streaming.set_cancel_event(None)
+
+    best, best_issues, best_score, first_error = None, [], None, None
+    executor = ThreadPoolExecutor(max_workers=n, thread_name_prefix="best-of-n")
+    try:
+        futures = {executor.submit(run, index): index for index in range(n)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                response = future.result()
+            except Exception as err:
+                response = f"ERROR: {err}"
+            if response.startswith("ERROR:"):
+                print(f"{label} sample {index + 1}/{n} failed: {response}")
+                first_error = first_error or response
+                continue
+
+            issues = validate(response)
+            score = seir_validator.score(issues)
+            print(f"{label} sample {index + 1}/{n}: {len(issues)} validation issue(s)")
+            if best_score is None or score > best_score:
+                best, best_issues, best_score = response, issues, score
+            if not issues:
+                print(f"{label} sample {index + 1}/{n} passed every rule; cancelling the remaining samples")
+                break
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if best is None:
+        return first_error, []
+    for issue in best_issues:
+        print(f"  {issue}")
+    return best, best_issues
+
+
+def stage2_validator(llm1: str, patch: bool = False):
+    """
+    Return the validate function for Stage 2 responses.
+
+    In patch mode the edit list is applied to LLM1's XML first; a patch that
+    cannot be applied is scored like malformed XML.
+    """
+    def validate(response):
+        if not patch:
+            return seir_validator.validate(response)
+        try:
+            return seir_validator.validate(xml_patch.apply_patch(llm1, response))
+        except (xml_patch.PatchError, SyntaxError) as err:
+            return [seir_validator.Issue("well_formed", f"Patch could not be applied: {err}")]
+
+    return validate
@@ -0,0 +1,143 @@
+"""
+Record/replay of backend calls for offline benchmarking.
+
+In "record" mode every backend request is passed through and written, with
+its response and how long it took, to a JSON Lines cassette file. In "replay"
+mode the same requests are answered from the cassette without touching the
+network or a local model, optionally sleeping for the recorded time (scaled
+by `latency_scale`). This lets prompt assembly, parsing, validation and file
+I/O in `generate_seirmodel` and `simulate` be profiled on their own.
+
+The cassette sits below the response cache and the cache lookup is skipped
+while it is active, so every request really reaches the backend (or the
+cassette) and the recorded times are generation times, not cache hits.
+
+Requests are matched with the response cache key (backend, model, parameters,
+prompt). A request recorded several times (e.g. best-of-N samples) is replayed
+in recorded order, and the last recording is repeated once they run out.
+"""
+import json
+import os
+import threading
+import time
+
+import response_cache
+
+
+MODES = ("off", "record", "replay")
+
+
+class Cassette:
+    """
+    A cassette file of recorded backend calls.
+
+    Args:
+        path: JSON Lines file the calls are recorded to or replayed from
+        mode: "off", "record" or "replay"
+        latency_scale: Fraction of the recorded call time to sleep for on replay (0 = instant)
+    """
+
+    def __init__(self, path: str, mode: str = "off", latency_scale: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {', '.join(MODES)}, not '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.recorded = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        self._started = False
+        self._entries = None
+        self._positions = {}
+
+    @property
+    def active(self) -> bool:
+        """Whether calls are recorded or replayed; the response cache must not answer them first."""
+        return self.mode != "off"
+
+    def load(self) -> dict:
+        """Read the cassette file and group its entries by request key."""
+        entries = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault(entry["key"], []).append(entry)
+        print(f"Loaded {sum(len(v) for v in entries.values())} recorded calls from {self.path}")
+        return entries
+
+    def record(self, key: str, backend: str, model_name: str, label: str, prompt: str, response: str, elapsed: float):
+        """Append one call to the cassette, starting a fresh file on the first call of the run."""
+        entry = {
+            "key": key,
+            "backend": backend,
+            "model": model_name,
+            "label": label,
+            "prompt_chars": len(prompt),
+            "elapsed": round(elapsed, 3),
+            "response": response,
+        }
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a" if self._started else "w", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._started = True
+            self.recorded += 1
+
+    def replay(self, key: str, label: str) -> str:
+        """Return the next recorded response for a request, or an "ERROR: ..." message if it was not recorded."""
+        with self._lock:
+            if self._entries is None:
+                try:
+                    self._entries = self.load()
+                except FileNotFoundError:
+                    return f"ERROR: Cassette {self.path} not found; record it first with CASSETTE_MODE = \"record\""
+            recordings = self._entries.get(key)
+            if not recordings:
+                return f"ERROR: No recorded response in {self.path} for {label or 'this request'}"
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            entry = recordings[min(position, len(recordings) - 1)]
+            self.replayed += 1
+
+        if self.latency_scale > 0:
+            time.sleep(entry["elapsed"] * self.latency_scale)
+        print(f"Replayed {label or entry['label']} from {self.path}")
+        return entry["response"]
+
+    def call(
+        self,
+        backend: str,
+        model_name: str,
+        params: dict,
+        prompt: str,
+        generate,
+        label: str = ""
+    ) -> str:
+        """
+        Pass a backend call through the cassette.
+
+        Args:
+            backend: Backend name used in the request key
+            model_name: Model identifier used in the request key
+            params: Generation parameters used in the request key
+            prompt: The full prompt text
+            generate: Zero-argument function making the real call (not used on replay)
+            label: Stage name stored with the recording
+
+        Returns:
+            str: The response, or the backend's "ERROR: ..." message
+        """
+        if self.mode == "off":
+            return generate()
+
+        key = response_cache.make_key(backend, model_name, params, prompt)
+        if self.mode == "replay":
+            return self.replay(key, label)
+
+        start = time.monotonic()
+        response = generate()
+        self.record(key, backend, model_name, label, prompt, response, time.monotonic() - start)
+        return response
@@ -0,0 +1,124 @@
+"""
+Model diagrams prepared for multimodal LLM1 requests.
+
+Paper diagrams in `diagrams/` are far larger than a vision model needs: every
+extra pixel costs upload bytes and, past the backend's tile size, image
+tokens. `prepare_diagram` downscales a diagram so its longest side fits the
+backend (e.g. one 768px tile for Gemini), flattens transparency, and
+re-encodes it as whichever is smaller of a palette PNG (clean for line art
+and labels) and a JPEG. Results are cached on disk by the SHA-256 of the
+source bytes and the settings, so a diagram is only processed once.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+
+
+class Diagram:
+    """An encoded diagram ready to attach to a request."""
+
+    def __init__(self, data: bytes, mime_type: str, width: int, height: int, source: str = ""):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.source = source
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    def data_url(self) -> str:
+        """Return the image as a base64 data URL (OpenAI image_url content)."""
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+    def __str__(self):
+        return f"{os.path.basename(self.source)} ({self.width}x{self.height} {self.mime_type}, {len(self.data) // 1024} KB)"
+
+
+def _encode(image, palette_colors: int, jpeg_quality: int) -> tuple:
+    """Encode an RGB image as palette PNG and as JPEG and return the smaller (bytes, mime type)."""
+    from PIL import Image
+
+    png = io.BytesIO()
+    image.quantize(colors=palette_colors, method=Image.Quantize.MEDIANCUT).save(png, format="PNG", optimize=True)
+    jpeg = io.BytesIO()
+    image.save(jpeg, format="JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+    if len(png.getvalue()) <= len(jpeg.getvalue()):
+        return png.getvalue(), "image/png"
+    return jpeg.getvalue(), "image/jpeg"
+
+
+def process_image(data: bytes, max_side: int, palette_colors: int = 64, jpeg_quality: int = 80) -> tuple:
+    """
+    Downscale and recompress image bytes.
+
+    Args:
+        data: Source image file contents
+        max_side: Longest side in pixels after downscaling (smaller images are not enlarged)
+        palette_colors: Colors of the PNG candidate
+        jpeg_quality: Quality of the JPEG candidate
+
+    Returns:
+        tuple: (encoded bytes, mime type, width, height)
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = source.convert("RGBA")
+    # Diagrams are drawn on white; transparent areas would otherwise turn black
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    image = background
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    encoded, mime_type = _encode(image, palette_colors, jpeg_quality)
+    return encoded, mime_type, image.width, image.height
+
+
+_lock = threading.Lock()
+
+
+def prepare_diagram(
+    path: str,
+    max_side: int = 768,
+    cache_dir: str = "diagram_cache",
+    palette_colors: int = 64,
+    jpeg_quality: int = 80
+) -> Diagram:
+    """
+    Load a diagram, shrink it for the backend and cache the result.
+
+    Args:
+        path: Diagram file, e.g. "diagrams/hivModel(paper).jpeg"
+        max_side: Longest side in pixels the backend needs
+        cache_dir: Folder processed diagrams are stored in (None to disable)
+        palette_colors: Colors of the PNG candidate
+        jpeg_quality: Quality of the JPEG candidate
+
+    Returns:
+        Diagram: The encoded image
+    """
+    with open(path, "rb") as f:
+        source = f.read()
+    settings = json.dumps([max_side, palette_colors, jpeg_quality])
+    key = hashlib.sha256(source + settings.encode("utf-8")).hexdigest()
+
+    meta_path = os.path.join(cache_dir, f"{key}.json") if cache_dir else None
+    with _lock:
+        if meta_path and os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(cache_dir, meta["file"]), "rb") as f:
+                return Diagram(f.read(), meta["mime_type"], meta["width"], meta["height"], path)
+
+        encoded, mime_type, width, height = process_image(source, max_side, palette_colors, jpeg_quality)
+        diagram = Diagram(encoded, mime_type, width, height, path)
+        print(f"Prepared diagram {diagram} from {len(source) // 1024} KB")
+        if meta_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            image_file = f"{key}.{mime_type.split('/')[1]}"
+            with open(os.path.join(cache_dir, image_file), "wb") as f:
+                f.write(encoded)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"file": image_file, "mime_type": mime_type, "width": width, "height": height, "source": path}, f)
+        return diagram
@@ -0,0 +1,184 @@
+"""
+Pool of local llama.cpp workers with queue-based dispatch.
+
+A single llama.cpp process does not use every core of a large CPU-only box.
+`LlamaPool` runs N workers, each pinned to its own slice of cores (and, in
+server mode, owning its own llama-server on its own port). Stage jobs from
+all models go into one shared queue; each worker takes the next job as soon
+as it is free. The pool records how long every job waited in the queue and
+how busy each worker was, and prints a report when it shuts down.
+
+Code running inside a job can call `current_worker()` to find the worker's
+server and cores.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import streaming
+
+
+_local = threading.local()
+
+
+def current_worker():
+    """Return the Worker running the current job, or None outside the pool."""
+    return getattr(_local, "worker", None)
+
+
+def split_cores(workers: int, cores: list = None) -> list:
+    """
+    Split CPU cores into `workers` contiguous slices of (nearly) equal size.
+
+    Args:
+        workers: Number of slices
+        cores: Cores to split; defaults to the cores this process may run on
+
+    Returns:
+        list: One tuple of core ids per worker
+    """
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if workers > len(cores):
+        raise ValueError(f"Cannot split {len(cores)} cores between {workers} workers")
+    size, extra = divmod(len(cores), workers)
+    slices, start = [], 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        slices.append(tuple(cores[start:end]))
+        start = end
+    return slices
+
+
+class Worker:
+    """One pool worker: its cores, its server (server mode only) and its usage counters."""
+
+    def __init__(self, index: int, cores: tuple, server=None):
+        self.index = index
+        self.cores = cores
+        self.server = server
+        self.jobs = 0
+        self.busy_time = 0.0
+
+
+class LlamaPool:
+    """
+    N workers pulling stage jobs from one shared queue.
+
+    Args:
+        workers: Number of workers
+        worker_cores: Cores per worker (list of lists); None splits the available cores evenly
+        make_server: Function (index, cores) -> LlamaServer for server mode, or None for CLI mode
+    """
+
+    def __init__(self, workers: int, worker_cores: list = None, make_server=None):
+        cores = [tuple(c) for c in worker_cores] if worker_cores else split_cores(workers)
+        if len(cores) != workers:
+            raise ValueError(f"Got core lists for {len(cores)} workers, expected {workers}")
+        self.workers = [
+            Worker(index, cores[index], make_server(index, cores[index]) if make_server else None)
+            for index in range(workers)
+        ]
+        self.queue = queue.Queue()
+        self.waits = []
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, args=(worker,), name=f"llama-worker-{worker.index}", daemon=True)
+            for worker in self.workers
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn) -> Future:
+        """
+        Queue a job for the next free worker.
+
+        The caller's streaming cancel event (best-of-N) is carried over to the worker thread.
+
+        Args:
+            fn: Zero-argument function run on a worker thread
+
+        Returns:
+            Future: Resolves to the function's return value
+        """
+        future = Future()
+        self.queue.put((fn, future, time.monotonic(), streaming.get_cancel_event()))
+        return future
+
+    def run(self, fn):
+        """Run a job on the pool and wait for its result."""
+        return self.submit(fn).result()
+
+    def _work(self, worker: Worker):
+        _local.worker = worker
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            fn, future, enqueued, cancel_event = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.monotonic()
+            with self._lock:
+                self.waits.append(start - enqueued)
+            streaming.set_cancel_event(cancel_event)
+            try:
+                future.set_result(fn())
+            except BaseException as err:
+                future.set_exception(err)
+            finally:
+                streaming.set_cancel_event(None)
+                with self._lock:
+                    worker.jobs += 1
+                    worker.busy_time += time.monotonic() - start
+
+    def report(self) -> str:
+        """Summarize per-worker utilization and queue wait times."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._lock:
+            lines = [f"llama.cpp pool: {len(self.workers)} workers, {len(self.waits)} jobs in {elapsed:.1f}s"]
+            for worker in self.workers:
+                cores = ",".join(str(core) for core in worker.cores)
+                lines.append(
+                    f"  worker {worker.index} (cores {cores}): {worker.jobs} jobs, "
+                    f"{worker.busy_time:.1f}s busy, {worker.busy_time / elapsed:.0%} utilization"
+                )
+            if self.waits:
+                lines.append(
+                    f"  queue wait: mean {sum(self.waits) / len(self.waits):.1f}s, "
+                    f"max {max(self.waits):.1f}s"
+                )
+        return "\n".join(lines)
+
+    def shutdown(self):
+        """Stop the worker threads after the queued jobs, print the report and stop the servers."""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        print(self.report())
+        for worker in self.workers:
+            if worker.server is not None:
+                worker.server.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers: int, worker_cores: list = None, make_server=None) -> LlamaPool:
+    """
+    Return the shared pool for this process, creating it on first use.
+
+    The pool is registered to be shut down (and its report printed) when the interpreter exits.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LlamaPool(workers, worker_cores, make_server)
+            atexit.register(_pool.shutdown)
+    return _pool
@@ -0,0 +1,335 @@
+"""
+Persistent llama.cpp server backend.
+
+Spawning the llama.cpp `main` binary once per stage reloads the whole GGUF
+model from disk on every LLM1, LLM2, 3A and 3B call. This module starts a
+single long-lived `llama-server` process instead, waits for it to report
+healthy, and sends every prompt to it over HTTP on localhost. The server is
+stopped when the Python process exits and is restarted if it crashes.
+
+Static prompt prefixes (stage prompt plus metamodel) can be kept as saved
+slot KV caches, so a batch of models evaluates each shared prefix only once.
+"""
+import atexit
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+class LlamaServer:
+    """
+    A single llama.cpp server process serving completions on localhost.
+
+    Args:
+        server_path: Path to the `llama-server` executable
+        model_path: Path to the GGUF model file
+        host: Interface the server listens on
+        port: Port the server listens on
+        ctx_size: Context size passed to the server
+        extra_args: Additional command line arguments for llama-server
+        startup_timeout: Seconds to wait for the model to finish loading
+        max_restarts: How many times a crashed server is restarted before giving up
+        slot_save_path: Directory for saved prompt-prefix KV caches (disabled if None)
+        cpu_cores: CPU cores the process is pinned to, also used as its thread count (all cores if None)
+    """
+
+    def __init__(
+        self,
+        server_path: str,
+        model_path: str,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        ctx_size: int = 8192,
+        extra_args: list = None,
+        startup_timeout: int = 600,
+        max_restarts: int = 3,
+        slot_save_path: str = None,
+        cpu_cores: tuple = None
+    ):
+        self.server_path = server_path
+        self.model_path = model_path
+        self.host = host
+        self.port = port
+        self.ctx_size = ctx_size
+        self.extra_args = list(extra_args or [])
+        self.startup_timeout = startup_timeout
+        self.max_restarts = max_restarts
+        self.slot_save_path = slot_save_path
+        self.cpu_cores = tuple(cpu_cores) if cpu_cores else None
+        self.process = None
+        self.restarts = 0
+        self.loaded_prefix = None  # cache key of the prefix currently held in slot 0
+        self._lock = threading.Lock()
+        self._slot_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def command(self) -> list:
+        """Build the llama-server command line."""
+        cmd = [
+            self.server_path,
+            "-m", self.model_path,
+            "--host", self.host,
+            "--port", str(self.port),
+            "-c", str(self.ctx_size),
+        ]
+        if self.slot_save_path:
+            os.makedirs(self.slot_save_path, exist_ok=True)
+            cmd += ["--slot-save-path", os.path.abspath(self.slot_save_path)]
+        if self.cpu_cores:
+            cmd += ["--threads", str(len(self.cpu_cores))]
+        return cmd + self.extra_args
+
+    def is_alive(self) -> bool:
+        """Return True if the server process is running."""
+        return self.process is not None and self.process.poll() is None
+
+    def health(self) -> bool:
+        """Return True if the server answers its /health endpoint with 200 OK."""
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/health", timeout=5) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def start(self):
+        """Start the server process and block until the model is loaded."""
+        print(f"Starting llama.cpp server on {self.base_url} with model {self.model_path}")
+        self.process = subprocess.Popen(
+            self.command(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            preexec_fn=pin_to_cores(self.cpu_cores),
+        )
+        self.wait_until_ready()
+
+    def wait_until_ready(self):
+        """Poll /health until the server is ready, the process dies, or the startup timeout passes."""
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if not self.is_alive():
+                raise RuntimeError(
+                    f"llama.cpp server exited during startup with code {self.process.returncode}"
+                )
+            if self.health():
+                print("llama.cpp server is ready.")
+                return
+            time.sleep(1)
+        self.stop()
+        raise RuntimeError(f"llama.cpp server not ready after {self.startup_timeout} seconds")
+
+    def ensure_running(self):
+        """Start the server if it has not been started, or restart it if it crashed."""
+        with self._lock:
+            if self.is_alive():
+                return
+            if self.process is not None:
+                if self.restarts >= self.max_restarts:
+                    raise RuntimeError(
+                        f"llama.cpp server crashed {self.restarts + 1} times, giving up"
+                    )
+                self.restarts += 1
+                print(
+                    f"llama.cpp server exited with code {self.process.returncode}, "
+                    f"restarting ({self.restarts}/{self.max_restarts})..."
+                )
+            self.loaded_prefix = None
+            self.start()
+
+    def stop(self):
+        """Terminate the server process, killing it if it does not exit in time."""
+        if not self.is_alive():
+            return
+        print("Stopping llama.cpp server...")
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def post(self, endpoint: str, payload: dict, timeout: float) -> dict:
+        """POST a JSON payload to the server and return the decoded JSON response."""
+        request = urllib.request.Request(
+            f"{self.base_url}{endpoint}",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def load_prefix(self, prefix: str, cache_key: str, timeout: float):
+        """
+        Make slot 0 hold the KV cache for `prefix`.
+
+        Restores the saved cache for `cache_key` if one exists; otherwise
+        evaluates the prefix once and saves the resulting slot to disk.
+        """
+        if self.loaded_prefix == cache_key:
+            return
+        filename = f"{cache_key}.bin"
+        if os.path.exists(os.path.join(self.slot_save_path, filename)):
+            print(f"Restoring cached prompt prefix {cache_key[:12]}...")
+            self.post("/slots/0?action=restore", {"filename": filename}, timeout)
+        else:
+            print(f"Evaluating prompt prefix {cache_key[:12]} and saving it to the cache...")
+            self.post(
+                "/completion",
+                {"prompt": prefix, "n_predict": 0, "id_slot": 0, "cache_prompt": True},
+                timeout,
+            )
+            self.post("/slots/0?action=save", {"filename": filename}, timeout)
+        self.loaded_prefix = cache_key
+
+    def complete(
+        self,
+        prompt: str,
+        params: dict,
+        timeout: float = 300,
+        prefix: str = None,
+        cache_key: str = None
+    ) -> str:
+        """
+        Generate a completion for the prompt.
+
+        Args:
+            prompt: The input prompt
+            params: Sampling parameters in llama-server's /completion format
+            timeout: Seconds to wait for the whole completion
+            prefix: Static leading part of the prompt whose KV cache can be reused
+            cache_key: Key identifying the prefix, see prefix_cache_key()
+
+        Returns:
+            str: Generated text from the model
+        """
+        self.ensure_running()
+        if prefix and cache_key and self.slot_save_path and prompt.startswith(prefix):
+            with self._slot_lock:
+                self.load_prefix(prefix, cache_key, timeout)
+                payload = {"prompt": prompt, "id_slot": 0, "cache_prompt": True, **params}
+                return self.post("/completion", payload, timeout)["content"]
+
+        self.loaded_prefix = None  # the request may land in slot 0 and replace its cache
+        payload = {"prompt": prompt, **params}
+        try:
+            return self.post("/completion", payload, timeout)["content"]
+        except (urllib.error.URLError, ConnectionError):
+            if self.is_alive():
+                raise
+            # The server died mid-request; bring it back and retry once.
+            self.ensure_running()
+            return self.post("/completion", payload, timeout)["content"]
+
+    def stream(
+        self,
+        prompt: str,
+        params: dict,
+        timeout: float = 300,
+        prefix: str = None,
+        cache_key: str = None
+    ):
+        """
+        Stream a completion for the prompt, yielding text chunks as they are generated.
+
+        Closing the generator closes the HTTP connection, which makes the
+        server stop generating. Arguments are the same as for complete().
+        """
+        self.ensure_running()
+        payload = {"prompt": prompt, "stream": True, **params}
+        slot_held = False
+        if prefix and cache_key and self.slot_save_path and prompt.startswith(prefix):
+            self._slot_lock.acquire()
+            slot_held = True
+            payload.update({"id_slot": 0, "cache_prompt": True})
+        else:
+            self.loaded_prefix = None
+        try:
+            if slot_held:
+                self.load_prefix(prefix, cache_key, timeout)
+            request = urllib.request.Request(
+                f"{self.base_url}/completion",
+                data=json.dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                for line in response:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    yield event.get("content", "")
+                    if event.get("stop"):
+                        break
+        finally:
+            if slot_held:
+                self._slot_lock.release()
+
+
+def pin_to_cores(cores: tuple):
+    """
+    Return a subprocess `preexec_fn` that pins the child process to `cores`.
+
+    Returns None (no pinning) if no cores are given or the platform has no CPU affinity API.
+    """
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return None
+    cores = set(cores)
+    return lambda: os.sched_setaffinity(0, cores)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_server(server_path: str, model_path: str, **kwargs) -> LlamaServer:
+    """
+    Return the shared server for this process, starting it on first use.
+
+    The server is registered to be stopped when the interpreter exits.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = LlamaServer(server_path, model_path, **kwargs)
+            atexit.register(_server.stop)
+    _server.ensure_running()
+    return _server
+
+
+def prefix_cache_key(prefix: str, model_path: str, *files: str) -> str:
+    """
+    Hash a prompt prefix together with the model and any files it was built from.
+
+    Args:
+        prefix: Static prompt text
+        model_path: GGUF model the KV cache belongs to
+        files: Source files of the prefix (e.g. the metamodel JSON)
+
+    Returns:
+        str: Hex digest used as the saved cache's file name
+    """
+    digest = hashlib.sha256()
+    digest.update(os.path.basename(model_path).encode("utf-8"))
+    digest.update(prefix.encode("utf-8"))
+    for path in files:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def completion_params(generation_params: dict, max_tokens: int = None) -> dict:
+    """Translate runGPT-style GENERATION_PARAMS into llama-server /completion fields."""
+    return {
+        "n_predict": max_tokens or generation_params["n_predict"],
+        "temperature": generation_params["temp"],
+        "top_k": generation_params["top_k"],
+        "top_p": generation_params["top_p"],
+        "repeat_penalty": generation_params["repeat_penalty"],
+    }
@@ -0,0 +1,141 @@
+"""
+Relevance-based slicing of the metamodel for a single user input.
+
+Most inputs use only part of the metamodel: the Ebola input has no
+stratification, numeric inputs never reference parameters, and only traffic
+models need supply functions. `slice_metamodel` detects these features in the
+user input and keeps only the matching `structure`, `flow_patterns` and
+`validation_rules` entries (and only the numeric or parametric modelling mode
+of each element). Every distinct slice is computed once and cached.
+"""
+import copy
+import hashlib
+import json
+import re
+
+
+FEATURE_PATTERNS = {
+    "stratified": r"^\s*STRATIFICATION\s*:|stratified by|stratum-specific",
+    "parametric": r"MODEL TYPE:\s*Parametric|\|\s*(CONSTANT|EXPRESSION|VARIABLE)\s*\||rate parameter",
+    "births": r"BIRTH SOURCES|\bbirth|recruitment|immigration|∅\s*->",
+    "deaths": r"DEATH SINKS|\bdeath|mortality",
+    "flow_network": r"supplyFunction|junction|traffic|onramp",
+    "trm": r"\bTRM",
+}
+
+# structure entries and the feature each one needs (None = always kept)
+STRUCTURE_FEATURES = {
+    "xml_declaration": None,
+    "root_element": None,
+    "parameters": "parametric",
+    "compartments": None,
+    "supplyFunction": "flow_network",
+    "outgoingFlows": None,
+    "RateFlow": None,
+    "ContactFlow": None,
+    "stratumSpecificRates": "stratified",
+    "birthSources": "births",
+    "deathSinks": "deaths",
+    "groups": "stratified",
+    "products": "stratified",
+}
+
+FLOW_PATTERN_FEATURES = {
+    "stratification": "stratified",
+}
+
+# validation rules dropped unless the feature is present; "numeric" means the input is not parametric
+VALIDATION_RULE_FEATURES = {
+    "Inflow": "births",
+    "Outflow": "deaths",
+    "rate_format_numeric": "numeric",
+    "rate_format_parametric": "parametric",
+    "parameter_uniqueness": "parametric",
+    "parameter_references": "parametric",
+    "stratification_consistency": "stratified",
+    "stratum_validation": "stratified",
+    "unicode_support": "parametric",
+    "flow_network_validation": "flow_network",
+    "trm_validation": "trm",
+}
+
+_slice_cache = {}
+
+
+def detect_features(user_input: str) -> frozenset:
+    """
+    Detect which metamodel features a user input needs.
+
+    Args:
+        user_input: The model's user input text
+
+    Returns:
+        frozenset: Names from FEATURE_PATTERNS, plus "numeric" when the input is not parametric
+    """
+    features = {
+        name for name, pattern in FEATURE_PATTERNS.items()
+        if re.search(pattern, user_input, re.IGNORECASE | re.MULTILINE)
+    }
+    if "trm" in features:
+        features.add("flow_network")
+    if "parametric" not in features:
+        features.add("numeric")
+    return frozenset(features)
+
+
+def _keep_mode(element: dict, mode: str) -> dict:
+    """Drop the modelling mode (numeric/parametric) the input does not use from one structure element."""
+    element = dict(element)
+    if isinstance(element.get("modeling_modes"), dict) and mode in element["modeling_modes"]:
+        element["modeling_modes"] = {mode: element["modeling_modes"][mode]}
+    if isinstance(element.get("examples"), dict) and mode in element["examples"]:
+        element["examples"] = {mode: element["examples"][mode]}
+    return element
+
+
+def _select(section: dict, requirements: dict, features: frozenset) -> dict:
+    return {
+        key: value for key, value in section.items()
+        if requirements.get(key) is None or requirements[key] in features
+    }
+
+
+def _build_slice(metamodel: dict, features: frozenset) -> dict:
+    mode = "parametric" if "parametric" in features else "numeric"
+    sliced = {}
+    for root_key, body in metamodel.items():
+        body = dict(body)
+        if "structure" in body:
+            structure = _select(body["structure"], STRUCTURE_FEATURES, features)
+            body["structure"] = {key: _keep_mode(value, mode) for key, value in structure.items()}
+        if "flow_patterns" in body:
+            body["flow_patterns"] = _select(body["flow_patterns"], FLOW_PATTERN_FEATURES, features)
+        if "validation_rules" in body:
+            body["validation_rules"] = _select(body["validation_rules"], VALIDATION_RULE_FEATURES, features)
+        sliced[root_key] = body
+    return sliced
+
+
+def slice_metamodel(metamodel: dict, user_input: str) -> dict:
+    """
+    Return the parts of the metamodel relevant to this user input.
+
+    Inputs that do not describe compartments (e.g. "No input available") get the full metamodel.
+
+    Args:
+        metamodel: Parsed metamodel.json or compartmental_metamodel.json
+        user_input: The model's user input text
+
+    Returns:
+        dict: A copy of the sliced metamodel, safe to modify
+    """
+    if "compartment" not in user_input.lower():
+        return copy.deepcopy(metamodel)
+
+    features = detect_features(user_input)
+    fingerprint = hashlib.sha256(json.dumps(metamodel, sort_keys=True).encode("utf-8")).hexdigest()
+    key = (fingerprint, features)
+    if key not in _slice_cache:
+        _slice_cache[key] = _build_slice(metamodel, features)
+        print(f"Metamodel slice for features: {', '.join(sorted(features))}")
+    return copy.deepcopy(_slice_cache[key])
@@ -0,0 +1,317 @@
+"""
+Local stand-in for the OpenAI chat-completions API, for load testing.
+
+Serves `POST /v1/chat/completions` (streaming and non-streaming) with canned
+responses taken from the old run logs, so runChatGPT.py can be stress-tested
+for concurrency, rate limiting and retries with no network:
+
+    python mock_llm_server.py --latency 2 --tokens-per-second 80 --error-rate 0.1
+
+then set `OPENAI_BASE_URL = "http://127.0.0.1:8000/v1"` in runChatGPT.py.
+
+The stage of a request is recognised from its prompt (LLM1, LLM2 or Stage 3)
+and, where possible, the disease from the user input; a matching LLM1/LLM2
+response is picked from the `old_prompt_*` logs and Stage 3 gets one of the
+saved simulation scripts. Requests with a JSON-schema `response_format`
+(OUTPUT_FORMAT = "json") get the canned XML converted to the compact JSON
+model. With `--error-rate` a random share of requests fail
+with 429 (with Retry-After), 500 or 503, like the real API does under load.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import run_artifacts
+import seir_json
+import seir_xml
+
+
+SECTION_SEPARATOR = re.compile(r"^\*{80}$", re.MULTILINE)
+RESPONSE_HEADERS = {
+    "LLM1 RESPONSE:": "llm1",
+    "LLM2'S RESPONSE:": "llm2",
+    "LLM2 RESPONSE:": "llm2",
+}
+# Run record (run_artifacts) field -> stage
+RECORD_FIELDS = {"llm1_response": "llm1", "llm2_response": "llm2"}
+# Disease mentioned in a prompt -> word in the names of the logs for that model
+DISEASES = {"covid": "covid", "hiv": "hiv", "malaria": "malaria", "ebola": "ebola", "sir model": "simple"}
+ERROR_STATUSES = {
+    429: ("rate_limit_error", "Rate limit reached for requests (mock)"),
+    500: ("server_error", "The server had an error while processing your request (mock)"),
+    503: ("server_error", "The engine is currently overloaded, please try again later (mock)"),
+}
+
+
+def load_canned_responses(log_patterns: list, script_dir: str = "simulation_scripts") -> dict:
+    """
+    Collect canned responses from old run logs and saved simulation scripts.
+
+    Args:
+        log_patterns: Glob patterns of run logs or run records (.run.zip) written by generate_seirmodel
+        script_dir: Folder of generated simulation scripts used for Stage 3
+
+    Returns:
+        dict: stage ("llm1", "llm2", "stage3") -> list of (source name, response text)
+    """
+    canned = {"llm1": [], "llm2": [], "stage3": []}
+    for pattern in log_patterns:
+        for path in sorted(glob.glob(pattern)):
+            name = os.path.basename(path).lower()
+            if path.endswith(".run.zip"):
+                for field, stage in RECORD_FIELDS.items():
+                    try:
+                        canned[stage].append((name, run_artifacts.read_field(path, field).strip()))
+                    except KeyError:
+                        pass
+                continue
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                sections = SECTION_SEPARATOR.split(f.read())
+            for section in sections:
+                section = section.strip("\n")
+                for header, stage in RESPONSE_HEADERS.items():
+                    if section.startswith(header) and section[len(header):].strip():
+                        canned[stage].append((name, section[len(header):].strip()))
+
+    for path in sorted(glob.glob(os.path.join(script_dir, "*.py"))):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            canned["stage3"].append((os.path.basename(path).lower(), f"```python\n{f.read().strip()}\n```"))
+    return canned
+
+
+def detect_stage(prompt: str) -> str:
+    """Tell which pipeline stage a prompt belongs to."""
+    if "ODE_EQUATIONS:" in prompt:
+        return "stage3"
+    if "STRUCTURALLY CORRECT SEIRMODEL FILE" in prompt:
+        return "llm2"
+    return "llm1"
+
+
+def as_json_model(text: str) -> str:
+    """Convert a canned XML response to the compact JSON model, or return it unchanged if it holds no usable XML."""
+    xml_text = seir_xml.extract_xml(text)
+    if not xml_text:
+        return text
+    try:
+        return seir_json.to_json(seir_json.from_xml(xml_text))
+    except ET.ParseError:
+        return text
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class MockState:
+    """Server settings, canned responses and request counters shared by all handler threads."""
+
+    def __init__(self, canned: dict, latency: float, jitter: float, tokens_per_second: float, error_rate: float, seed: int = None):
+        self.canned = canned
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+
+    def pick_response(self, prompt: str) -> str:
+        """Pick a canned response for the prompt's stage, preferring logs of the same disease."""
+        candidates = self.canned.get(detect_stage(prompt)) or [
+            ("", "ERROR: mock server has no canned response for this stage")
+        ]
+        text = prompt.lower()
+        mentions = {disease: text.count(disease) for disease in DISEASES}
+        disease = max(mentions, key=mentions.get)
+        matching = [c for c in candidates if DISEASES[disease] in c[0]] if mentions[disease] else []
+        with self.lock:
+            return self.random.choice(matching or candidates)[1]
+
+    def draw_error(self):
+        """Return an HTTP status to fail this request with, or None."""
+        with self.lock:
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return self.random.choice(list(ERROR_STATUSES))
+        return None
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Handles OpenAI-style chat-completion requests."""
+
+    state = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # The summary line per request is printed in do_POST
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Request body is not JSON", "type": "invalid_request_error"}})
+            return
+
+        state = self.state
+        with state.lock:
+            state.requests += 1
+            state.active += 1
+            state.peak_active = max(state.peak_active, state.active)
+            number = state.requests
+        start = time.monotonic()
+        try:
+            status = self.respond(request)
+        finally:
+            with state.lock:
+                state.active -= 1
+        print(
+            f"#{number} {request.get('model', '?')} stream={bool(request.get('stream'))} -> {status} "
+            f"in {time.monotonic() - start:.2f}s (active {state.active}, peak {state.peak_active}, errors {state.errors})"
+        )
+
+    def respond(self, request: dict) -> int:
+        state = self.state
+        prompt = "\n".join(
+            message.get("content", "") if isinstance(message.get("content"), str) else json.dumps(message.get("content"))
+            for message in request.get("messages", [])
+        )
+        model = request.get("model", "mock")
+
+        time.sleep(state.delay())
+        status = state.draw_error()
+        if status:
+            error_type, message = ERROR_STATUSES[status]
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self.send_json(status, {"error": {"message": message, "type": error_type, "code": status}}, headers)
+            return status
+
+        text = state.pick_response(prompt)
+        if (request.get("response_format") or {}).get("type") == "json_schema":
+            text = as_json_model(text)
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        if request.get("stream"):
+            self.stream(text, completion_id, created, model)
+            return 200
+
+        if state.tokens_per_second > 0:
+            time.sleep(estimate_tokens(text) / state.tokens_per_second)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        self.send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+        return 200
+
+    def stream(self, text: str, completion_id: str, created: int, model: str, chunk_chars: int = 16):
+        """Send the response as server-sent events, paced at the configured token rate."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta: dict, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        pause = estimate_tokens("x" * chunk_chars) / self.state.tokens_per_second if self.state.tokens_per_second > 0 else 0
+        try:
+            event({"role": "assistant", "content": ""})
+            for i in range(0, len(text), chunk_chars):
+                event({"content": text[i:i + chunk_chars]})
+                if pause:
+                    time.sleep(pause)
+            event({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading (e.g. early stop at the closing tag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server with canned SEIR pipeline responses.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Random +/- seconds added to the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="Generation speed (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 429/500/503")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    parser.add_argument("--logs", nargs="+", default=["old_prompt_*/*.txt", "*prompt_sample/*.run.zip"],
+                        help="Glob patterns of run logs or run records to take responses from")
+    parser.add_argument("--scripts", default="simulation_scripts", help="Folder of simulation scripts used for Stage 3")
+    args = parser.parse_args()
+
+    canned = load_canned_responses(args.logs, args.scripts)
+    print("Canned responses: " + ", ".join(f"{stage}={len(responses)}" for stage, responses in canned.items()))
+
+    MockHandler.state = MockState(canned, args.latency, args.jitter, args.tokens_per_second, args.error_rate, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Mock chat-completions server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state = MockHandler.state
+        print(f"Served {state.requests} requests ({state.errors} injected errors, peak concurrency {state.peak_active})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Per-stage model routing with fallbacks, shared by the runner scripts.
+
+Stage 1 structural drafting and Stage 3A skeleton filling are much easier
+than Stage 2 numeric refinement, so every stage can go to its own model. A
+runner's STAGE_ROUTES maps each stage to "backend:model" targets, tried in
+order:
+
+    STAGE_ROUTES = {
+        "LLM1": ["gemini:gemini-2.5-flash", "gemini:gemini-2.5-pro"],
+        "LLM2": ["gemini:gemini-2.5-pro", "chatgpt:gpt-4o"],
+        "LLM3A": ["gemini:gemini-2.5-flash", "gemini:gemini-2.5-pro"],
+        "LLM3B": ["gemini:gemini-2.5-pro"],
+    }
+
+`Router.call` sends a prompt to the stage's first target and falls back to the
+next one whenever a target answers "ERROR: ..." (after that backend's own rate
+limiting and retries). The backends are the runners' call functions, which
+each runner registers with `register_backend` when it is imported. A target
+on another backend imports that runner on first use; importing a runner is
+cheap because it loads its configuration and SDK lazily. Every backend takes
+the same arguments (prompt, model, log_path, label, bypass, schema, image)
+and ignores what it cannot use, plus options only it understands (e.g.
+llama.cpp prefix caching).
+
+Hedged stages race their targets instead: the first target starts at once,
+and whenever `hedge_delay` seconds pass without a usable answer (or a target
+fails) the next one is started too. The first response that passes local
+validation wins and the others are cancelled: targets not yet started are
+never sent, and streaming requests stop at their next chunk. Every target but
+a race's first is a hedge, and hedges are paid from a `CostCap` token budget,
+so a slow provider costs at most the configured number of extra prompt tokens
+per run.
+"""
+import importlib
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import prompt_compaction
+import seir_validator
+import streaming
+
+
+STAGES = ("LLM1", "LLM2", "LLM3A", "LLM3B")
+
+# Backend name -> runner module that registers it
+BACKEND_MODULES = {
+    "gemini": "runGemini",
+    "chatgpt": "runChatGPT",
+    "llama_cpp": "runGPT",
+}
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def register_backend(name: str, call):
+    """
+    Make a runner's call function available to routes.
+
+    Args:
+        name: Backend name used in targets, e.g. "gemini"
+        call: Function (prompt, model, log_path=None, label="", bypass=False, schema=None, image=None, **options) -> str
+    """
+    _backends[name] = call
+
+
+def get_backend(name: str):
+    """Return a backend's call function, importing the runner that provides it on first use."""
+    with _lock:
+        if name not in _backends:
+            if name not in BACKEND_MODULES:
+                raise KeyError(f"Unknown backend '{name}' (choose from {', '.join(BACKEND_MODULES)})")
+            importlib.import_module(BACKEND_MODULES[name])
+        return _backends[name]
+
+
+def parse_target(target: str) -> tuple:
+    """Split a "backend:model" target into (backend, model)."""
+    backend, separator, model = target.partition(":")
+    if not separator or not backend or not model:
+        raise ValueError(f"Route target must look like 'backend:model', not '{target}'")
+    if backend not in BACKEND_MODULES:
+        raise ValueError(f"Unknown backend '{backend}' in route target '{target}'")
+    return backend, model
+
+
+class CostCap:
+    """
+    Thread-safe budget of prompt tokens that hedge requests may send.
+
+    Args:
+        max_tokens: Tokens available for the whole run (None for no cap)
+    """
+
+    def __init__(self, max_tokens: int = None):
+        self.max_tokens = max_tokens
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def spend(self, tokens: int) -> bool:
+        """Take `tokens` from the budget; returns False (and takes nothing) if they do not fit."""
+        with self._lock:
+            if self.max_tokens is not None and self.spent + tokens > self.max_tokens:
+                return False
+            self.spent += tokens
+            return True
+
+
+def _call_target(backend: str, model: str, prompt: str, options: dict, kwargs: dict) -> str:
+    try:
+        call = get_backend(backend)
+    except (KeyError, ImportError) as err:
+        return f"ERROR: Backend '{backend}' is not available: {err}"
+    return call(prompt, model, **kwargs, **(options or {}).get(backend, {}))
+
+
+class Router:
+    """
+    Sends each stage's prompts along its route.
+
+    Args:
+        routes: Stage -> list of "backend:model" targets, tried in order
+        hedged: Stages whose targets are raced instead of tried one after another
+        hedge_delay: Seconds a hedged stage waits for a usable answer before starting its next target
+        cost_cap: CostCap paying for hedge requests (None for no cap)
+    """
+
+    def __init__(self, routes: dict, hedged: tuple = (), hedge_delay: float = 5.0, cost_cap: CostCap = None):
+        missing = [stage for stage in STAGES if not routes.get(stage)]
+        if missing:
+            raise ValueError(f"No route for stage {', '.join(missing)}")
+        unknown = [stage for stage in hedged if stage not in STAGES]
+        if unknown:
+            raise ValueError(f"Cannot hedge unknown stage {', '.join(unknown)}")
+        self.routes = {stage: [parse_target(target) for target in targets] for stage, targets in routes.items()}
+        self.hedged = set(hedged)
+        self.hedge_delay = hedge_delay
+        self.cost_cap = cost_cap or CostCap()
+
+    def primary(self, stage: str) -> tuple:
+        """Return the (backend, model) a stage tries first."""
+        return self.routes[stage][0]
+
+    def uses(self, backend: str) -> bool:
+        """Return whether any stage's route goes to a backend (e.g. to decide whether its API key is needed)."""
+        return any(target_backend == backend for targets in self.routes.values() for target_backend, _ in targets)
+
+    def describe(self, stage: str) -> str:
+        """Return a stage's route as "backend:model -> backend:model"."""
+        return " -> ".join(f"{backend}:{model}" for backend, model in self.routes[stage])
+
+    def call(self, stage: str, prompt: str, options: dict = None, validate=None, **kwargs) -> str:
+        """
+        Send a prompt to the stage's targets in order until one does not answer with an error.
+
+        Hedged stages race their targets instead (see `race`).
+
+        Args:
+            stage: "LLM1", "LLM2", "LLM3A" or "LLM3B"
+            prompt: The input prompt
+            options: Backend name -> keyword arguments only that backend takes
+            validate: Function returning the seir_validator issues of a response (hedged stages only)
+            **kwargs: log_path, label, bypass, schema and image, passed to every backend
+
+        Returns:
+            str: The first successful response, or the last target's "ERROR: ..." message
+        """
+        if stage in self.hedged and len(self.routes[stage]) > 1:
+            return self.race(stage, prompt, validate, options, **kwargs)
+
+        targets = self.routes[stage]
+        response = f"ERROR: No route for stage {stage}"
+        for position, (backend, model) in enumerate(targets):
+            response = _call_target(backend, model, prompt, options, kwargs)
+            if not response.startswith("ERROR:"):
+                return response
+            if position + 1 < len(targets):
+                next_backend, next_model = targets[position + 1]
+                print(
+                    f"{stage}: {backend}:{model} failed ({response[:120]}); "
+                    f"falling back to {next_backend}:{next_model}"
+                )
+        return response
+
+    def race(self, stage: str, prompt: str, validate=None, options: dict = None, **kwargs) -> str:
+        """
+        Send a prompt to the stage's targets as hedged requests and return the first valid response.
+
+        Target i + 1 starts `hedge_delay` seconds after target i, or as soon as a target fails or answers
+        with validation issues. A target started while others are still running is a hedge; hedges whose
+        prompt tokens do not fit the cost cap are not sent.
+
+        Args:
+            stage: "LLM1", "LLM2", "LLM3A" or "LLM3B"
+            prompt: The input prompt
+            validate: Function returning the seir_validator issues of a response; None accepts any response
+            options: Backend name -> keyword arguments only that backend takes
+            **kwargs: log_path, label, bypass, schema and image, passed to every backend
+
+        Returns:
+            str: The first response without validation issues, else the best-scoring one, else the first error
+        """
+        targets = self.routes[stage]
+        prompt_tokens = prompt_compaction.count_tokens(prompt)
+        cancel = threading.Event()
+
+        def run(backend, model):
+            streaming.set_cancel_event(cancel)
+            try:
+                return _call_target(backend, model, prompt, options, kwargs)
+            finally:
+                streaming.set_cancel_event(None)
+
+        best, best_score, first_error = None, None, None
+        executor = ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="hedge")
+        pending = {}
+        next_target = 0
+        try:
+            while True:
+                if next_target < len(targets) and (not pending or self._hedge(stage, prompt_tokens)):
+                    backend, model = targets[next_target]
+                    if next_target:
+                        print(f"{stage}: {'hedging with' if pending else 'falling back to'} {backend}:{model}")
+                    pending[executor.submit(run, backend, model)] = f"{backend}:{model}"
+                    next_target += 1
+                elif not pending:
+                    break
+                else:
+                    # Over the cost cap: wait for the requests already sent
+                    next_target = len(targets)
+
+                more = next_target < len(targets)
+                done, _ = wait(pending, timeout=self.hedge_delay if more else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    target = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as err:
+                        response = f"ERROR: {err}"
+                    if response.startswith("ERROR:"):
+                        print(f"{stage}: {target} failed ({response[:120]})")
+                        first_error = first_error or response
+                        continue
+                    issues = validate(response) if validate else []
+                    score = seir_validator.score(issues)
+                    if best_score is None or score > best_score:
+                        best, best_score = response, score
+                    if not issues:
+                        print(f"{stage}: {target} gave the first valid response; cancelling the others")
+                        return response
+                    print(f"{stage}: {target} answered with {len(issues)} validation issue(s)")
+        finally:
+            cancel.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return best if best is not None else first_error
+
+    def _hedge(self, stage: str, prompt_tokens: int) -> bool:
+        """Pay a hedge request's prompt tokens from the cost cap."""
+        if self.cost_cap.spend(prompt_tokens):
+            return True
+        print(f"{stage}: hedge skipped, {prompt_tokens} prompt tokens would exceed the cost cap")
+        return False
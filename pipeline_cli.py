@@ -0,0 +1,127 @@
+"""
+Command-line entry point shared by the runner scripts.
+
+    python runGemini.py --models hiv covid --simulations hiv
+    python runGPT.py --models all --simulations none
+    python runChatGPT.py --models ebola --prompt LLM1=smart_LLM1_PROMPT --dry-run
+
+Importing a runner does no work: prompts.json, models.json, ode.json and
+simulation_skeleton.txt are read the first time they are needed, and the API
+SDKs are imported and given their keys when the first request is sent.
+`load_jobs` reads an input file only when at least one of its entries was
+selected, so e.g. a run without simulations never opens ode.json.
+"""
+import argparse
+
+
+# Model name -> (label, models.json key, output file name)
+MODELS = {
+    "hiv": ("HIV", "smartHIVInput", "finalHivModel.txt"),
+    "covid": ("COVID", "smartCovidInput", "finalCovidModel.txt"),
+    "simple": ("Simple SIR", "smartSIRInput", "finalSimpleModel.txt"),
+    "malaria": ("Malaria", "smartMalariaInput", "finalMalariaModel.txt"),
+    "ebola": ("Ebola", "smartEbolaInput", "finalEbolaModel.txt"),
+}
+
+# Simulation name -> (label, ode.json key, output file name)
+SIMULATIONS = {
+    "hiv": ("HIV", "hivModel", "hiv_simulation.py"),
+    "covid": ("COVID", "covidModel", "covid_simulation.py"),
+    "simple": ("Simple SIR", "simpleModel", "simple_simulation.py"),
+    "malaria": ("Malaria", "malariaModel", "malaria_simulation.py"),
+}
+
+
+def _names(values: list, registry: dict) -> list:
+    """Expand "all"/"none" and drop duplicates, keeping the order given."""
+    if values == ["none"]:
+        return []
+    if "all" in values:
+        return list(registry)
+    return list(dict.fromkeys(values))
+
+
+def _prompt_override(text: str) -> tuple:
+    stage, separator, key = text.partition("=")
+    if not separator or not stage or not key:
+        raise argparse.ArgumentTypeError(f"expected STAGE=KEY, got '{text}'")
+    return stage, key
+
+
+def parse_args(
+    argv: list,
+    description: str,
+    default_models: list,
+    default_simulations: list,
+    prompt_keys: dict
+) -> argparse.Namespace:
+    """
+    Parse a runner's command line.
+
+    Args:
+        argv: Arguments without the program name (None for sys.argv)
+        description: Help text naming the backend
+        default_models: Models generated when --models is not given
+        default_simulations: Simulations generated when --simulations is not given
+        prompt_keys: The runner's stage -> prompts.json key table, for --prompt
+
+    Returns:
+        argparse.Namespace: models, simulations, prompts (stage -> key overrides), fresh and dry_run
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--models", nargs="+", default=default_models, choices=list(MODELS) + ["all", "none"], metavar="MODEL",
+        help=f"SEIR models to generate: {', '.join(MODELS)}, all or none (default: {' '.join(default_models) or 'none'})"
+    )
+    parser.add_argument(
+        "--simulations", nargs="+", default=default_simulations, choices=list(SIMULATIONS) + ["all", "none"],
+        metavar="MODEL",
+        help=f"Simulations to generate: {', '.join(SIMULATIONS)}, all or none "
+             f"(default: {' '.join(default_simulations) or 'none'})"
+    )
+    parser.add_argument(
+        "--prompt", action="append", default=[], type=_prompt_override, metavar="STAGE=KEY",
+        help=f"Use another prompts.json entry for a stage ({', '.join(prompt_keys)}); may be repeated"
+    )
+    parser.add_argument(
+        "--fresh", action="store_true",
+        help="Run every stage again instead of resuming from checkpoints (new outputs are still checkpointed)"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Print the jobs and prompt keys that would run, without contacting a backend"
+    )
+    args = parser.parse_args(argv)
+
+    args.models = _names(args.models, MODELS)
+    args.simulations = _names(args.simulations, SIMULATIONS)
+    args.prompts = dict(args.prompt)
+    unknown = [stage for stage in args.prompts if stage not in prompt_keys]
+    if unknown:
+        parser.error(f"unknown prompt stage {', '.join(unknown)} (choose from {', '.join(prompt_keys)})")
+    return args
+
+
+def load_jobs(names: list, registry: dict, load_inputs) -> list:
+    """
+    Build pipeline_runner jobs for the selected names.
+
+    Args:
+        names: Selected keys of `registry`
+        registry: MODELS or SIMULATIONS
+        load_inputs: Zero-argument function returning the parsed input file; only called if `names` is not empty
+
+    Returns:
+        list: (label, input text, output file name) tuples
+    """
+    if not names:
+        return []
+    inputs = load_inputs()
+    return [(registry[name][0], inputs[registry[name][1]], registry[name][2]) for name in names]
+
+
+def print_plan(seir_jobs: list, simulation_jobs: list, prompt_keys: dict):
+    """Print what a run would do (--dry-run)."""
+    print("SEIR models:  " + (", ".join(f"{label} -> {output}" for label, _, output in seir_jobs) or "none"))
+    print("Simulations:  " + (", ".join(f"{label} -> {output}" for label, _, output in simulation_jobs) or "none"))
+    print("Prompt keys:  " + ", ".join(f"{stage}={key}" for stage, key in prompt_keys.items()))
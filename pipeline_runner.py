@@ -0,0 +1,148 @@
+"""
+Batch runners for the SEIR model and simulation chains.
+
+`run_sequentially` is the original behaviour of the runner scripts: one chain
+after another with a fixed pause in between. `run_concurrently` starts every
+LLM1 -> LLM2 chain and every 3A -> 3B chain at once on an asyncio event loop,
+bounded by a per-backend concurrency limit, so a batch takes roughly as long
+as its slowest chain.
+
+A job is a (label, input text, output file name) tuple, e.g.
+("HIV", hivModel, "finalHivModel.txt") or ("HIV", hiv_ode, "hiv_simulation.py").
+
+A simulation only needs the model's ODEs, not the XML its SEIR chain
+produces, so the two chains of a model are independent. Both runners order
+jobs by model (`group_by_model`): HIV model, HIV simulation, COVID model, ...
+When the concurrency limit is lower than the number of chains, a model's
+simulation chain is therefore admitted together with its SEIR chain instead
+of waiting behind every other model, and each model is done after about the
+longer of its two chains.
+"""
+import asyncio
+import time
+
+
+def print_banner(message: str):
+    print("\n" + "=" * 80)
+    print(message)
+    print("=" * 80)
+
+
+def group_by_model(generate_fn, simulate_fn, seir_jobs: list, simulation_jobs: list) -> list:
+    """
+    Pair every model's SEIR and simulation jobs.
+
+    Returns:
+        list: (label, chains) in the order labels first appear, where chains is a list of (kind, fn, job)
+    """
+    groups = {}
+    for kind, fn, jobs in (("Model", generate_fn, seir_jobs), ("Simulation", simulate_fn, simulation_jobs)):
+        for job in jobs:
+            groups.setdefault(job[0], []).append((kind, fn, job))
+    return list(groups.items())
+
+
+def run_sequentially(
+    generate_fn,
+    simulate_fn,
+    seir_jobs: list,
+    simulation_jobs: list,
+    break_time: float = 0
+) -> dict:
+    """
+    Run every job one after another, model by model, pausing `break_time` seconds between jobs.
+
+    Args:
+        generate_fn: The runner's generate_seirmodel(user_input, output_fileName)
+        simulate_fn: The runner's simulate(ode_equations, output_fileName)
+        seir_jobs: (label, user input, output file name) tuples for SEIR models
+        simulation_jobs: (label, ODE equations, output file name) tuples for simulations
+        break_time: Seconds to sleep between jobs
+
+    Returns:
+        dict: Output file name -> result message of the job
+    """
+    results = {}
+    groups = group_by_model(generate_fn, simulate_fn, seir_jobs, simulation_jobs)
+    jobs = [chain for _, chains in groups for chain in chains]
+    for position, (kind, fn, (label, text, output_fileName)) in enumerate(jobs):
+        if position and break_time:
+            time.sleep(break_time)
+        print_banner(f"Generating {label} {kind}...")
+        results[output_fileName] = fn(text, output_fileName)
+    return results
+
+
+async def run_job(semaphore: asyncio.Semaphore, kind: str, fn, job: tuple) -> str:
+    """Run one blocking chain in a worker thread once the semaphore admits it."""
+    label, text, output_fileName = job
+    async with semaphore:
+        print(f"[{label} {kind}] started")
+        start = time.monotonic()
+        result = await asyncio.to_thread(fn, text, output_fileName)
+        print(f"[{label} {kind}] finished in {time.monotonic() - start:.1f}s")
+        return result
+
+
+async def run_model(semaphore: asyncio.Semaphore, label: str, chains: list) -> list:
+    """Run a model's chains side by side and report when the last one finished."""
+    start = time.monotonic()
+    outcomes = await asyncio.gather(
+        *(run_job(semaphore, kind, fn, job) for kind, fn, job in chains), return_exceptions=True
+    )
+    if len(chains) > 1:
+        print(f"[{label}] all {len(chains)} chains finished in {time.monotonic() - start:.1f}s")
+    return outcomes
+
+
+async def gather_jobs(
+    generate_fn,
+    simulate_fn,
+    seir_jobs: list,
+    simulation_jobs: list,
+    max_concurrency: int
+) -> dict:
+    # The semaphore admits waiting chains first come, first served, and the chains are
+    # created model by model, so a model's two chains are admitted one after the other
+    semaphore = asyncio.Semaphore(max_concurrency)
+    groups = group_by_model(generate_fn, simulate_fn, seir_jobs, simulation_jobs)
+    outcomes = await asyncio.gather(*(run_model(semaphore, label, chains) for label, chains in groups))
+
+    results = {}
+    for (_, chains), model_outcomes in zip(groups, outcomes):
+        for (_, _, job), outcome in zip(chains, model_outcomes):
+            results[job[2]] = f"ERROR: {outcome}" if isinstance(outcome, Exception) else outcome
+    return results
+
+
+def run_concurrently(
+    generate_fn,
+    simulate_fn,
+    seir_jobs: list,
+    simulation_jobs: list,
+    max_concurrency: int = 4
+) -> dict:
+    """
+    Run every SEIR and simulation chain concurrently.
+
+    Each chain still runs its own stages in order (LLM1 -> LLM2, 3A -> 3B);
+    at most `max_concurrency` chains are in flight at once, which is the
+    backend's concurrency limit. Chains are admitted model by model, a
+    model's simulation chain right after its SEIR chain.
+
+    Args:
+        generate_fn: The runner's generate_seirmodel(user_input, output_fileName)
+        simulate_fn: The runner's simulate(ode_equations, output_fileName)
+        seir_jobs: (label, user input, output file name) tuples for SEIR models
+        simulation_jobs: (label, ODE equations, output file name) tuples for simulations
+        max_concurrency: Maximum number of chains running at the same time
+
+    Returns:
+        dict: Output file name -> result message of the job
+    """
+    start = time.monotonic()
+    results = asyncio.run(
+        gather_jobs(generate_fn, simulate_fn, seir_jobs, simulation_jobs, max_concurrency)
+    )
+    print(f"All {len(results)} chains finished in {time.monotonic() - start:.1f}s")
+    return results
@@ -0,0 +1,103 @@
+"""
+Prompt compaction for the metamodel block of the LLM1 prompt.
+
+The runners used to paste the metamodel into every LLM1 prompt as
+`json.dumps(..., indent=2)`, which alone nearly fills an 8192-token context.
+`compact_metamodel_text` minifies the JSON and drops the sections the model
+does not need for the given user input:
+
+* `best_practices` - modelling advice, not part of the XML format
+* `unicode_reference` - only kept for parametric inputs that ask for symbols
+  but do not already spell them out
+* `examples` lists of sample attribute values (XML snippet examples are kept)
+
+Token counts before and after are printed so prompt sizes can be tracked.
+"""
+import copy
+import json
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken if it is installed, otherwise estimate four characters per token."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
+
+
+def needs_unicode_reference(user_input: str) -> bool:
+    """Return True if the input asks for parametric symbols without spelling out any non-ASCII symbol itself."""
+    text = user_input.lower()
+    wants_symbols = "parametric" in text or "greek" in text
+    return wants_symbols and all(ord(ch) < 128 for ch in user_input)
+
+
+def _is_xml_snippet_examples(value) -> bool:
+    return isinstance(value, dict) and all(
+        isinstance(v, str) and v.lstrip().startswith("<") for v in value.values()
+    )
+
+
+def _drop_examples(node):
+    """Recursively remove `examples` entries that are not XML snippets."""
+    if isinstance(node, dict):
+        for key in list(node):
+            if key == "examples" and not _is_xml_snippet_examples(node[key]):
+                del node[key]
+            else:
+                _drop_examples(node[key])
+    elif isinstance(node, list):
+        for item in node:
+            _drop_examples(item)
+
+
+def compact_metamodel(metamodel: dict, user_input: str = "") -> dict:
+    """
+    Return a copy of the metamodel without the sections this user input does not need.
+
+    Args:
+        metamodel: Parsed metamodel.json or compartmental_metamodel.json
+        user_input: The model's user input text
+
+    Returns:
+        dict: The reduced metamodel
+    """
+    compacted = copy.deepcopy(metamodel)
+    # Both metamodel files wrap everything in a single top-level key
+    for body in compacted.values():
+        if not isinstance(body, dict):
+            continue
+        body.pop("best_practices", None)
+        if not needs_unicode_reference(user_input):
+            body.pop("unicode_reference", None)
+        _drop_examples(body)
+    return compacted
+
+
+def minify(metamodel: dict) -> str:
+    """Serialize JSON without indentation or spaces after separators."""
+    return json.dumps(metamodel, separators=(",", ":"), ensure_ascii=False)
+
+
+def compact_metamodel_text(metamodel: dict, user_input: str = "", label: str = "Metamodel") -> str:
+    """
+    Build the compacted, minified metamodel block and report its token savings.
+
+    Args:
+        metamodel: Parsed metamodel JSON
+        user_input: The model's user input text
+        label: Name used in the printed report
+
+    Returns:
+        str: The metamodel block for the LLM1 prompt
+    """
+    original = json.dumps(metamodel, indent=2)
+    compacted = minify(compact_metamodel(metamodel, user_input))
+    before, after = count_tokens(original), count_tokens(compacted)
+    print(f"{label} block: {before:,} -> {after:,} tokens ({(before - after) / before:.0%} smaller)")
+    return compacted
@@ -0,0 +1,207 @@
+"""
+Adaptive rate limiting and retries for the API backends.
+
+Each backend gets a RateLimiter with two token buckets, one for requests per
+minute and one for (estimated) prompt tokens per minute. A call waits only as
+long as the buckets require, instead of a fixed pause between models. When the
+API still answers with a rate-limit or quota error the limiter halves its rate
+and the stage is retried on its own with exponential backoff and full jitter;
+successful calls slowly restore the configured rate.
+"""
+import random
+import re
+import threading
+import time
+
+
+# Exception types of the OpenAI and Google API clients (and httpx/stdlib network errors) worth retrying
+RATE_LIMIT_ERRORS = ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+RETRYABLE_ERRORS = RATE_LIMIT_ERRORS + (
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "BadGateway",
+    "GatewayTimeout",
+    "DeadlineExceeded",
+    "ServerError",
+    "ConnectError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "RemoteProtocolError",
+    "TimeoutError",
+    "ConnectionError",
+)
+RATE_LIMIT_STATUS = (429,)
+RETRYABLE_STATUS = (408, 429) + tuple(range(500, 600))  # timeout, too many requests, any server error
+
+# "ERROR: <Type>: <message>", as written by error_message
+ERROR_TYPE = re.compile(r"^ERROR: (\w+): ")
+# An HTTP status where the API clients put it: leading the message ("429 Resource has been exhausted"),
+# after "Error code:" (OpenAI) or after "status"/"HTTP"; a bare number elsewhere in the text does not count
+STATUS_CODE = re.compile(r"(?:^ERROR: (?:\w+: )?|\berror code:? |\bstatus(?: code)?[:=]? ?|\bHTTP )(\d{3})\b", re.IGNORECASE)
+
+
+def error_message(err: Exception) -> str:
+    """Format a failed backend call as "ERROR: <exception type>: <message>", which is_retryable classifies."""
+    return f"ERROR: {type(err).__name__}: {err}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text and XML)."""
+    return max(1, len(text) // 4)
+
+
+def _classify(response: str) -> tuple:
+    """Return the (exception type, HTTP status) an "ERROR: ..." response reports; either may be None."""
+    error_type = ERROR_TYPE.match(response)
+    status = STATUS_CODE.search(response)
+    return (error_type.group(1) if error_type else None, int(status.group(1)) if status else None)
+
+
+def is_retryable(response: str) -> bool:
+    """Return True if an "ERROR: ..." response is transient: a rate limit, quota, 5xx status or network error."""
+    if not response.startswith("ERROR:"):
+        return False
+    error_type, status = _classify(response)
+    return error_type in RETRYABLE_ERRORS or status in RETRYABLE_STATUS
+
+
+def is_rate_limit(response: str) -> bool:
+    """Return True if an "ERROR: ..." response is a rate-limit or quota error (the limiter should slow down)."""
+    if not response.startswith("ERROR:"):
+        return False
+    error_type, status = _classify(response)
+    return error_type in RATE_LIMIT_ERRORS or status in RATE_LIMIT_STATUS
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    A request larger than the bucket waits for a full bucket and then drives
+    the level negative, so oversized prompts are delayed rather than blocked forever.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_minute = float(rate_per_minute)
+        self.level = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate_per_minute / 60)
+        self.updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Block until `amount` tokens are available and take them.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.level >= needed:
+                    self.level -= amount
+                    return waited
+                delay = (needed - self.level) * 60 / self.rate_per_minute
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits for one backend, adapting to rate-limit errors.
+
+    Args:
+        requests_per_minute: Configured request rate
+        tokens_per_minute: Configured prompt-token rate
+        min_fraction: Lowest fraction of the configured rate the limiter backs off to
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, min_fraction: float = 0.1):
+        self.max_requests_per_minute = requests_per_minute
+        self.max_tokens_per_minute = tokens_per_minute
+        self.min_fraction = min_fraction
+        self.fraction = 1.0
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+
+    def acquire(self, prompt_tokens: int) -> float:
+        """Wait for one request slot and `prompt_tokens` tokens; return the seconds waited."""
+        return self.requests.acquire(1) + self.tokens.acquire(prompt_tokens)
+
+    def _set_fraction(self, fraction: float):
+        self.fraction = min(1.0, max(self.min_fraction, fraction))
+        self.requests.rate_per_minute = self.max_requests_per_minute * self.fraction
+        self.tokens.rate_per_minute = self.max_tokens_per_minute * self.fraction
+
+    def penalize(self):
+        """Halve the effective rate after a rate-limit or quota error."""
+        with self._lock:
+            self._set_fraction(self.fraction / 2)
+            print(f"Rate limit hit, reducing rate to {self.fraction:.0%} of the configured limit")
+
+    def reward(self):
+        """Recover 10% of the configured rate after a successful call."""
+        with self._lock:
+            if self.fraction < 1.0:
+                self._set_fraction(self.fraction + 0.1)
+
+
+def call_with_retry(
+    generate,
+    prompt: str,
+    limiter: RateLimiter = None,
+    max_retries: int = 5,
+    base_delay: float = 2.0,
+    max_delay: float = 120.0,
+    label: str = ""
+) -> str:
+    """
+    Call a backend under the rate limiter, retrying transient errors with backoff.
+
+    Args:
+        generate: Zero-argument function performing one backend call and returning its text or "ERROR: ..."
+        prompt: The prompt being sent (used to estimate its token cost)
+        limiter: Rate limiter of the backend, or None for no limiting
+        max_retries: Retries after the first attempt before the error is returned
+        base_delay: Backoff delay in seconds before the first retry
+        max_delay: Upper bound of the backoff delay
+        label: Stage name used in log messages
+
+    Returns:
+        str: Generated text, or the last "ERROR: ..." message
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    for attempt in range(max_retries + 1):
+        if limiter:
+            waited = limiter.acquire(prompt_tokens)
+            if waited >= 1:
+                print(f"{label or 'Request'}: waited {waited:.1f}s for rate limiter")
+
+        response = generate()
+        if not response.startswith("ERROR:"):
+            if limiter:
+                limiter.reward()
+            return response
+        if not is_retryable(response) or attempt == max_retries:
+            return response
+
+        if limiter and is_rate_limit(response):
+            limiter.penalize()
+        # Full jitter: sleep a random time up to the exponential backoff ceiling
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        print(
+            f"{label or 'Request'} failed ({response[:120]}), "
+            f"retry {attempt + 1}/{max_retries} in {delay:.1f}s"
+        )
+        time.sleep(delay)
+    return response
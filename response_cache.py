@@ -0,0 +1,173 @@
+"""
+Content-addressed on-disk cache of LLM responses.
+
+A response is stored under the SHA-256 of (backend, model name, generation
+parameters, full prompt), so re-running an experiment with unchanged prompts,
+metamodel, user input and sampling parameters does not call the backend again.
+Responses are gzip-compressed; once the cache grows past its size cap the
+least recently used entries are deleted. Error responses are never cached.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def make_key(backend: str, model_name: str, params: dict, prompt: str) -> str:
+    """
+    Hash everything that determines a response.
+
+    Args:
+        backend: Backend name, e.g. "gemini", "chatgpt" or "llama_cpp"
+        model_name: Model identifier (API model name or GGUF file)
+        params: Generation parameters that affect sampling
+        prompt: The full prompt text
+
+    Returns:
+        str: Hex digest identifying the response
+    """
+    material = json.dumps(
+        [backend, model_name, params or {}, prompt],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Gzip-compressed response files with least-recently-used eviction.
+
+    Args:
+        directory: Folder the cache files are stored in
+        max_bytes: Total compressed size above which old entries are evicted
+    """
+
+    def __init__(self, directory: str = "response_cache", max_bytes: int = 500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # running total of the entry sizes, scanned once on the first put
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt.gz")
+
+    def get(self, key: str) -> str:
+        """Return the cached response for `key`, or None. A hit marks the entry as recently used."""
+        path = self.path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                response = f.read()
+            os.utime(path)  # the modification time is the LRU timestamp
+        except (FileNotFoundError, OSError, EOFError):
+            # Also covers an entry evicted by another thread between the read and the utime
+            return None
+        return response
+
+    def put(self, key: str, response: str):
+        """Store a response, then evict old entries if the cache is over its size cap."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            f.write(response)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self.entries())
+            self._size += size - self._entry_size(path)
+            os.replace(tmp_path, path)
+            over = self._size > self.max_bytes
+        # The directory is only walked again once the running total crosses the cap
+        if over:
+            self.evict()
+
+    def delete(self, key: str):
+        """Remove an entry, if it exists."""
+        path = self.path(key)
+        with self._lock:
+            size = self._entry_size(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _entry_size(self, path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def entries(self) -> list:
+        """Return (last use time, size, path) of every cache file."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".txt.gz"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            # Rescan rather than trust the running total, which misses other processes sharing the folder
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+
+    def call(
+        self,
+        backend: str,
+        model_name: str,
+        params: dict,
+        prompt: str,
+        generate,
+        bypass: bool = False
+    ) -> str:
+        """
+        Return the cached response for this request, or generate and cache it.
+
+        Args:
+            backend: Backend name used in the cache key
+            model_name: Model identifier used in the cache key
+            params: Generation parameters used in the cache key
+            prompt: The full prompt text
+            generate: Zero-argument function calling the backend on a miss
+            bypass: Skip the lookup and always generate a fresh sample (it is still stored)
+
+        Returns:
+            str: The response, or the backend's "ERROR: ..." message
+        """
+        key = make_key(backend, model_name, params, prompt)
+        if not bypass:
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                print(f"Using cached {backend} response {key[:12]}")
+                return cached
+
+        self.misses += 1
+        response = generate()
+        if not response.startswith("ERROR:"):
+            self.put(key, response)
+        return response
@@ -1,15 +1,70 @@
 import os
-import time
-from dotenv import load_dotenv
+import functools
 import json
-from openai import OpenAI
+import time
+
+import api_clients
+import best_of_n
+import cassette
+import diagram_input
+import metamodel_slicer
+import model_routing
+import pipeline_cli
+import pipeline_runner
+import prompt_compaction
+import rate_limiter
+import response_cache
+import run_artifacts
+import self_repair
+import seir_json
+import seir_validator
+import seir_xml
+import stage_dag
+import streaming
+import xml_patch
 
 # --- Configuration ---
-BREAK_TIME = 10  # 10 seconds break between each execution
+# Adaptive rate limiting: calls wait for capacity and 429/quota/overload errors are retried per stage
+REQUESTS_PER_MINUTE = 500  # Match your OpenAI tier
+TOKENS_PER_MINUTE = 450_000
+MAX_RETRIES = 5
+# Run every model's chain concurrently instead of one after another
+ASYNC_PIPELINE = True
+# Chains in flight at once when ASYNC_PIPELINE is on
+MAX_CONCURRENCY = 4
+# Stream tokens into a .stream.log next to the output and stop at the closing </seir:SEIRModel> tag or code fence
+STREAM_OUTPUT = True
+
+# Content-addressed response cache: identical requests are served from disk instead of the API
+RESPONSE_CACHE_DIR = "response_cache"
+RESPONSE_CACHE_MAX_MB = 500
+RESPONSE_CACHE_BYPASS = False  # True to always draw fresh samples (they are still cached)
+
+# Cassette: "record" writes every backend request/response to CASSETTE_FILE, "replay" serves them back offline
+CASSETTE_MODE = "off"  # "off", "record" or "replay"
+CASSETTE_FILE = "cassettes/chatgpt.jsonl"
+CASSETTE_REPLAY_LATENCY = 0.0  # 1.0 sleeps for the recorded call times on replay, 0 returns instantly
+
+# OpenAI-compatible endpoint; None uses api.openai.com. "http://127.0.0.1:8000/v1" targets mock_llm_server.py
+OPENAI_BASE_URL = None
+# Pooled clients: each worker thread keeps using one of API_CLIENTS clients, which share up to
+# MAX_CONNECTIONS keep-alive HTTP connections, so concurrent stages skip the TLS handshake
+API_CLIENTS = 4
+MAX_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 30  # Seconds an idle connection stays open for reuse
+REQUEST_TIMEOUT = 600  # Seconds one request may take (streaming: the longest gap between chunks)
+CONNECT_TIMEOUT = 10
+
+# Checkpoints: the output of every LLM stage is kept under the hash of its inputs, so a re-run or a
+# crashed batch only runs the stages whose inputs changed (stage_dag). --fresh, RESPONSE_CACHE_BYPASS or a cassette ignores them
+RESUME_FROM_CHECKPOINTS = True
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_MAX_MB = 200
 
 # --- Load configuration files ---
+@functools.lru_cache(maxsize=None)
 def load_json_file(filename: str) -> dict:
-    """Load and return JSON file contents."""
+    """Load and return JSON file contents (parsed once, then shared)."""
     try:
         with open(filename, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -21,74 +76,278 @@ def load_json_file(filename: str) -> dict:
         raise
 
 
-# Load prompts and models
-prompts = load_json_file("prompts.json")
-LLM1_PROMPT = prompts["smart_LLM1_PROMPT"]
-LLM2_PROMPT = prompts["smart_LLM2_PROMPT"]
-LLM3A_PROMPT = prompts["smart_LLM3A_PROMPT"]
-LLM3B_PROMPT = prompts["smart_LLM3B_PROMPT"]
+# prompts.json key of each stage's prompt (override with --prompt STAGE=KEY); the file is read on first use
+PROMPT_KEYS = {
+    "LLM1": "smart_LLM1_PROMPT",
+    "LLM2": "smart_LLM2_PROMPT",
+    "LLM2_PATCH": "patch_LLM2_PROMPT",
+    "LLM1_JSON": "json_LLM1_PROMPT",
+    "LLM2_JSON": "json_LLM2_PROMPT",
+    "LLM3A": "smart_LLM3A_PROMPT",
+    "LLM3B": "smart_LLM3B_PROMPT",
+    "REPAIR": "repair_PROMPT",
+}
+
+
+def get_prompt(stage: str) -> str:
+    """Return the prompt of a stage (a PROMPT_KEYS key), reading prompts.json on first use."""
+    return load_json_file("prompts.json")[PROMPT_KEYS[stage]]
+
+
+@functools.lru_cache(maxsize=None)
+def get_simulation_skeleton() -> str:
+    """Return the python code of simulation_skeleton.txt, reading the file on first use."""
+    try:
+        with open(SIMULATION_SKELETON_FILE, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Error: {SIMULATION_SKELETON_FILE} not found.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    return ""
+
 
 METAMODEL_FILENAME = "compartmental_metamodel.json"
 SIMULATION_SKELETON_FILE = "simulation_skeleton.txt"
+# Minify the metamodel and drop best_practices/unicode_reference/value examples the input does not need
+COMPACT_METAMODEL = True
+# Keep only the structure/flow_patterns/validation_rules sections the user input needs
+SLICE_METAMODEL = True
+# Stage 2 mode: "full" re-emits the whole XML, "patch" returns SET/ADD/DEL edits applied locally
+STAGE2_MODE = "full"
+# Stage 1/2 output format: "xml" as the LLM writes it, or "json" for a compact JSON model requested through the
+# backend's structured-output mode and serialized to the metamodel's XML locally (seir_json). Fewer output tokens
+OUTPUT_FORMAT = "xml"
+# Best-of-N: draw N parallel samples for Stages 1 and 2 and keep the one seir_validator scores best (1 = off)
+BEST_OF_N = 1
+# Self-repair: when the final model still breaks validation rules, send only the offending fragments and the rule
+# texts back along the LLM2 route and splice the returned edits in, for up to this many rounds (0 = off)
+SELF_REPAIR_ROUNDS = 0
+# Per-stage model routing: each stage's "backend:model" targets (backends: gemini, chatgpt, llama_cpp), tried in
+# order when one fails (model_routing). The easy stages, LLM1 drafting and LLM3A skeleton filling, use a cheaper model
+STAGE_ROUTES = {
+    "LLM1": ["chatgpt:gpt-4o-mini", "chatgpt:gpt-4o"],
+    "LLM2": ["chatgpt:gpt-4o"],
+    "LLM3A": ["chatgpt:gpt-4o-mini", "chatgpt:gpt-4o"],
+    "LLM3B": ["chatgpt:gpt-4o"],
+}
+# Hedged requests for time-critical runs: the listed stages (e.g. ["LLM2"]) race their route's targets. The next
+# target starts after HEDGE_DELAY seconds without a valid answer; the first response passing local validation wins
+# and the others are cancelled. HEDGE_MAX_TOKENS caps the prompt tokens all hedges of a run may send (None: no cap)
+HEDGED_STAGES = []
+HEDGE_DELAY = 5.0
+HEDGE_MAX_TOKENS = 200000
+# Attach each model's diagram to its LLM1 request, downscaled so its longest side needs few image tiles
+ATTACH_DIAGRAMS = True
+DIAGRAM_MAX_SIDE = 768
+DIAGRAM_DETAIL = "high"  # "low" sends a fixed 512px view for the fewest image tokens
+DIAGRAM_CACHE_DIR = "diagram_cache"  # Processed diagrams, keyed by content hash
+
+# Models and simulations run when --models/--simulations are not given (python runChatGPT.py --help)
+DEFAULT_MODELS = ["ebola"]
+# NOTE: Only enable simulations whose ODE equations are ready in ode.json
+DEFAULT_SIMULATIONS = []
+
+# Diagram of each model, by output file name
+DIAGRAM_FILES = {
+    "finalHivModel.txt": "diagrams/hivModel(paper).jpeg",
+    "finalCovidModel.txt": "diagrams/covidModel(paper).png",
+    "finalSimpleModel.txt": "diagrams/simpleSIRModel(paper).png",
+    "finalMalariaModel.txt": "diagrams/malariaModel(paper).png",
+}
+
+
+# --- OpenAI API (the SDK is imported and the key read when the first client is built) ---
+def load_api_key() -> str:
+    """Return OPENAI_API_KEY from the environment or the .env file next to this script."""
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+    if "OPENAI_API_KEY" in os.environ:
+        return os.environ["OPENAI_API_KEY"]
+    if OPENAI_BASE_URL is not None:
+        return "mock"  # The local mock server accepts any key
+    raise RuntimeError("'OPENAI_API_KEY' environment variable not set.")
+
+
+CLIENTS = api_clients.openai_pool(
+    load_api_key, OPENAI_BASE_URL, API_CLIENTS, MAX_CONNECTIONS, KEEPALIVE_EXPIRY, REQUEST_TIMEOUT, CONNECT_TIMEOUT
+)
+
+RESPONSE_CACHE = response_cache.ResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+CHECKPOINTS = response_cache.ResponseCache(CHECKPOINT_DIR, CHECKPOINT_MAX_MB * 1024 * 1024)
+ROUTER = model_routing.Router(
+    STAGE_ROUTES, HEDGED_STAGES, HEDGE_DELAY, model_routing.CostCap(HEDGE_MAX_TOKENS)
+)
+CASSETTE = cassette.Cassette(CASSETTE_FILE, CASSETTE_MODE, CASSETTE_REPLAY_LATENCY)
+RATE_LIMITER = rate_limiter.RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+
+def resume_from_checkpoints() -> bool:
+    """
+    Whether stage nodes may be restored. Asking for fresh samples (RESPONSE_CACHE_BYPASS) skips checkpoints, and so
+    does an active cassette, which has to see every backend call to record or replay it.
+    """
+    return RESUME_FROM_CHECKPOINTS and not RESPONSE_CACHE_BYPASS and not CASSETTE.active
+
 
-models = load_json_file("models.json")
-hivModel = models["smartHIVInput"]
-covidModel = models["smartCovidInput"]
-simpleModel = models["smartSIRInput"]
-malariaModel = models["smartMalariaInput"]
-ebolaModel = models["smartEbolaInput"]
-
-
-ode = load_json_file("ode.json")
-hiv_ode = ode["hivModel"]
-covid_ode = ode["covidModel"]
-simple_ode = ode["simpleModel"]
-malaria_ode = ode["malariaModel"]
-
-# Extracting python code from simulation_skeleton.txt file
-SIMULATION_SKELETON = ""
-try:
-    with open(SIMULATION_SKELETON_FILE, 'r', encoding='utf-8') as f:
-        SIMULATION_SKELETON = f.read()
-except FileNotFoundError:
-    print(f"Error: {SIMULATION_SKELETON_FILE} not found.")
-except Exception as e:
-    print(f"An error occurred: {e}")
-
-
-# --- Initialize OpenAI API ---
-try:
-    env_path = os.path.join(os.path.dirname(__file__), ".env")
-    load_dotenv(env_path)
-    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-except KeyError:
-    print("FATAL ERROR: 'OPENAI_API_KEY' environment variable not set.")
-    print("Please set it before running the script.")
-    exit(1)
-
-
-def call_chatgpt(prompt: str, model: str = "gpt-4o") -> str:
+def checkpoint_inputs(stage: str, prompt: str, **settings) -> dict:
+    """Inputs of an LLM stage node besides its upstream nodes: the prompt, the stage's route and the settings."""
+    return {"prompt": prompt, "route": ROUTER.describe(stage), "settings": settings}
+
+
+def request_params(schema: dict = None, image: diagram_input.Diagram = None) -> dict:
+    """Request settings besides the prompt that change the response, for the response cache and cassette keys."""
+    params = {}
+    if schema:
+        params["response_schema"] = schema
+    if image is not None:
+        params["image"] = image.digest
+    return params
+
+
+def call_chatgpt(
+    prompt: str,
+    model: str = "gpt-4o",
+    log_path: str = None,
+    label: str = "",
+    bypass: bool = False,
+    schema: dict = None,
+    image: diagram_input.Diagram = None
+) -> str:
+    """
+    Call ChatGPT API with the given prompt, going through the response cache and the cassette.
+    
+    Args:
+        prompt: The input prompt
+        model: The model to use (default: gpt-4o, alternatives: gpt-4o-mini, gpt-4-turbo, gpt-3.5-turbo)
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        bypass: Draw a fresh sample instead of reusing a cached response
+        schema: JSON schema the response must follow (structured output), or None for free text
+        image: Diagram attached to the prompt, or None for text only
+        
+    Returns:
+        str: Generated text from the model
+    """
+    def generate():
+        return rate_limiter.call_with_retry(
+            lambda: generate_chatgpt(prompt, model, log_path, label, schema, image),
+            prompt, RATE_LIMITER, MAX_RETRIES, label=label,
+        )
+
+    params = request_params(schema, image)
+    # The cassette sits below the cache so it records real calls, never cache hits
+    return RESPONSE_CACHE.call(
+        "chatgpt", model, params, prompt,
+        lambda: CASSETTE.call("chatgpt", model, params, prompt, generate, label=label),
+        bypass=RESPONSE_CACHE_BYPASS or bypass or CASSETTE.active,
+    )
+
+
+model_routing.register_backend("chatgpt", call_chatgpt)
+
+
+def sample_chatgpt(
+    stage: str,
+    prompt: str,
+    validate,
+    log_path: str = None,
+    label: str = "",
+    schema: dict = None,
+    image: diagram_input.Diagram = None
+) -> str:
+    """
+    Send a stage's prompt along its route BEST_OF_N times in parallel and return the sample with the fewest
+    validation issues.
+
+    The first sample may come from the response cache; the others are always fresh.
+    The chosen sample is cached for the prompt and the stage's first model, if that is an OpenAI model.
+
+    Args:
+        stage: Routing stage, "LLM1" or "LLM2" (see STAGE_ROUTES)
+        prompt: The input prompt
+        validate: Function returning the seir_validator issues of a response
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        schema: JSON schema the response must follow (structured output), or None for free text
+        image: Diagram attached to the prompt, or None for text only
+
+    Returns:
+        str: The best generated text, or an "ERROR: ..." message if every sample failed
+    """
+    if BEST_OF_N <= 1:
+        return ROUTER.call(
+            stage, prompt, validate=validate, log_path=log_path, label=label, schema=schema, image=image
+        )
+
+    response, _ = best_of_n.sample_best(
+        lambda index: ROUTER.call(
+            stage, prompt, validate=validate, log_path=log_path, label=f"{label} (sample {index + 1}/{BEST_OF_N})",
+            bypass=index > 0, schema=schema, image=image,
+        ),
+        BEST_OF_N, validate, label,
+    )
+    backend, model = ROUTER.primary(stage)
+    if not response.startswith("ERROR:") and backend == "chatgpt":
+        params = request_params(schema, image)
+        RESPONSE_CACHE.put(response_cache.make_key("chatgpt", model, params, prompt), response)
+    return response
+
+
+def response_format_args(schema: dict = None) -> dict:
+    """Return the create() arguments asking for JSON that follows `schema`, or none for free text."""
+    if schema is None:
+        return {}
+    return {"response_format": {"type": "json_schema", "json_schema": {"name": "seir_model", "schema": schema}}}
+
+
+def user_message(prompt: str, image: diagram_input.Diagram = None) -> dict:
+    """Return the user message: the prompt, followed by the image if there is one."""
+    if image is None:
+        return {"role": "user", "content": prompt.strip()}
+    return {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt.strip()},
+            {"type": "image_url", "image_url": {"url": image.data_url(), "detail": DIAGRAM_DETAIL}},
+        ],
+    }
+
+
+def generate_chatgpt(
+    prompt: str,
+    model: str = "gpt-4o",
+    log_path: str = None,
+    label: str = "",
+    schema: dict = None,
+    image: diagram_input.Diagram = None
+) -> str:
     """
     Call ChatGPT API with the given prompt and return the generated text.
     
     Args:
         prompt: The input prompt
         model: The model to use (default: gpt-4o, alternatives: gpt-4o-mini, gpt-4-turbo, gpt-3.5-turbo)
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        schema: JSON schema the response must follow (structured output), or None for free text
+        image: Diagram attached to the prompt, or None for text only
         
     Returns:
         str: Generated text from the model
     """
+    if STREAM_OUTPUT:
+        return stream_chatgpt(prompt, model, log_path, label, schema, image)
+
     try:
         print(f"Calling ChatGPT API with prompt length: {len(prompt)} characters")
         
-        completion = client.chat.completions.create(
+        completion = CLIENTS.get().chat.completions.create(
             model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt.strip()
-                }
-            ]
+            messages=[user_message(prompt, image)],
+            timeout=REQUEST_TIMEOUT,
+            **response_format_args(schema)
         )
         
         output = completion.choices[0].message.content.strip()
@@ -96,7 +355,51 @@ def call_chatgpt(prompt: str, model: str = "gpt-4o") -> str:
         return output
         
     except Exception as e:
-        return f"ERROR: {str(e)}"
+        return rate_limiter.error_message(e)
+
+
+def iter_chatgpt_chunks(stream):
+    """Yield the text deltas of a ChatGPT completion stream, closing the stream when done or cancelled."""
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+
+def stream_chatgpt(
+    prompt: str,
+    model: str = "gpt-4o",
+    log_path: str = None,
+    label: str = "",
+    schema: dict = None,
+    image: diagram_input.Diagram = None
+) -> str:
+    """
+    Stream a generation from ChatGPT API, logging tokens as they arrive.
+
+    Generation stops as soon as the closing SEIRModel tag or code fence is emitted;
+    closing the stream cancels the rest of the request.
+
+    Returns:
+        str: Generated text from the model
+    """
+    try:
+        print(f"Streaming from ChatGPT API with prompt length: {len(prompt)} characters")
+        
+        stream = CLIENTS.get().chat.completions.create(
+            model=model,
+            messages=[user_message(prompt, image)],
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+            **response_format_args(schema)
+        )
+        
+        return streaming.collect_stream(iter_chatgpt_chunks(stream), log_path, label).text.strip()
+        
+    except Exception as e:
+        return rate_limiter.error_message(e)
 
 
 def generate_seirmodel(
@@ -116,8 +419,13 @@ def generate_seirmodel(
     try:
         # Load metamodel specifications
         with open(METAMODEL_FILENAME, "r", encoding="utf-8") as f:
-            lang_specs_json = json.load(f)
-        lang_specs = json.dumps(lang_specs_json, indent=2)
+            metamodel = lang_specs_json = json.load(f)
+        if SLICE_METAMODEL:
+            lang_specs_json = metamodel_slicer.slice_metamodel(lang_specs_json, user_input)
+        if COMPACT_METAMODEL:
+            lang_specs = prompt_compaction.compact_metamodel_text(lang_specs_json, user_input, METAMODEL_FILENAME)
+        else:
+            lang_specs = json.dumps(lang_specs_json, indent=2)
         
         print(f"'{METAMODEL_FILENAME}' loaded successfully.")
 
@@ -130,75 +438,178 @@ def generate_seirmodel(
         print(error_msg)
         return error_msg
 
+    diagram = None
+    diagram_path = DIAGRAM_FILES.get(output_fileName) if ATTACH_DIAGRAMS else None
+    if diagram_path:
+        try:
+            diagram = diagram_input.prepare_diagram(diagram_path, DIAGRAM_MAX_SIDE, DIAGRAM_CACHE_DIR)
+        except (OSError, ImportError) as err:
+            print(f"Diagram '{diagram_path}' not attached: {err}")
+
     # --- Stage 1: Structural generation ---
+    graph = stage_dag.StageGraph(CHECKPOINTS, output_fileName, resume_from_checkpoints())
     separator = "\n" + "*" * 80 + "\n"
+    stream_log = streaming.stream_log_path("Gemini_prompt_sample", output_fileName) if STREAM_OUTPUT else None
     
+    diagram_section = (
+        f"{separator}"
+        f"MODEL DIAGRAM: \nThe attached image is the model diagram. Use it for the compartment structure only; "
+        f"the user input is authoritative for compartments and flows.\n"
+    ) if diagram else ""
+    json_output = OUTPUT_FORMAT == "json"
+    llm1_prompt = get_prompt("LLM1_JSON" if json_output else "LLM1")
     llm1_input = (
         f"{separator}"
-        f"PROMPT: \n{LLM1_PROMPT.strip()}\n"
+        f"PROMPT: \n{llm1_prompt.strip()}\n"
         f"{separator}"
         f"METAMODEL: \n{lang_specs.strip()}\n"
+        f"{diagram_section}"
         f"{separator}"
         f"USER_INPUT: \n{user_input.strip()}\n"
         f"{separator}"
-        f"Generate the SEIR model in XML format based on the above information:"
+        f"Generate the SEIR model in {'JSON' if json_output else 'XML'} format based on the above information:"
     )
 
     print("Generating LLM1 response...")
-    llm1 = call_chatgpt(llm1_input)
+    llm1_started = time.monotonic()
+    llm1 = graph.run(
+        "llm1",
+        lambda: sample_chatgpt(
+            "LLM1",
+            llm1_input,
+            lambda response: (seir_json if json_output else seir_validator).validate(response, allow_placeholders=True),
+            log_path=stream_log, label="LLM1 RESPONSE",
+            schema=seir_json.schema_for_file(METAMODEL_FILENAME) if json_output else None,
+            image=diagram,
+        ),
+        inputs=checkpoint_inputs(
+            "LLM1", llm1_input, output_format=OUTPUT_FORMAT, best_of_n=BEST_OF_N, image=diagram.digest if diagram else None
+        ),
+    )
+    llm1_seconds = time.monotonic() - llm1_started
     
     if llm1.startswith("ERROR:"):
         return llm1
     
+    llm1_json = ""
+    if json_output:
+        llm1_json = llm1
+        llm1 = seir_json.convert(llm1_json)
+        if llm1.startswith("ERROR:"):
+            graph.reject("llm1")
+            return llm1
+        print(f"Converted LLM1 JSON model to XML ({len(llm1_json)} characters instead of {len(llm1)})")
+    
     print("LLM1 response generated successfully.")
 
     # --- Stage 2: Refinement ---
+    # Patch mode edits LLM1's XML, so only full mode answers with a JSON model
+    json_stage2 = json_output and STAGE2_MODE == "full"
+    llm2_prompt = get_prompt("LLM2_PATCH" if STAGE2_MODE == "patch" else "LLM2_JSON" if json_stage2 else "LLM2")
+    llm2_model = seir_json.to_json(seir_json.parse(llm1_json)) if json_stage2 else llm1
     llm2_input = (
         f"{separator}"
-        f"PROMPT:\n{LLM2_PROMPT.strip()}\n"
+        f"PROMPT:\n{llm2_prompt.strip()}\n"
         f"{separator}"
         f"USER INPUT:\n{user_input.strip()}\n"
         f"{separator}"
-        f"STRUCTURALLY CORRECT SEIRMODEL FILE:\n{llm1.strip()}\n"
+        f"STRUCTURALLY CORRECT SEIRMODEL FILE:\n{llm2_model.strip()}\n"
         f"{separator}"
     )
 
     print("Generating LLM2 response...")
-    llm2 = call_chatgpt(llm2_input)
+    llm2_started = time.monotonic()
+    llm2 = graph.run(
+        "llm2",
+        lambda: sample_chatgpt(
+            "LLM2",
+            llm2_input,
+            seir_json.validate if json_stage2 else best_of_n.stage2_validator(llm1, patch=STAGE2_MODE == "patch"),
+            log_path=stream_log, label="LLM2 RESPONSE",
+            schema=seir_json.schema_for_file(METAMODEL_FILENAME, allow_placeholders=False) if json_stage2 else None,
+        ),
+        inputs=checkpoint_inputs("LLM2", llm2_input, output_format=OUTPUT_FORMAT, best_of_n=BEST_OF_N),
+        deps=("llm1",),
+    )
+    llm2_seconds = time.monotonic() - llm2_started
     
     if llm2.startswith("ERROR:"):
         return llm2
     
+    llm2_json = ""
+    if json_stage2:
+        llm2_json = llm2
+        llm2 = seir_json.convert(llm2_json)
+        if llm2.startswith("ERROR:"):
+            graph.reject("llm2")
+            return llm2
+        print(f"Converted LLM2 JSON model to XML ({len(llm2_json)} characters instead of {len(llm2)})")
+    
+    llm2_patch = ""
+    if STAGE2_MODE == "patch":
+        llm2_patch = llm2
+        try:
+            llm2 = xml_patch.apply_patch(llm1, llm2_patch)
+        except xml_patch.PatchError as err:
+            error_msg = f"ERROR: Stage 2 patch could not be applied: {err}"
+            print(error_msg)
+            graph.reject("llm2")
+            return error_msg
+        print(f"Applied Stage 2 patch ({len(llm2_patch)} characters instead of {len(llm2)} characters of XML)")
+    
     print("LLM2 response generated successfully.")
     
-    # --- Format and save the output ---
-    output_content = (
-        f"LLM1 PROMPT:\n{LLM1_PROMPT.strip()}"
-        f"{separator}"
-        f"METAMODEL:\n{lang_specs.strip()}"
-        f"{separator}"
-        f"User Input:\n{user_input.strip()}"
-        f"{separator}"
-        f"LLM1 RESPONSE:\n{llm1}"
-        f"{separator}"
-        f"{separator}"
-        f"LLM2 PROMPT:\n{LLM2_PROMPT.strip()}"
-        f"{separator}"
-        f"USER INPUT:\n{user_input}"
-        f"{separator}"
-        f"LLM1'S RESPONSE:\n{llm1}"
-        f"{separator}"
-        f"LLM2'S RESPONSE:\n{llm2}"
-    )
-
+    # --- Self-repair: patch only the elements that break validation rules ---
+    model_xml = seir_xml.extract_xml(llm2)
+    repair_rounds = []
+    issues = seir_validator.validate(llm2) if SELF_REPAIR_ROUNDS else []
+    if self_repair.is_repairable(issues):
+        repair_started = time.monotonic()
+        model_xml, issues, repair_rounds = self_repair.repair(
+            model_xml, issues,
+            lambda prompt: ROUTER.call("LLM2", prompt, log_path=stream_log, label="REPAIR"),
+            get_prompt("REPAIR"), metamodel, SELF_REPAIR_ROUNDS,
+        )
+        repair_seconds = time.monotonic() - repair_started
+        if issues:
+            print(f"{len(issues)} validation issue(s) left after repair:")
+            for issue in issues:
+                print(f"  {issue}")
+    
+    # --- Save the run record ---
+    # Each text is streamed into the archive once; prompts and inputs are referenced by hash (run_artifacts)
+    run_meta = {
+        "backend": "chatgpt",
+        "routes": {stage: ROUTER.describe(stage) for stage in ("LLM1", "LLM2")},
+        "diagram": str(diagram) if diagram else None,
+        "output_file": output_fileName,
+        "metamodel": METAMODEL_FILENAME,
+        "stage2_mode": STAGE2_MODE,
+        "output_format": OUTPUT_FORMAT,
+        "best_of_n": BEST_OF_N,
+        "self_repair_rounds": SELF_REPAIR_ROUNDS,
+    }
+    output_file = run_artifacts.record_path("Gemini_prompt_sample", output_fileName)
     try:
-        # Ensure the output directory exists
-        output_dir = "Gemini_prompt_sample"
-        os.makedirs(output_dir, exist_ok=True)
-        output_file = os.path.join(output_dir, output_fileName)
-        
-        with open(output_file, "w", encoding="utf-8") as tf:
-            tf.write(output_content)
+        with run_artifacts.RunRecord(output_file, run_meta) as record:
+            record.add("llm1_prompt", llm1_prompt.strip())
+            record.add("metamodel", lang_specs.strip())
+            record.add("user_input", user_input.strip())
+            record.add("llm1_json", llm1_json)
+            record.add("llm1_response", llm1)
+            record.add("llm2_prompt", llm2_prompt.strip())
+            record.add("llm2_patch", llm2_patch)
+            record.add("llm2_json", llm2_json)
+            record.add("llm2_response", llm2)
+            record.add("repair_patch", "\n".join(patch for _, patch in repair_rounds))
+            record.add("model_xml", model_xml)
+            record.add_stage("llm1", llm1_seconds, llm1_input, llm1_json or llm1)
+            record.add_stage("llm2", llm2_seconds, llm2_input, llm2_patch or llm2_json or llm2)
+            if repair_rounds:
+                record.add_stage(
+                    "repair", repair_seconds,
+                    "".join(prompt for prompt, _ in repair_rounds), "\n".join(patch for _, patch in repair_rounds)
+                )
         
         success_msg = f"SEIR model successfully written to {output_file}"
         print(success_msg)
@@ -223,19 +634,25 @@ def simulate(ode_equations: str, output_fileName: str) -> str:
     """
     
     # --- Stage 3A: Generate simulation script ---
+    graph = stage_dag.StageGraph(CHECKPOINTS, output_fileName, resume_from_checkpoints())
     separator = "\n" + "*" * 80 + "\n"
+    stream_log = streaming.stream_log_path("simulation_scripts", output_fileName) if STREAM_OUTPUT else None
     
     simulation_stage3a = (
         f"{separator}"
-        f"PROMPT:\n{LLM3A_PROMPT.strip()}\n"
+        f"PROMPT:\n{get_prompt('LLM3A').strip()}\n"
         f"{separator}"
         f"ODE_EQUATIONS:\n{ode_equations.strip()}\n"
         f"{separator}"
-        f"Simulation python skeleton file:\n{SIMULATION_SKELETON.strip()}"
+        f"Simulation python skeleton file:\n{get_simulation_skeleton().strip()}"
     )
 
     print("Generating simulation stage3a script...")
-    simulation_script_3a = call_chatgpt(simulation_stage3a)
+    simulation_script_3a = graph.run(
+        "3a",
+        lambda: ROUTER.call("LLM3A", simulation_stage3a, log_path=stream_log, label="STAGE 3A"),
+        inputs=checkpoint_inputs("LLM3A", simulation_stage3a),
+    )
     
     if simulation_script_3a.startswith("ERROR:"):
         return simulation_script_3a
@@ -245,7 +662,7 @@ def simulate(ode_equations: str, output_fileName: str) -> str:
     # --- Stage 3B: Refine simulation script ---
     simulation_stage3b = (
         f"{separator}"
-        f"PROMPT:\n{LLM3B_PROMPT.strip()}\n"
+        f"PROMPT:\n{get_prompt('LLM3B').strip()}\n"
         f"{separator}"
         f"ODE_EQUATIONS:\n{ode_equations.strip()}\n"
         f"{separator}"
@@ -253,7 +670,12 @@ def simulate(ode_equations: str, output_fileName: str) -> str:
     )
 
     print("Generating final simulation stage3b script...")
-    simulation_script = call_chatgpt(simulation_stage3b)
+    simulation_script = graph.run(
+        "3b",
+        lambda: ROUTER.call("LLM3B", simulation_stage3b, log_path=stream_log, label="STAGE 3B"),
+        inputs=checkpoint_inputs("LLM3B", simulation_stage3b),
+        deps=("3a",),
+    )
     
     if simulation_script.startswith("ERROR:"):
         return simulation_script
@@ -279,63 +701,56 @@ def simulate(ode_equations: str, output_fileName: str) -> str:
         return error_msg
 
 
-def main():
-    """Main execution function."""
-    
-    print("\n" + "="*80)
-    print("Using ChatGPT API (GPT-4o)")
-    print("="*80)
-    
-    # Generate SEIR models
-    print("\n" + "="*80)
-    # print("Generating HIV Model...")
-    # print("="*80)
-    # generate_seirmodel(hivModel, "finalHivModel.txt")
-    
-    # time.sleep(BREAK_TIME)
+def main(argv: list = None):
+    """
+    Main execution function.
 
-    # print("\n" + "="*80)
-    # print("Generating COVID Model...")
-    # print("="*80)
-    # generate_seirmodel(covidModel, "finalCovidModel.txt")
-    
-    # time.sleep(BREAK_TIME)
+    Args:
+        argv: Command-line arguments (None for sys.argv); see --help
+    """
+    global RESUME_FROM_CHECKPOINTS
+    args = pipeline_cli.parse_args(
+        argv,
+        "Generate SEIR models and simulation scripts with the ChatGPT API.",
+        DEFAULT_MODELS,
+        DEFAULT_SIMULATIONS,
+        PROMPT_KEYS
+    )
+    PROMPT_KEYS.update(args.prompts)
+    if args.fresh:
+        RESUME_FROM_CHECKPOINTS = False
+    # Only the selected entries are looked up, and ode.json is not read when no simulation runs
+    seir_jobs = pipeline_cli.load_jobs(args.models, pipeline_cli.MODELS, lambda: load_json_file("models.json"))
+    simulation_jobs = pipeline_cli.load_jobs(
+        args.simulations, pipeline_cli.SIMULATIONS, lambda: load_json_file("ode.json")
+    )
 
-    
     print("\n" + "="*80)
-    print("Generating Ebola Model...")
+    print("Using ChatGPT API")
     print("="*80)
-    generate_seirmodel(ebolaModel, "finalEbolaModel.txt")
 
-    # print("\n" + "="*80)
-    # print("Generating Simple SIR Model...")
-    # print("="*80)
-    # generate_seirmodel(simpleModel, "finalSimpleModel.txt")
-
-    # time.sleep(BREAK_TIME)
-
-    # print("\n" + "="*80)
-    # print("Generating Malaria Model...")
-    # print("="*80)
-    # generate_seirmodel(malariaModel, "finalMalariaModel.txt")
-    
-    # NOTE: Only run if the ODE equations are ready in the ode.json
-    # time.sleep(BREAK_TIME)
-    # print("\n" + "="*80)
-    # print("Generating HIV Simulation...")
-    # print("="*80)
-    # simulate(hiv_ode, "hiv_simulation.py")
-    
-    # time.sleep(BREAK_TIME)
-    # print("\n" + "="*80)
-    # print("Generating COVID Simulation...")
-    # print("="*80)
-    # simulate(covid_ode, "covid_simulation.py")
-    
-    # time.sleep(BREAK_TIME)
-    # simulate(simple_ode, "simple_simulation.py")
-    # time.sleep(BREAK_TIME)
-    # simulate(malaria_ode, "malaria_simulation.py")
+    for stage in model_routing.STAGES:
+        hedging = f" (hedged, {HEDGE_DELAY:g}s delay)" if stage in HEDGED_STAGES else ""
+        print(f"{stage}: {ROUTER.describe(stage)}{hedging}")
+
+    if args.dry_run:
+        pipeline_cli.print_plan(seir_jobs, simulation_jobs, PROMPT_KEYS)
+        return
+
+    if CASSETTE_MODE != "replay" and ROUTER.uses("chatgpt"):  # Replaying a cassette needs no API access
+        try:
+            load_api_key()
+        except RuntimeError as e:
+            print(f"FATAL ERROR: {e}")
+            print("Please set it before running the script.")
+            exit(1)
+
+    if ASYNC_PIPELINE:
+        pipeline_runner.run_concurrently(
+            generate_seirmodel, simulate, seir_jobs, simulation_jobs, MAX_CONCURRENCY
+        )
+    else:
+        pipeline_runner.run_sequentially(generate_seirmodel, simulate, seir_jobs, simulation_jobs)
 
     print("\n" + "="*80)
     print("All tasks completed!")
@@ -343,4 +758,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,13 +1,72 @@
 import os
-import time
+import functools
 import json
+import codecs
 import subprocess
+import time
 
+import best_of_n
+import cassette
+import llama_pool
+import llama_server
+import metamodel_slicer
+import model_routing
+import pipeline_cli
+import pipeline_runner
+import prompt_compaction
+import response_cache
+import run_artifacts
+import self_repair
+import seir_grammar
+import seir_json
+import seir_validator
+import seir_xml
+import stage_dag
+import streaming
+import xml_patch
 
 # --- Configuration ---
 LLAMA_CPP_PATH = "./llama.cpp/main"  # Path to llama.cpp executable
 MODEL_PATH = "./models/gpt-oss-20b.gguf"  # Path to your GGUF model file
 BREAK_TIME = 10 #10 seconds break betweek each execution by default. Increase it if GPU is dying
+# Run every model's chain concurrently instead of one after another with BREAK_TIME pauses
+ASYNC_PIPELINE = True
+# Chains in flight at once; keep at 1 unless llama-server runs with parallel slots
+MAX_CONCURRENCY = 1
+
+# Persistent server mode: load the model once into llama-server and send every stage to it
+USE_LLAMA_SERVER = True
+LLAMA_SERVER_PATH = "./llama.cpp/llama-server"  # Path to llama-server executable
+LLAMA_SERVER_PORT = 8080
+
+# Pool of llama.cpp workers, each pinned to its own slice of CPU cores (and with its own server on
+# LLAMA_SERVER_PORT + i); stage jobs of all models share one queue. Set MAX_CONCURRENCY >= LLAMA_WORKERS
+LLAMA_WORKERS = 1
+LLAMA_WORKER_CORES = None  # e.g. [[0, 1, 2, 3], [4, 5, 6, 7]]; None splits the available cores evenly
+
+# Saved KV caches for each stage's static prompt prefix (prompt + metamodel). Set to None to disable
+PROMPT_CACHE_DIR = "prompt_cache"
+
+# Stream tokens into a .stream.log next to the output and stop at the closing </seir:SEIRModel> tag or code fence
+STREAM_OUTPUT = True
+
+# Content-addressed response cache: identical requests are served from disk instead of the model
+RESPONSE_CACHE_DIR = "response_cache"
+RESPONSE_CACHE_MAX_MB = 500
+RESPONSE_CACHE_BYPASS = False  # True to always draw fresh samples (they are still cached)
+
+# Cassette: "record" writes every backend request/response to CASSETTE_FILE, "replay" serves them back offline
+CASSETTE_MODE = "off"  # "off", "record" or "replay"
+CASSETTE_FILE = "cassettes/llama_cpp.jsonl"
+CASSETTE_REPLAY_LATENCY = 0.0  # 1.0 sleeps for the recorded call times on replay, 0 returns instantly
+
+# Timeouts scale with the request: GENERATION_TIMEOUT_BASE + prompt tokens / PROMPT_TOKENS_PER_SECOND
+# + max tokens / GENERATED_TOKENS_PER_SECOND. Set the two speeds to what your hardware reaches
+GENERATION_TIMEOUT_BASE = 60
+PROMPT_TOKENS_PER_SECOND = 100
+GENERATED_TOKENS_PER_SECOND = 10
+# A timed-out generation keeps its partial output; unfinished XML or code is continued this many times
+MAX_RESUMES = 2
 
 # Generation parameters
 GENERATION_PARAMS = {
@@ -20,9 +79,16 @@ GENERATION_PARAMS = {
 }
 
 
+# Checkpoints: the output of every LLM stage is kept under the hash of its inputs, so a re-run or a
+# crashed batch only runs the stages whose inputs changed (stage_dag). --fresh, RESPONSE_CACHE_BYPASS or a cassette ignores them
+RESUME_FROM_CHECKPOINTS = True
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_MAX_MB = 200
+
 # --- Load configuration files ---
+@functools.lru_cache(maxsize=None)
 def load_json_file(filename: str) -> dict:
-    """Load and return JSON file contents."""
+    """Load and return JSON file contents (parsed once, then shared)."""
     try:
         with open(filename, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -34,55 +100,119 @@ def load_json_file(filename: str) -> dict:
         raise
 
 
-# Load prompts and models
-prompts = load_json_file("prompts.json")
-LLM1_PROMPT = prompts["short_LLM1_PROMPT"]
-LLM2_PROMPT = prompts["short_LLM2_PROMPT"]
-LLM3A_PROMPT = prompts["smart_LLM3A_PROMPT"]
-LLM3B_PROMPT = prompts["smart_LLM3B_PROMPT"]
+# prompts.json key of each stage's prompt (override with --prompt STAGE=KEY); the file is read on first use
+PROMPT_KEYS = {
+    "LLM1": "smart_LLM1_PROMPT",
+    "LLM2": "smart_LLM2_PROMPT",
+    "LLM2_PATCH": "patch_LLM2_PROMPT",
+    "LLM1_JSON": "json_LLM1_PROMPT",
+    "LLM2_JSON": "json_LLM2_PROMPT",
+    "LLM3A": "smart_LLM3A_PROMPT",
+    "LLM3B": "smart_LLM3B_PROMPT",
+    "REPAIR": "repair_PROMPT",
+}
+
+
+def get_prompt(stage: str) -> str:
+    """Return the prompt of a stage (a PROMPT_KEYS key), reading prompts.json on first use."""
+    return load_json_file("prompts.json")[PROMPT_KEYS[stage]]
+
+
+@functools.lru_cache(maxsize=None)
+def get_simulation_skeleton() -> str:
+    """Return the python code of simulation_skeleton.txt, reading the file on first use."""
+    try:
+        with open(SIMULATION_SKELETON_FILE, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Error: {SIMULATION_SKELETON_FILE} not found.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    return ""
 
 
 METAMODEL_FILENAME = "metamodel.json"
 # METAMODEL_FILENAME = "compartmental_metamodel.json" 
 SIMULATION_SKELETON_FILE = "simulation_skeleton.txt"
+# Minify the metamodel and drop best_practices/unicode_reference/value examples the input does not need
+COMPACT_METAMODEL = True
+# Keep only the structure/flow_patterns/validation_rules sections the user input needs
+SLICE_METAMODEL = True
+# Stage 2 mode: "full" re-emits the whole XML, "patch" returns SET/ADD/DEL edits applied locally
+STAGE2_MODE = "full"
+# Stage 1/2 output format: "xml" as the LLM writes it, or "json" for a compact JSON model requested through the
+# backend's structured-output mode and serialized to the metamodel's XML locally (seir_json). Fewer output tokens
+OUTPUT_FORMAT = "xml"
+# Best-of-N: draw N parallel samples for Stages 1 and 2 and keep the one seir_validator scores best (1 = off)
+# Each sample is a separate llama.cpp process (or server request; start the server with --parallel N)
+BEST_OF_N = 1
+# Self-repair: when the final model still breaks validation rules, send only the offending fragments and the rule
+# texts back along the LLM2 route and splice the returned edits in, for up to this many rounds (0 = off)
+SELF_REPAIR_ROUNDS = 0
+# Per-stage model routing: each stage's "backend:model" targets (backends: llama_cpp, gemini, chatgpt), tried in
+# order when one fails (model_routing). The llama_cpp backend serves MODEL_PATH, the model llama-server loaded;
+# e.g. add "gemini:gemini-2.5-pro" after it to fall back to the API when a local generation fails
+STAGE_ROUTES = {
+    "LLM1": [f"llama_cpp:{MODEL_PATH}"],
+    "LLM2": [f"llama_cpp:{MODEL_PATH}"],
+    "LLM3A": [f"llama_cpp:{MODEL_PATH}"],
+    "LLM3B": [f"llama_cpp:{MODEL_PATH}"],
+}
+# Hedged requests for time-critical runs: the listed stages (e.g. ["LLM2"]) race their route's targets. The next
+# target starts after HEDGE_DELAY seconds without a valid answer; the first response passing local validation wins
+# and the others are cancelled. HEDGE_MAX_TOKENS caps the prompt tokens all hedges of a run may send (None: no cap)
+HEDGED_STAGES = []
+HEDGE_DELAY = 5.0
+HEDGE_MAX_TOKENS = 200000
+# Constrain Stage 1 and Stage 2 ("full" mode) sampling with a GBNF grammar built from the metamodel,
+# so every response is well-formed SEIRModel XML with only the elements and attributes it allows
+USE_GRAMMAR = False
+
+# Models and simulations run when --models/--simulations are not given (python runGPT.py --help)
+DEFAULT_MODELS = ["hiv", "covid"]
+# NOTE: Only enable simulations whose ODE equations are ready in ode.json
+DEFAULT_SIMULATIONS = ["hiv", "covid"]
+
 
-models = load_json_file("models.json")
-hivModel = models["smartHIVInput"]
-covidModel = models["smartCovidInput"]
-simpleModel = models["smartSIRInput"]
-malariaModel = models["smartMalariaInput"]
 
-ode = load_json_file("ode.json")
-hiv_ode = ode["hivModel"]
-covid_ode = ode["covidModel"]
-simple_ode = ode["simpleModel"]
-malaria_ode = ode["malariaModel"]
+RESPONSE_CACHE = response_cache.ResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+CHECKPOINTS = response_cache.ResponseCache(CHECKPOINT_DIR, CHECKPOINT_MAX_MB * 1024 * 1024)
+ROUTER = model_routing.Router(
+    STAGE_ROUTES, HEDGED_STAGES, HEDGE_DELAY, model_routing.CostCap(HEDGE_MAX_TOKENS)
+)
+CASSETTE = cassette.Cassette(CASSETTE_FILE, CASSETTE_MODE, CASSETTE_REPLAY_LATENCY)
 
 
-# Extracting python code from simulation_skeleton.txt file
-SIMULATION_SKELETON = ""
+def resume_from_checkpoints() -> bool:
+    """
+    Whether stage nodes may be restored. Asking for fresh samples (RESPONSE_CACHE_BYPASS) skips checkpoints, and so
+    does an active cassette, which has to see every backend call to record or replay it.
+    """
+    return RESUME_FROM_CHECKPOINTS and not RESPONSE_CACHE_BYPASS and not CASSETTE.active
 
-try:
-    with open(filename, 'r', encoding='utf-8') as f:
-        SIMULATION_SKELETON = f.read()
-except FileNotFoundError:
-    print(f"Error: {filename} not found.")
-except Exception as e:
-    print(f"An error occurred: {e}")
 
+def checkpoint_inputs(stage: str, prompt: str, max_tokens: int = None, **settings) -> dict:
+    """Inputs of an LLM stage node besides its upstream nodes: the prompt, the stage's route and the settings."""
+    return {
+        "prompt": prompt,
+        "route": ROUTER.describe(stage),
+        "generation": generation_key_params(max_tokens),
+        "settings": settings,
+    }
 
-def call_llama_cpp(prompt: str, max_tokens: int = None) -> str:
+
+def prompt_cache_dir(worker_index: int = None) -> str:
     """
-    Call Llama.cpp with the given prompt and return the generated text.
-    
-    Args:
-        prompt: The input prompt
-        max_tokens: Override default max tokens if specified
-        
-    Returns:
-        str: Generated text from the model
+    Folder of the saved prefix caches. With several pool workers each one has its own subfolder: they evaluate the
+    same prefixes at the same time, and must not write (or restore) a cache file another worker is still writing.
     """
-    # Build command
+    if not PROMPT_CACHE_DIR or worker_index is None or LLAMA_WORKERS <= 1:
+        return PROMPT_CACHE_DIR
+    return os.path.join(PROMPT_CACHE_DIR, f"worker{worker_index}")
+
+
+def build_llama_cmd(prompt: str, max_tokens: int = None, cache_key: str = None, grammar: str = None) -> list:
+    """Build the llama.cpp `main` command line for a single generation."""
     cmd = [
         LLAMA_CPP_PATH,
         "-m", MODEL_PATH,
@@ -95,36 +225,478 @@ def call_llama_cpp(prompt: str, max_tokens: int = None) -> str:
         "-c", str(GENERATION_PARAMS["ctx_size"]),
         "--log-disable",  # Disable logging to stderr
     ]
+    worker = llama_pool.current_worker()
+    if worker is not None:
+        cmd += ["--threads", str(len(worker.cores))]
+    if grammar:
+        cmd += ["--grammar", grammar]
+    if cache_key:
+        # llama.cpp reuses the matching prefix of a saved session and updates it after the run
+        cache_dir = prompt_cache_dir(worker.index if worker is not None else None)
+        os.makedirs(cache_dir, exist_ok=True)
+        cmd += ["--prompt-cache", os.path.join(cache_dir, f"{cache_key}.session")]
+    return cmd
+
+
+def get_llama_server() -> llama_server.LlamaServer:
+    """Return the persistent llama.cpp server (the current pool worker's own one), starting it on first use."""
+    worker = llama_pool.current_worker()
+    if worker is not None and worker.server is not None:
+        worker.server.ensure_running()
+        return worker.server
+    return llama_server.get_server(
+        LLAMA_SERVER_PATH,
+        MODEL_PATH,
+        port=LLAMA_SERVER_PORT,
+        ctx_size=GENERATION_PARAMS["ctx_size"],
+        slot_save_path=PROMPT_CACHE_DIR,
+    )
+
+
+def get_llama_pool() -> llama_pool.LlamaPool:
+    """Return the pool of LLAMA_WORKERS llama.cpp workers, creating it on first use."""
+    def make_server(index, cores):
+        return llama_server.LlamaServer(
+            LLAMA_SERVER_PATH,
+            MODEL_PATH,
+            port=LLAMA_SERVER_PORT + index,
+            ctx_size=GENERATION_PARAMS["ctx_size"],
+            slot_save_path=prompt_cache_dir(index),
+            cpu_cores=cores,
+        )
+
+    return llama_pool.get_pool(LLAMA_WORKERS, LLAMA_WORKER_CORES, make_server if USE_LLAMA_SERVER else None)
+
+
+def pin_to_worker_cores():
+    """Return the preexec_fn pinning a llama.cpp process to the current pool worker's cores, or None."""
+    worker = llama_pool.current_worker()
+    return llama_server.pin_to_cores(worker.cores) if worker is not None else None
+
+
+def generation_key_params(max_tokens: int = None, grammar: str = None) -> dict:
+    """Generation parameters identifying a request in the response cache and cassette."""
+    params = dict(GENERATION_PARAMS, n_predict=max_tokens or GENERATION_PARAMS["n_predict"])
+    if grammar:
+        params["grammar"] = grammar
+    return params
+
+
+def call_llama_cpp(
+    prompt: str,
+    max_tokens: int = None,
+    prefix: str = None,
+    prefix_files: tuple = (),
+    log_path: str = None,
+    label: str = "",
+    bypass: bool = False,
+    grammar: str = None
+) -> str:
+    """
+    Call Llama.cpp with the given prompt, going through the response cache and the cassette.
+    
+    Args:
+        prompt: The input prompt
+        max_tokens: Override default max tokens if specified
+        prefix: Static leading part of the prompt whose KV cache is saved and reused
+        prefix_files: Files the prefix was built from, hashed into the cache key
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        bypass: Draw a fresh sample instead of reusing a cached response
+        grammar: GBNF grammar constraining the output (see seir_grammar)
+        
+    Returns:
+        str: Generated text from the model
+    """
+    params = generation_key_params(max_tokens, grammar)
+    # The cassette sits below the cache so it records real calls, never cache hits
+    return RESPONSE_CACHE.call(
+        "llama_cpp", os.path.basename(MODEL_PATH), params, prompt,
+        lambda: CASSETTE.call(
+            "llama_cpp", os.path.basename(MODEL_PATH), params, prompt,
+            lambda: generate_llama_cpp(prompt, max_tokens, prefix, prefix_files, log_path, label, grammar),
+            label=label,
+        ),
+        bypass=RESPONSE_CACHE_BYPASS or bypass or CASSETTE.active,
+    )
+
+
+def route_llama_cpp(
+    prompt: str,
+    model: str,
+    log_path: str = None,
+    label: str = "",
+    bypass: bool = False,
+    schema: dict = None,
+    image=None,
+    max_tokens: int = None,
+    prefix: str = None,
+    prefix_files: tuple = (),
+    grammar: str = None
+) -> str:
+    """
+    The llama_cpp backend of model_routing: call_llama_cpp for routes naming MODEL_PATH.
+
+    One llama.cpp server holds one model, so other models are refused. Images are not supported and ignored;
+    a schema is applied through its grammar when no grammar is given.
+
+    Returns:
+        str: Generated text from the model, or an "ERROR: ..." message
+    """
+    if model != MODEL_PATH:
+        return f"ERROR: llama.cpp serves {MODEL_PATH}, not {model}"
+    if grammar is None and schema is not None:
+        grammar = seir_json.build_grammar(schema)
+    return call_llama_cpp(prompt, max_tokens, prefix, prefix_files, log_path, label, bypass, grammar)
+
+
+model_routing.register_backend("llama_cpp", route_llama_cpp)
+
+
+def call_stage(
+    stage: str,
+    prompt: str,
+    max_tokens: int = None,
+    prefix: str = None,
+    prefix_files: tuple = (),
+    log_path: str = None,
+    label: str = "",
+    bypass: bool = False,
+    grammar: str = None,
+    schema: dict = None,
+    validate=None
+) -> str:
+    """
+    Send a stage's prompt along its route (STAGE_ROUTES), with the llama.cpp-only options for local targets.
+
+    Args:
+        stage: "LLM1", "LLM2", "LLM3A" or "LLM3B"
+        prompt: The input prompt
+        max_tokens: Override default max tokens if specified
+        prefix: Static leading part of the prompt whose KV cache is saved and reused
+        prefix_files: Files the prefix was built from, hashed into the cache key
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        bypass: Draw a fresh sample instead of reusing a cached response
+        grammar: GBNF grammar constraining local output (see seir_grammar)
+        schema: JSON schema for API targets' structured output, or None for free text
+        validate: Function returning the seir_validator issues of a response (HEDGED_STAGES only)
+
+    Returns:
+        str: Generated text from the first target that succeeded, or an "ERROR: ..." message
+    """
+    return ROUTER.call(
+        stage, prompt,
+        options={"llama_cpp": {
+            "max_tokens": max_tokens, "prefix": prefix, "prefix_files": prefix_files, "grammar": grammar,
+        }},
+        validate=validate, log_path=log_path, label=label, bypass=bypass, schema=schema,
+    )
+
+
+def sample_llama_cpp(
+    stage: str,
+    prompt: str,
+    validate,
+    max_tokens: int = None,
+    prefix: str = None,
+    prefix_files: tuple = (),
+    log_path: str = None,
+    label: str = "",
+    grammar: str = None,
+    schema: dict = None
+) -> str:
+    """
+    Send a stage's prompt along its route BEST_OF_N times in parallel and return the sample with the fewest
+    validation issues.
+
+    The first sample may come from the response cache and is the only one that uses
+    the prefix cache, so samples never write the same saved session at once.
+    The chosen sample is cached for the prompt if the stage's first target is the local model.
+
+    Args:
+        stage: Routing stage, "LLM1" or "LLM2" (see STAGE_ROUTES)
+        prompt: The input prompt
+        validate: Function returning the seir_validator issues of a response
+        max_tokens: Override default max tokens if specified
+        prefix: Static leading part of the prompt whose KV cache is saved and reused
+        prefix_files: Files the prefix was built from, hashed into the cache key
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        grammar: GBNF grammar constraining local output (see seir_grammar)
+        schema: JSON schema for API targets' structured output, or None for free text
+
+    Returns:
+        str: The best generated text, or an "ERROR: ..." message if every sample failed
+    """
+    if BEST_OF_N <= 1:
+        return call_stage(
+            stage, prompt, max_tokens, prefix, prefix_files, log_path, label,
+            grammar=grammar, schema=schema, validate=validate,
+        )
+
+    response, _ = best_of_n.sample_best(
+        lambda index: call_stage(
+            stage, prompt, max_tokens,
+            prefix if index == 0 else None,
+            prefix_files,
+            log_path,
+            f"{label} (sample {index + 1}/{BEST_OF_N})",
+            bypass=index > 0,
+            grammar=grammar,
+            schema=schema,
+            validate=validate,
+        ),
+        BEST_OF_N, validate, label,
+    )
+    if not response.startswith("ERROR:") and ROUTER.primary(stage)[0] == "llama_cpp":
+        params = generation_key_params(max_tokens, grammar)
+        RESPONSE_CACHE.put(response_cache.make_key("llama_cpp", os.path.basename(MODEL_PATH), params, prompt), response)
+    return response
+
+
+def generation_timeout(prompt: str, max_tokens: int = None) -> float:
+    """Seconds a generation may take, scaled by prompt length and the number of tokens to generate."""
+    n_predict = max_tokens or GENERATION_PARAMS["n_predict"]
+    return (
+        GENERATION_TIMEOUT_BASE
+        + prompt_compaction.count_tokens(prompt) / PROMPT_TOKENS_PER_SECOND
+        + n_predict / GENERATED_TOKENS_PER_SECOND
+    )
+
+
+def generate_llama_cpp(
+    prompt: str,
+    max_tokens: int = None,
+    prefix: str = None,
+    prefix_files: tuple = (),
+    log_path: str = None,
+    label: str = "",
+    grammar: str = None
+) -> str:
+    """
+    Call Llama.cpp with the given prompt and return the generated text.
+
+    A generation cut off by its timeout keeps what it produced. If that output is
+    unfinished (no closing SEIRModel tag or code fence yet), the prompt plus the
+    partial output is sent again so only the missing tail is generated, up to
+    MAX_RESUMES times. Resumes run without the grammar, which can only match
+    a document from its start.
+    
+    Args:
+        prompt: The input prompt
+        max_tokens: Override default max tokens if specified
+        prefix: Static leading part of the prompt whose KV cache is saved and reused
+        prefix_files: Files the prefix was built from, hashed into the cache key
+        log_path: File streamed tokens are written to as they arrive (STREAM_OUTPUT only)
+        label: Stage name written to the stream log
+        grammar: GBNF grammar constraining the output (see seir_grammar)
+        
+    Returns:
+        str: Generated text from the model, or an "ERROR: ..." message; an unfinished generation's
+        error carries the text generated so far (streaming.partial_output)
+    """
+    cache_key = None
+    if prefix and PROMPT_CACHE_DIR:
+        cache_key = llama_server.prefix_cache_key(prefix, MODEL_PATH, *prefix_files)
+
+    n_predict = max_tokens or GENERATION_PARAMS["n_predict"]
+    output = ""
+    for resume in range(MAX_RESUMES + 1):
+        remaining = n_predict - prompt_compaction.count_tokens(output) if output else n_predict
+        if remaining <= 0:
+            break
+        # Continuing raw completion from the partial output generates only the missing tail
+        full_prompt = prompt + output
+        timeout = generation_timeout(full_prompt, remaining)
+        stage_label = f"{label} (resume {resume})" if resume else label
+        stage_grammar = None if resume else grammar
+        if LLAMA_WORKERS > 1:
+            text, timed_out = get_llama_pool().run(
+                lambda: run_llama_cpp(full_prompt, remaining, prefix, cache_key, log_path, stage_label, timeout, stage_grammar)
+            )
+        else:
+            text, timed_out = run_llama_cpp(full_prompt, remaining, prefix, cache_key, log_path, stage_label, timeout, stage_grammar)
+
+        if text.startswith("ERROR:"):
+            return text
+        output += text
+        # After a resume the closing tag may span the boundary between partial output and continuation
+        stop = streaming.find_stop(output) if resume or timed_out else -1
+        if stop != -1:
+            return output[:stop].strip()
+        if not timed_out:
+            return output.strip()
+        if not text:
+            break
+        print(f"{label}: timed out after {timeout:.0f}s with {len(output)} characters of unfinished output")
+        if resume < MAX_RESUMES:
+            print(f"{label}: resuming the missing tail ({resume + 1}/{MAX_RESUMES})")
+
+    # The unfinished text is still handed back (streaming.partial_output), but as an error so it is never cached
+    return streaming.with_partial_output(
+        f"ERROR: Generation timed out with unfinished output ({len(output)} characters kept after {resume} resumes)",
+        output,
+    )
+
+
+def run_llama_cpp(
+    prompt: str,
+    max_tokens: int,
+    prefix: str,
+    cache_key: str,
+    log_path: str,
+    label: str,
+    timeout: float,
+    grammar: str = None
+) -> tuple:
+    """
+    Run one generation with the configured transport.
+
+    Returns:
+        tuple: (generated text or "ERROR: ..." message, True if it was cut off by the timeout)
+    """
+    if STREAM_OUTPUT:
+        return stream_llama_cpp(prompt, max_tokens, prefix, cache_key, log_path, label, timeout, grammar)
+
+    if USE_LLAMA_SERVER:
+        return call_llama_server(prompt, max_tokens, prefix, cache_key, timeout, grammar)
+
+    cmd = build_llama_cmd(prompt, max_tokens, cache_key, grammar)
     
     try:
-        print(f"Calling Llama.cpp with prompt length: {len(prompt)} characters")
+        print(f"Calling Llama.cpp with prompt length: {len(prompt)} characters (timeout {timeout:.0f}s)")
         
         # Run the command and capture output
         result = subprocess.run(
-            cmd,
+            cmd + ["--no-display-prompt"],
             capture_output=True,
             text=True,
-            timeout=300  # 5 minute timeout
+            timeout=timeout,
+            preexec_fn=pin_to_worker_cores()
         )
         
         if result.returncode != 0:
             error_msg = f"Llama.cpp error: {result.stderr}"
             print(error_msg)
-            return f"ERROR: {error_msg}"
+            return f"ERROR: {error_msg}", False
         
-        # Extract the generated text (llama.cpp outputs prompt + generation)
-        output = result.stdout.strip()
+        return result.stdout, False
+        
+    except subprocess.TimeoutExpired as err:
+        # Captured output is always bytes here, whatever `text` says
+        partial = err.stdout or b""
+        return partial.decode("utf-8", errors="replace") if isinstance(partial, bytes) else partial, True
+    except Exception as e:
+        return f"ERROR: {str(e)}", False
+
+
+def call_llama_server(
+    prompt: str,
+    max_tokens: int = None,
+    prefix: str = None,
+    cache_key: str = None,
+    timeout: float = 300,
+    grammar: str = None
+) -> tuple:
+    """
+    Send the prompt to the persistent llama.cpp server and return the generated text.
+
+    The server itself stops generating after `timeout` seconds (t_max_predict_ms)
+    and returns what it has, so a slow generation is cut off rather than lost.
+    
+    Args:
+        prompt: The input prompt
+        max_tokens: Override default max tokens if specified
+        prefix: Static leading part of the prompt whose KV cache is reused
+        cache_key: Key of the saved prefix cache
+        timeout: Seconds generation may take
+        grammar: GBNF grammar constraining the output (see seir_grammar)
+        
+    Returns:
+        tuple: (generated text or "ERROR: ..." message, True if it was cut off by the timeout)
+    """
+    try:
+        print(f"Calling Llama.cpp server with prompt length: {len(prompt)} characters (timeout {timeout:.0f}s)")
         
-        # Remove the prompt from the output if it's echoed back
-        if output.startswith(prompt):
-            output = output[len(prompt):].strip()
+        server = get_llama_server()
+        params = llama_server.completion_params(GENERATION_PARAMS, max_tokens)
+        params["t_max_predict_ms"] = int(timeout * 1000)
+        if grammar:
+            params["grammar"] = grammar
         
-        return output
+        start = time.monotonic()
+        # The HTTP timeout leaves room for the server to finish the cut-off response
+        text = server.complete(prompt, params, timeout=timeout * 1.5, prefix=prefix, cache_key=cache_key)
+        return text, time.monotonic() - start >= timeout
         
-    except subprocess.TimeoutExpired:
-        return "ERROR: Generation timed out after 5 minutes"
     except Exception as e:
-        return f"ERROR: {str(e)}"
+        return f"ERROR: {str(e)}", False
+
+
+def stream_llama_cli(cmd: list):
+    """
+    Run llama.cpp `main` and yield its output as it is produced.
+
+    Closing the generator kills the process, which stops generation.
+    """
+    process = subprocess.Popen(
+        cmd + ["--no-display-prompt"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        preexec_fn=pin_to_worker_cores(),
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        while True:
+            data = os.read(process.stdout.fileno(), 4096)
+            if not data:
+                break
+            yield decoder.decode(data)
+        yield decoder.decode(b"", final=True)
+        if process.wait() != 0:
+            raise RuntimeError(f"Llama.cpp exited with code {process.returncode}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def stream_llama_cpp(
+    prompt: str,
+    max_tokens: int = None,
+    prefix: str = None,
+    cache_key: str = None,
+    log_path: str = None,
+    label: str = "",
+    timeout: float = 300,
+    grammar: str = None
+) -> tuple:
+    """
+    Stream a generation from Llama.cpp, logging tokens as they arrive.
+
+    Generation stops as soon as the closing SEIRModel tag or code fence is emitted,
+    or when `timeout` runs out, in which case the text streamed so far is kept.
+
+    Returns:
+        tuple: (generated text or "ERROR: ..." message, True if it was cut off by the timeout)
+    """
+    try:
+        print(f"Streaming from Llama.cpp with prompt length: {len(prompt)} characters (timeout {timeout:.0f}s)")
+        
+        if USE_LLAMA_SERVER:
+            params = llama_server.completion_params(GENERATION_PARAMS, max_tokens)
+            if grammar:
+                params["grammar"] = grammar
+            chunks = get_llama_server().stream(prompt, params, timeout=timeout, prefix=prefix, cache_key=cache_key)
+        else:
+            chunks = stream_llama_cli(build_llama_cmd(prompt, max_tokens, cache_key, grammar))
+        
+        result = streaming.collect_stream(chunks, log_path, label, timeout=timeout)
+        return result.text, result.timed_out
+        
+    except Exception as e:
+        return f"ERROR: {str(e)}", False
 
 
 def generate_seirmodel(
@@ -142,12 +714,16 @@ def generate_seirmodel(
     Returns:
         str: A success message with the output file path, or an error message.
     """
-    try:,
-
+    try:
         # Load metamodel specifications
         with open(METAMODEL_FILENAME, "r", encoding="utf-8") as f:
-            lang_specs_json = json.load(f)
-        lang_specs = json.dumps(lang_specs_json, indent=2)
+            metamodel = lang_specs_json = json.load(f)
+        if SLICE_METAMODEL:
+            lang_specs_json = metamodel_slicer.slice_metamodel(lang_specs_json, user_input)
+        if COMPACT_METAMODEL:
+            lang_specs = prompt_compaction.compact_metamodel_text(lang_specs_json, user_input, METAMODEL_FILENAME)
+        else:
+            lang_specs = json.dumps(lang_specs_json, indent=2)
         
         print(f"'{METAMODEL_FILENAME}' loaded successfully.")
 
@@ -161,74 +737,182 @@ def generate_seirmodel(
         return error_msg
 
     # --- Stage 1: Structural generation ---
+    graph = stage_dag.StageGraph(CHECKPOINTS, output_fileName, resume_from_checkpoints())
     separator = "\n" + "*" * 80 + "\n"
+    stream_log = streaming.stream_log_path("prompt_sample", output_fileName) if STREAM_OUTPUT else None
     
-    llm1_input = (
+    # The prompt and metamodel are identical for every model, so they form a cacheable prefix
+    json_output = OUTPUT_FORMAT == "json"
+    llm1_prompt = get_prompt("LLM1_JSON" if json_output else "LLM1")
+    llm1_prefix = (
         f"{separator}"
-        f"PROMPT: \n{LLM1_PROMPT.strip()}\n"
+        f"PROMPT: \n{llm1_prompt.strip()}\n"
         f"{separator}"
         f"METAMODEL: \n{lang_specs.strip()}\n"
+    )
+    llm1_input = (
+        f"{llm1_prefix}"
         f"{separator}"
         f"USER_INPUT: \n{user_input.strip()}\n"
         f"{separator}"
-        f"Generate the SEIR model in XML format based on the above information:"
+        f"Generate the SEIR model in {'JSON' if json_output else 'XML'} format based on the above information:"
     )
 
     print("Generating LLM1 response...")
-    llm1 = call_llama_cpp(llm1_input, max_tokens)
+    llm1_started = time.monotonic()
+    llm1 = graph.run(
+        "llm1",
+        lambda: sample_llama_cpp(
+            "LLM1",
+            llm1_input,
+            lambda response: (seir_json if json_output else seir_validator).validate(response, allow_placeholders=True),
+            max_tokens, llm1_prefix, (METAMODEL_FILENAME,), stream_log, "LLM1 RESPONSE",
+            # A JSON model is always decoded under its grammar, llama.cpp's form of structured output
+            grammar=(
+                seir_json.grammar_for_file(METAMODEL_FILENAME) if json_output
+                else seir_grammar.grammar_for_file(METAMODEL_FILENAME) if USE_GRAMMAR else None
+            ),
+            schema=seir_json.schema_for_file(METAMODEL_FILENAME) if json_output else None,
+        ),
+        inputs=checkpoint_inputs(
+            "LLM1", llm1_input, max_tokens, output_format=OUTPUT_FORMAT, best_of_n=BEST_OF_N, grammar=USE_GRAMMAR
+        ),
+    )
+    llm1_seconds = time.monotonic() - llm1_started
     
     if llm1.startswith("ERROR:"):
         return llm1
     
+    llm1_json = ""
+    if json_output:
+        llm1_json = llm1
+        llm1 = seir_json.convert(llm1_json)
+        if llm1.startswith("ERROR:"):
+            graph.reject("llm1")
+            return llm1
+        print(f"Converted LLM1 JSON model to XML ({len(llm1_json)} characters instead of {len(llm1)})")
+    
     print("LLM1 response generated successfully.")
 
     # --- Stage 2: Refinement ---
-    llm2_input = (
+    # Patch mode edits LLM1's XML, so only full mode answers with a JSON model
+    json_stage2 = json_output and STAGE2_MODE == "full"
+    llm2_prompt = get_prompt("LLM2_PATCH" if STAGE2_MODE == "patch" else "LLM2_JSON" if json_stage2 else "LLM2")
+    llm2_model = seir_json.to_json(seir_json.parse(llm1_json)) if json_stage2 else llm1
+    llm2_prefix = (
         f"{separator}"
-        f"PROMPT:\n{LLM2_PROMPT.strip()}\n"
+        f"PROMPT:\n{llm2_prompt.strip()}\n"
+    )
+    llm2_input = (
+        f"{llm2_prefix}"
         f"{separator}"
         f"USER INPUT:\n{user_input.strip()}\n"
         f"{separator}"
-        f"STRUCTURALLY CORRECT SEIRMODEL FILE:\n{llm1.strip()}\n"
+        f"STRUCTURALLY CORRECT SEIRMODEL FILE:\n{llm2_model.strip()}\n"
         f"{separator}"
     )
 
     print("Generating LLM2 response...")
-    llm2 = call_llama_cpp(llm2_input, max_tokens
+    llm2_started = time.monotonic()
+    llm2 = graph.run(
+        "llm2",
+        lambda: sample_llama_cpp(
+            "LLM2",
+            llm2_input,
+            seir_json.validate if json_stage2 else best_of_n.stage2_validator(llm1, patch=STAGE2_MODE == "patch"),
+            max_tokens, llm2_prefix, log_path=stream_log, label="LLM2 RESPONSE",
+            # Patch mode answers with an edit list, not XML, so only full mode is constrained
+            grammar=(
+                seir_json.grammar_for_file(METAMODEL_FILENAME, allow_placeholders=False) if json_stage2
+                else seir_grammar.grammar_for_file(METAMODEL_FILENAME, allow_placeholders=False)
+                if USE_GRAMMAR and STAGE2_MODE == "full" else None
+            ),
+            schema=seir_json.schema_for_file(METAMODEL_FILENAME, allow_placeholders=False) if json_stage2 else None,
+        ),
+        inputs=checkpoint_inputs(
+            "LLM2", llm2_input, max_tokens, output_format=OUTPUT_FORMAT, best_of_n=BEST_OF_N, grammar=USE_GRAMMAR
+        ),
+        deps=("llm1",),
+    )
+    llm2_seconds = time.monotonic() - llm2_started
     
     if llm2.startswith("ERROR:"):
         return llm2
     
+    llm2_json = ""
+    if json_stage2:
+        llm2_json = llm2
+        llm2 = seir_json.convert(llm2_json)
+        if llm2.startswith("ERROR:"):
+            graph.reject("llm2")
+            return llm2
+        print(f"Converted LLM2 JSON model to XML ({len(llm2_json)} characters instead of {len(llm2)})")
+    
+    llm2_patch = ""
+    if STAGE2_MODE == "patch":
+        llm2_patch = llm2
+        try:
+            llm2 = xml_patch.apply_patch(llm1, llm2_patch)
+        except xml_patch.PatchError as err:
+            error_msg = f"ERROR: Stage 2 patch could not be applied: {err}"
+            print(error_msg)
+            graph.reject("llm2")
+            return error_msg
+        print(f"Applied Stage 2 patch ({len(llm2_patch)} characters instead of {len(llm2)} characters of XML)")
+    
     print("LLM2 response generated successfully.")
     
-    # --- Format and save the output ---
-    output_content = (
-        f"LLM1 PROMPT:\n{LLM1_PROMPT.strip()}"
-        f"{separator}"
-        f"METAMODEL:\n{lang_specs.strip()}"
-        f"{separator}"
-        f"User Input:\n{user_input.strip()}"
-        f"{separator}"
-        f"LLM1 RESPONSE:\n{llm1}"
-        f"{separator}"
-        f"{separator}"
-        f"LLM2 PROMPT:\n{LLM2_PROMPT.strip()}"
-        f"{separator}"
-        f"USER INPUT:\n{user_input}"
-        f"{separator}"
-        f"LLM1'S RESPONSE:\n{llm1}"
-        f"{separator}"
-        f"LLM2'S RESPONSE:\n{llm2}"
-    )
-
+    # --- Self-repair: patch only the elements that break validation rules ---
+    model_xml = seir_xml.extract_xml(llm2)
+    repair_rounds = []
+    issues = seir_validator.validate(llm2) if SELF_REPAIR_ROUNDS else []
+    if self_repair.is_repairable(issues):
+        repair_started = time.monotonic()
+        model_xml, issues, repair_rounds = self_repair.repair(
+            model_xml, issues,
+            lambda prompt: call_stage("LLM2", prompt, max_tokens, log_path=stream_log, label="REPAIR"),
+            get_prompt("REPAIR"), metamodel, SELF_REPAIR_ROUNDS,
+        )
+        repair_seconds = time.monotonic() - repair_started
+        if issues:
+            print(f"{len(issues)} validation issue(s) left after repair:")
+            for issue in issues:
+                print(f"  {issue}")
+    
+    # --- Save the run record ---
+    # Each text is streamed into the archive once; prompts and inputs are referenced by hash (run_artifacts)
+    run_meta = {
+        "backend": "llama_cpp",
+        "routes": {stage: ROUTER.describe(stage) for stage in ("LLM1", "LLM2")},
+        "grammar": USE_GRAMMAR,
+        "output_file": output_fileName,
+        "metamodel": METAMODEL_FILENAME,
+        "stage2_mode": STAGE2_MODE,
+        "output_format": OUTPUT_FORMAT,
+        "best_of_n": BEST_OF_N,
+        "self_repair_rounds": SELF_REPAIR_ROUNDS,
+    }
+    output_file = run_artifacts.record_path("prompt_sample", output_fileName)
     try:
-        # Ensure the output directory exists
-        output_dir = "prompt_sample"
-        os.makedirs(output_dir, exist_ok=True)
-        output_file = os.path.join(output_dir, output_fileName)
-        
-        with open(output_file, "w", encoding="utf-8") as tf:
-            tf.write(output_content)
+        with run_artifacts.RunRecord(output_file, run_meta) as record:
+            record.add("llm1_prompt", llm1_prompt.strip())
+            record.add("metamodel", lang_specs.strip())
+            record.add("user_input", user_input.strip())
+            record.add("llm1_json", llm1_json)
+            record.add("llm1_response", llm1)
+            record.add("llm2_prompt", llm2_prompt.strip())
+            record.add("llm2_patch", llm2_patch)
+            record.add("llm2_json", llm2_json)
+            record.add("llm2_response", llm2)
+            record.add("repair_patch", "\n".join(patch for _, patch in repair_rounds))
+            record.add("model_xml", model_xml)
+            record.add_stage("llm1", llm1_seconds, llm1_input, llm1_json or llm1)
+            record.add_stage("llm2", llm2_seconds, llm2_input, llm2_patch or llm2_json or llm2)
+            if repair_rounds:
+                record.add_stage(
+                    "repair", repair_seconds,
+                    "".join(prompt for prompt, _ in repair_rounds), "\n".join(patch for _, patch in repair_rounds)
+                )
         
         success_msg = f"SEIR model successfully written to {output_file}"
         print(success_msg)
@@ -240,7 +924,7 @@ def generate_seirmodel(
         return error_msg
 
 
-def simulate(ode_equations: str, output_fileName: str, max_tokens: int:None) -> str:
+def simulate(ode_equations: str, output_fileName: str, max_tokens: int = None) -> str:
     """
     Generates a Python simulation script for an ODE model.
 
@@ -254,25 +938,39 @@ def simulate(ode_equations: str, output_fileName: str, max_tokens: int:None) ->
     
     # --- Generate simulation script ---
     separator = "\n" + "*" * 80 + "\n"
+    stream_log = streaming.stream_log_path("simulation_scripts", output_fileName) if STREAM_OUTPUT else None
+    graph = stage_dag.StageGraph(CHECKPOINTS, output_fileName, resume_from_checkpoints())
     
-    simulation_stage3a = (
+    stage3a_prefix = (
         f"{separator}"
-        f"PROMPT:\n{LLM3A_PROMPT.strip()}\n"
+        f"PROMPT:\n{get_prompt('LLM3A').strip()}\n"
+    )
+    simulation_stage3a = (
+        f"{stage3a_prefix}"
         f"{separator}"
         f"ODE_EQUATIONS:\n{ode_equations.strip()}\n"
         f"{separator}"
-        f"Simulation python skeleton file:\n{SIMULATION_SKELETON.strip()}"
+        f"Simulation python skeleton file:\n{get_simulation_skeleton().strip()}"
     )
 
     print("Generating simulation stage3a script...")
-    simulation_script_3a = call_llama_cpp(simulation_input, max_tokens)
+    simulation_script_3a = graph.run(
+        "3a",
+        lambda: call_stage(
+            "LLM3A", simulation_stage3a, max_tokens, stage3a_prefix, log_path=stream_log, label="STAGE 3A"
+        ),
+        inputs=checkpoint_inputs("LLM3A", simulation_stage3a, max_tokens),
+    )
     
     if simulation_script_3a.startswith("ERROR:"):
         return simulation_script_3a
     
-    simulation_stage3b = (
+    stage3b_prefix = (
         f"{separator}"
-        f"PROMPT:\n{LLM3B_PROMPT.strip()}\n"
+        f"PROMPT:\n{get_prompt('LLM3B').strip()}\n"
+    )
+    simulation_stage3b = (
+        f"{stage3b_prefix}"
         f"{separator}"
         f"ODE_EQUATIONS:\n{ode_equations.strip()}\n"
         f"{separator}"
@@ -280,7 +978,18 @@ def simulate(ode_equations: str, output_fileName: str, max_tokens: int:None) ->
     )
 
     print("Generating final simulation stage3b script...")
-    simulation_script = call_llama_cpp(simulation_input, max_tokens)
+    simulation_script = graph.run(
+        "3b",
+        lambda: call_stage(
+            "LLM3B", simulation_stage3b, max_tokens, stage3b_prefix, log_path=stream_log, label="STAGE 3B"
+        ),
+        inputs=checkpoint_inputs("LLM3B", simulation_stage3b, max_tokens),
+        deps=("3a",),
+    )
+    
+    if simulation_script.startswith("ERROR:"):
+        return simulation_script
+    
     print("Simulation script generated successfully.")
     
     # --- Save the output ---
@@ -302,56 +1011,55 @@ def simulate(ode_equations: str, output_fileName: str, max_tokens: int:None) ->
         return error_msg
 
 
-def main():
-    """Main execution function."""
-    
+def main(argv: list = None):
+    """
+    Main execution function.
+
+    Args:
+        argv: Command-line arguments (None for sys.argv); see --help
+    """
+    global RESUME_FROM_CHECKPOINTS
+    args = pipeline_cli.parse_args(
+        argv,
+        "Generate SEIR models and simulation scripts with a local llama.cpp model.",
+        DEFAULT_MODELS,
+        DEFAULT_SIMULATIONS,
+        PROMPT_KEYS
+    )
+    PROMPT_KEYS.update(args.prompts)
+    if args.fresh:
+        RESUME_FROM_CHECKPOINTS = False
+    # Only the selected entries are looked up, and ode.json is not read when no simulation runs
+    seir_jobs = pipeline_cli.load_jobs(args.models, pipeline_cli.MODELS, lambda: load_json_file("models.json"))
+    simulation_jobs = pipeline_cli.load_jobs(
+        args.simulations, pipeline_cli.SIMULATIONS, lambda: load_json_file("ode.json")
+    )
+
     print("\n" + "="*80)
     print("Using Llama.cpp with GPT-OSS 20B")
     print(f"Model path: {MODEL_PATH}")
-    print(f"Llama.cpp path: {LLAMA_CPP_PATH}")
+    if USE_LLAMA_SERVER:
+        print(f"Llama.cpp server: {LLAMA_SERVER_PATH} (port {LLAMA_SERVER_PORT})")
+    else:
+        print(f"Llama.cpp path: {LLAMA_CPP_PATH}")
     print("="*80)
-    
-    # Generate SEIR models
-    print("\n" + "="*80)
-    print("Generating HIV Model...")
-    print("="*80)
-    generate_seirmodel(hivModel, "finalHivModel.txt")
-    
-    time.sleep(BREAK_TIME)  # Brief pause between generations
 
-    print("\n" + "="*80)
-    print("Generating COVID Model...")
-    print("="*80)
-    generate_seirmodel(covidModel, "finalCovidModel.txt"
-    time.sleep(BREAK_TIME)
-
-    # print("\n" + "="*80)
-    # print("Generating Simple SIR Model...")
-    # print("="*80)
-    # generate_seirmodel(simpleModel, "finalSimpleModel.txt")
+    for stage in model_routing.STAGES:
+        hedging = f" (hedged, {HEDGE_DELAY:g}s delay)" if stage in HEDGED_STAGES else ""
+        print(f"{stage}: {ROUTER.describe(stage)}{hedging}")
 
-    # time.sleep(BREAK_TIME)
+    if args.dry_run:
+        pipeline_cli.print_plan(seir_jobs, simulation_jobs, PROMPT_KEYS)
+        return
 
-    # print("\n" + "="*80)
-    # print("Generating Malaria Model...")
-    # print("="*80)
-    # generate_seirmodel(malariaModel, "finalMalariaModel.txt")
-    
-    # NOTE: Only run if the ODE equations are ready in the ode.json and if not then comment the follow 11 lines 
-    time.sleep(BREAK_TIME)
-    print("\n" + "="*80)
-    print("Generating HIV Simulation...")
-    print("="*80)
-    simulate(hiv_ode, "hiv_simulation.py")
-    time.sleep(BREAK_TIME)
-    print("\n" + "="*80)
-    print("Generating HIV Simulation...")
-    print("="*80)
-    simulate(covid_ode, "covid_simulation.py")
-    # time.sleep(BREAK_TIME)
-    # simulate(simple_ode, "simple_simulation.py")
-    # time.sleep(BREAK_TIME)
-    # simulate(malaria_ode, "malaria_simulation.py")
+    if ASYNC_PIPELINE:
+        pipeline_runner.run_concurrently(
+            generate_seirmodel, simulate, seir_jobs, simulation_jobs, MAX_CONCURRENCY
+        )
+    else:
+        pipeline_runner.run_sequentially(
+            generate_seirmodel, simulate, seir_jobs, simulation_jobs, BREAK_TIME
+        )
 
     print("\n" + "="*80)
     print("All tasks completed!")
@@ -359,4 +1067,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,168 @@
+"""
+Compact, structured records of `generate_seirmodel` runs.
+
+The plain-text run log repeated the user input and the LLM1 response and
+pasted the whole metamodel, so one log was 60-127 KB and reading a single
+response back meant scanning all of it. A run record is a zip archive
+(e.g. `prompt_sample/finalHivModel.run.zip`) holding:
+
+* `blobs/<sha256>.txt` - every distinct text once, deflate-compressed. The
+  prompts, metamodel and user input are referenced by this hash, so a text
+  used by both stages (or an LLM2 response that is already bare XML) is
+  stored once.
+* `record.json` - the index: run settings, per-stage timings and token
+  counts, and for every field its blob, length and token count.
+
+Blobs are streamed into the archive as they are added; the index is written
+when the record is closed, and the archive only appears under its final name
+once it is complete. `read_field` reads the index and decompresses just the
+one blob it needs.
+
+    python run_artifacts.py prompt_sample/finalHivModel.run.zip             # list the fields
+    python run_artifacts.py prompt_sample/finalHivModel.run.zip model_xml   # print one field
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import zipfile
+
+import prompt_compaction
+
+
+FORMAT_VERSION = 1
+INDEX_MEMBER = "record.json"
+
+
+def record_path(output_dir: str, output_fileName: str) -> str:
+    """
+    Return the run record path for an output file name.
+
+    For "finalHivModel.txt" in "prompt_sample" this is "prompt_sample/finalHivModel.run.zip".
+    """
+    stem = os.path.splitext(output_fileName)[0]
+    return os.path.join(output_dir, f"{stem}.run.zip")
+
+
+def _blob_member(digest: str) -> str:
+    return f"blobs/{digest}.txt"
+
+
+class RunRecord:
+    """
+    A run record being written. Use as a context manager so the index is always written.
+
+    Args:
+        path: Archive to create; it is written next to it as `<path>.tmp` and renamed on close
+        meta: Run settings stored in the index (backend, model, modes, ...)
+    """
+
+    def __init__(self, path: str, meta: dict = None):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.fields = {}
+        self.stages = {}
+        self.started = time.time()
+        self._blobs = set()
+        self._tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9)
+
+    def add(self, name: str, text: str):
+        """Store a text field. Empty texts are skipped; identical texts share one blob."""
+        if not text:
+            return
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in self._blobs:
+            with self._zip.open(_blob_member(digest), "w") as member:
+                member.write(data)
+            self._blobs.add(digest)
+        self.fields[name] = {"blob": digest, "chars": len(text), "tokens": prompt_compaction.count_tokens(text)}
+
+    def add_stage(self, name: str, seconds: float, prompt: str, response: str):
+        """Record how long a stage took and how many tokens it sent and received."""
+        self.stages[name] = {
+            "seconds": round(seconds, 3),
+            "input_tokens": prompt_compaction.count_tokens(prompt),
+            "output_tokens": prompt_compaction.count_tokens(response),
+        }
+
+    def close(self, status: str = "ok"):
+        """Write the index and move the finished archive into place."""
+        index = {
+            "format": FORMAT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "status": status,
+            "meta": self.meta,
+            "stages": self.stages,
+            "fields": self.fields,
+        }
+        self._zip.writestr(INDEX_MEMBER, json.dumps(index, indent=2, ensure_ascii=False))
+        self._zip.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close("ok" if exc_type is None else f"error: {exc}")
+        return False
+
+
+def read_index(path: str) -> dict:
+    """Return the index (record.json) of a run record."""
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read(INDEX_MEMBER).decode("utf-8"))
+
+
+def read_field(path: str, name: str) -> str:
+    """
+    Read one field of a run record without decompressing the others.
+
+    Args:
+        path: Run record archive
+        name: Field name, e.g. "llm1_response", "model_xml" or "user_input"
+
+    Returns:
+        str: The field's text
+
+    Raises:
+        KeyError: If the record has no such field
+    """
+    with zipfile.ZipFile(path) as archive:
+        fields = json.loads(archive.read(INDEX_MEMBER).decode("utf-8"))["fields"]
+        if name not in fields:
+            raise KeyError(f"'{path}' has no field '{name}' (fields: {', '.join(fields)})")
+        return archive.read(_blob_member(fields[name]["blob"])).decode("utf-8")
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Show the fields of a run record or print one of them.")
+    parser.add_argument("path", help="Run record, e.g. prompt_sample/finalHivModel.run.zip")
+    parser.add_argument("field", nargs="?", help="Field to print; lists the fields when omitted")
+    args = parser.parse_args(argv)
+
+    if args.field:
+        try:
+            print(read_field(args.path, args.field))
+        except KeyError as err:
+            parser.exit(1, f"ERROR: {err.args[0]}\n")
+        return
+
+    index = read_index(args.path)
+    print(f"{args.path}: created {index['created']}, status {index['status']}")
+    for key, value in index["meta"].items():
+        print(f"  {key}: {value}")
+    for name, stage in index["stages"].items():
+        print(
+            f"  {name}: {stage['seconds']:.1f}s, "
+            f"{stage['input_tokens']} input tokens, {stage['output_tokens']} output tokens"
+        )
+    for name, field in index["fields"].items():
+        print(f"  {name:<16} {field['chars']:>8} characters {field['tokens']:>7} tokens  {field['blob'][:12]}")
+
+
+if __name__ == "__main__":
+    main()
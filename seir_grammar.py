@@ -0,0 +1,181 @@
+"""
+GBNF decoding grammar for SEIRModel XML, generated from the metamodel.
+
+llama.cpp can constrain sampling with a GBNF grammar so that every
+generation is well-formed. `build_grammar` reads the `structure` section of
+metamodel.json or compartmental_metamodel.json and emits rules for the
+`seir:SEIRModel` element tree: the fixed root attributes, each element with
+the attributes the metamodel lists for it (each at most once, in the
+metamodel's order), RateFlow/ContactFlow selected by
+`xsi:type`, numeric values, enumerated values, and `//@compartments.X`,
+`//@parameters.X`, `//@products.X`, `//@groups.X` references. Markdown fences
+and prose around the XML are impossible under the grammar.
+
+Index ranges are not known in advance, so references are only checked for
+their format; seir_validator still checks that they point at existing elements.
+"""
+import hashlib
+import json
+import re
+
+
+# Elements that may appear directly under seir:SEIRModel, in the metamodel's order
+TOP_LEVEL_ELEMENTS = ("parameters", "compartments", "birthSources", "deathSinks", "groups", "products")
+
+REFERENCE_ATTRIBUTES = {
+    "target": "compartments",
+    "contactCompartment": "compartments",
+    "targetCompartment": "compartments",
+    "sourceCompartment": "compartments",
+    "rateParameter": "parameters",
+    "contactRateParameter": "parameters",
+    "multiplierParameter": "parameters",
+    "product": "products",
+    "href": "groups",
+}
+
+NUMERIC_ATTRIBUTES = (
+    "rate", "contactRate", "multiplier", "population",
+    "totalPopulation", "globalBirthRate", "globalDeathRate",
+    "maxDensity", "criticalDensity", "maxThroughput", "maxDemand", "omega", "capacityDropFactor",
+)
+
+PLACEHOLDER = "[[rate_missing]]"
+
+COMMON_RULES = r'''
+ws ::= [ \t\n]*
+ws1 ::= [ \t\n]+
+index ::= "0" | [1-9] [0-9]*
+number ::= "-"? [0-9]+ ("." [0-9]+)? ([eE] [-+]? [0-9]+)?
+entity ::= "&" ("amp" | "lt" | "gt" | "quot" | "apos") ";"
+string ::= "\"" ([^"<&] | entity)* "\""
+text ::= ([^<&] | entity)*
+comment ::= "<!--" ([^-] | "-" [^-])* "-->"
+'''
+
+
+def _literal(text: str) -> str:
+    """Quote text as a GBNF string literal."""
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _rule_name(name: str) -> str:
+    """Turn a metamodel key (e.g. "stratumSpecificRates") into a GBNF rule name."""
+    return re.sub(r"(?<!^)(?=[A-Z])", "-", name).lower()
+
+
+def attribute_names(spec: dict, inherited: dict = None) -> list:
+    """List every attribute the metamodel allows on an element, in first-mention order."""
+    names = []
+    sources = [inherited or {}, spec] + list((spec.get("modeling_modes") or {}).values())
+    for source in sources:
+        for key in ("common_required_attributes", "required_attributes", "common_optional_attributes", "optional_attributes"):
+            names += source.get(key, [])
+    names += list((spec.get("attributes") or {}).keys())
+    return list(dict.fromkeys(name for name in names if name != "xsi:type"))
+
+
+def _value_rule(name: str, spec: dict, allow_placeholders: bool) -> str:
+    """Return the GBNF expression for one attribute's quoted value."""
+    if name in REFERENCE_ATTRIBUTES:
+        return f'"\\"//@{REFERENCE_ATTRIBUTES[name]}." index "\\""'
+    if name == "groups":
+        return '"\\"//@groups." index (" //@groups." index)* "\\""'
+    values = (spec.get("attributes") or {}).get(name)
+    if isinstance(values, dict) and values.get("values"):
+        choices = " | ".join(_literal(value) for value in values["values"])
+        return f'"\\"" ({choices}) "\\""'
+    if name in NUMERIC_ATTRIBUTES:
+        if allow_placeholders:
+            return f'"\\"" (number | {_literal(PLACEHOLDER)}) "\\""'
+        return '"\\"" number "\\""'
+    return "string"
+
+
+def build_grammar(metamodel: dict, allow_comments: bool = True, allow_placeholders: bool = True) -> str:
+    """
+    Build a GBNF grammar for SEIRModel XML from a metamodel.
+
+    Args:
+        metamodel: Parsed metamodel.json or compartmental_metamodel.json
+        allow_comments: Allow XML comments before the root element and between elements (the prompts ask for
+            reasoning comments)
+        allow_placeholders: Allow [[rate_missing]] in numeric attributes (Stage 1 output)
+
+    Returns:
+        str: The grammar, with `root` as the start rule
+    """
+    body = next(iter(metamodel.values()))
+    structure = body["structure"]
+    flows = structure.get("outgoingFlows", {})
+    rules = []
+
+    def element_rule(rule, tag, spec, attributes, children, fixed=""):
+        # One optional slot per attribute, in a fixed order, so no attribute can be written twice
+        attribute_rule = f"{rule}-attrs"
+        slots = " ".join(
+            f"(ws1 {_literal(name + '=')} {_value_rule(name, spec, allow_placeholders)})?" for name in attributes
+        )
+        rules.append(f"{attribute_rule} ::= {slots}" if slots else f'{attribute_rule} ::= ""')
+        head = f"{_literal('<' + tag)}{fixed} {attribute_rule} ws"
+        if children:
+            child_rule = f"{rule}-child"
+            rules.append(f"{child_rule} ::= " + " | ".join(children + (["comment"] if allow_comments else [])))
+            rules.append(f'{rule} ::= {head} ("/>" | ">" (ws {child_rule})* ws {_literal("</" + tag + ">")})')
+        else:
+            rules.append(f'{rule} ::= {head} "/>"')
+
+    def children_of(spec):
+        children = []
+        for child in spec.get("child_elements", []):
+            if child == "outgoingFlows":
+                children += [_rule_name(flow_type) for flow_type in flows.get("concrete_types", []) if flow_type in structure]
+            elif child == "values":
+                children.append("values")
+            elif child in structure:
+                children.append(_rule_name(child))
+        return children
+
+    for key, spec in structure.items():
+        if not isinstance(spec, dict) or "element" not in spec:
+            continue
+        rule = _rule_name(key)
+        inherited = flows if spec.get("xsi_type") else None
+        fixed = " ws1 " + _literal('xsi:type="%s"' % spec["xsi_type"]) if inherited else ""
+        attributes = attribute_names(spec, inherited)
+        if key == "groups":
+            attributes.append("href")  # groups nested in products may point to a top-level group
+        if key == "products":
+            attributes.append("groups")
+        element_rule(rule, spec["element"], spec, attributes, children_of(spec), fixed)
+
+    rules.append('values ::= "<values>" text "</values>"')
+
+    root = structure["root_element"]
+    fixed = "".join(
+        " ws1 " + _literal('%s="%s"' % (name, value)) for name, value in root.get("attributes", {}).items()
+    )
+    element_rule("model", root["tag"], root, root.get("optional_attributes", []),
+                 [_rule_name(name) for name in TOP_LEVEL_ELEMENTS if name in structure], fixed)
+
+    declaration = structure.get("xml_declaration", {})
+    xml_declaration = _literal(
+        f'<?xml version="{declaration.get("version", "1.0")}" encoding="{declaration.get("encoding", "UTF-8")}"?>'
+    )
+    # The prompts ask for reasoning comments at the top; after the declaration they keep the document well-formed
+    leading_comments = " (comment ws)*" if allow_comments else ""
+    start = f"root ::= ws ({xml_declaration} ws)?{leading_comments} model ws"
+    return "\n".join([start] + rules) + "\n" + COMMON_RULES.strip() + "\n"
+
+
+_grammar_cache = {}
+
+
+def grammar_for_file(metamodel_path: str, allow_comments: bool = True, allow_placeholders: bool = True) -> str:
+    """Build (once per file content and options) the grammar for a metamodel JSON file."""
+    with open(metamodel_path, "rb") as f:
+        data = f.read()
+    key = (hashlib.sha256(data).hexdigest(), allow_comments, allow_placeholders)
+    if key not in _grammar_cache:
+        _grammar_cache[key] = build_grammar(json.loads(data), allow_comments, allow_placeholders)
+    return _grammar_cache[key]
@@ -0,0 +1,357 @@
+"""
+Compact JSON representation of SEIRModel XML.
+
+Instead of XMI-style XML, Stages 1 and 2 can answer with a JSON object that
+mirrors the element tree: each element is an object keyed by its attribute
+names, and child elements are arrays under the child element name. Flows carry
+`"type": "RateFlow"` instead of `xsi:type="seir:RateFlow"`, references are
+0-based integers (`"target": 3` instead of `target="//@compartments.3"`), and
+there are no namespace declarations or indentation. `to_xml` writes the exact
+layout the metamodel specifies, so everything after Stage 2 still sees XML:
+
+    {"compartments": [{"PrimaryName": "S", "outgoingFlows": [{"type": "RateFlow", "rate": "0.1", "target": 1}]},
+                      {"PrimaryName": "I"}]}
+
+`build_schema` derives the JSON Schema for the backends' structured-output
+modes from the metamodel `structure` section, and `build_grammar` turns that
+schema into a GBNF grammar for llama.cpp.
+"""
+import hashlib
+import json
+import re
+from xml.sax.saxutils import escape
+
+import seir_grammar
+import seir_validator
+import seir_xml
+
+
+ROOT_ATTRIBUTES = {"xmi:version": "2.0"}
+ROOT_ATTRIBUTES.update({f"xmlns:{prefix}": uri for prefix, uri in seir_xml.NAMESPACES.items()})
+
+NUMBER_PATTERN = r"^-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?$"
+PLACEHOLDER_NUMBER_PATTERN = r"^(-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?|\[\[rate_missing\]\])$"
+# Schema keys the Gemini API's response_schema does not accept
+GEMINI_UNSUPPORTED_KEYS = ("pattern",)
+
+REFERENCE = re.compile(r"^//@(\w+)\.(\d+)$")
+# Characters XML 1.0 does not allow anywhere in a document (JSON strings can carry them as escapes)
+XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+GRAMMAR_RULES = r'''
+ws ::= [ \t\n]*
+index ::= "0" | [1-9] [0-9]*
+number ::= "-"? [0-9]+ ("." [0-9]+)? ([eE] [-+]? [0-9]+)?
+char ::= [^"\\\x7F\x00-\x1F] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F])
+string ::= "\"" char* "\""
+'''
+PATTERN_RULES = {
+    NUMBER_PATTERN: '"\\"" number "\\""',
+    PLACEHOLDER_NUMBER_PATTERN: '"\\"" (number | "[[rate_missing]]") "\\""',
+}
+
+
+def _value_schema(name: str, spec: dict, allow_placeholders: bool) -> dict:
+    """Return the schema of one attribute's value."""
+    if name in seir_grammar.REFERENCE_ATTRIBUTES:
+        return {"type": "integer", "description": f"0-based index into {seir_grammar.REFERENCE_ATTRIBUTES[name]}"}
+    values = (spec.get("attributes") or {}).get(name)
+    if isinstance(values, dict) and values.get("values"):
+        return {"type": "string", "enum": list(values["values"])}
+    if name in seir_grammar.NUMERIC_ATTRIBUTES:
+        return {"type": "string", "pattern": PLACEHOLDER_NUMBER_PATTERN if allow_placeholders else NUMBER_PATTERN}
+    return {"type": "string"}
+
+
+def build_schema(metamodel: dict, allow_placeholders: bool = True) -> dict:
+    """
+    Build the JSON Schema of the compact model from a metamodel.
+
+    Args:
+        metamodel: Parsed metamodel.json or compartmental_metamodel.json
+        allow_placeholders: Allow [[rate_missing]] in numeric attributes (Stage 1 output)
+
+    Returns:
+        dict: Schema of the top-level JSON object
+    """
+    body = next(iter(metamodel.values()))
+    structure = body["structure"]
+    flows = structure.get("outgoingFlows", {})
+    flow_types = [name for name in flows.get("concrete_types", []) if name in structure]
+
+    def element_schema(specs, inherited=None, required=(), extra=None):
+        properties = dict(extra or {})
+        children = []
+        for spec in specs:
+            for name in seir_grammar.attribute_names(spec, inherited):
+                properties.setdefault(name, _value_schema(name, spec, allow_placeholders))
+            children += [child for child in spec.get("child_elements", []) if child not in children]
+        for child in children:
+            if child == "outgoingFlows":
+                properties[child] = {"type": "array", "items": flow_schema()}
+            elif child == "values":
+                properties[child] = {"type": "array", "items": {"type": "string"}}
+            elif child in structure:
+                extra = {"href": _value_schema("href", {}, allow_placeholders)} if child == "groups" else None
+                properties[child] = {"type": "array", "items": element_schema([structure[child]], extra=extra)}
+        required = list(dict.fromkeys(list(required) + [
+            name for spec in specs for name in spec.get("required_attributes", []) if name in properties
+        ]))
+        schema = {"type": "object", "properties": properties}
+        if required:
+            schema["required"] = required
+        return schema
+
+    def flow_schema():
+        return element_schema(
+            [structure[name] for name in flow_types],
+            inherited=flows,
+            required=["type"] + flows.get("common_required_attributes", []),
+            extra={"type": {"type": "string", "enum": flow_types}},
+        )
+
+    root = structure["root_element"]
+    properties = {"notes": {"type": "array", "items": {"type": "string"}, "description": "Reasoning, written as XML comments"}}
+    for name in root.get("optional_attributes", []):
+        properties[name] = _value_schema(name, root, allow_placeholders)
+    for name in seir_grammar.TOP_LEVEL_ELEMENTS:
+        if name in structure:
+            properties[name] = {"type": "array", "items": element_schema([structure[name]])}
+    return {"type": "object", "properties": properties, "required": ["compartments"]}
+
+
+def for_gemini(schema):
+    """Return a copy of a schema in the form Gemini's response_schema accepts (no patterns, enums marked by format)."""
+    if isinstance(schema, dict):
+        converted = {key: for_gemini(value) for key, value in schema.items() if key not in GEMINI_UNSUPPORTED_KEYS}
+        if "enum" in converted:
+            converted["format"] = "enum"
+        return converted
+    if isinstance(schema, list):
+        return [for_gemini(value) for value in schema]
+    return schema
+
+
+def build_grammar(schema: dict) -> str:
+    """
+    Turn a schema from `build_schema` into a GBNF grammar for llama.cpp.
+
+    Properties may appear in any order and required properties are not
+    enforced; the converted XML is still checked by seir_validator.
+
+    Returns:
+        str: The grammar, with `root` as the start rule
+    """
+    rules = []
+
+    def rule(name, node):
+        if "enum" in node:
+            return "(" + " | ".join(json.dumps(json.dumps(value)) for value in node["enum"]) + ")"
+        if node.get("type") == "integer":
+            return "index"
+        if node.get("type") == "string":
+            return PATTERN_RULES.get(node.get("pattern"), "string")
+        if node.get("type") == "array":
+            item = rule(f"{name}-item", node["items"])
+            rules.append(f'{name} ::= "[" ws ({item} (ws "," ws {item})*)? ws "]"')
+            return name
+        pairs = []
+        for key, value in node["properties"].items():
+            pairs.append(f'{json.dumps(json.dumps(key))} ws ":" ws {rule(name + "-" + re.sub(r"[^a-z0-9]+", "-", key.lower()), value)}')
+        rules.append(f"{name}-kv ::= " + " | ".join(pairs))
+        rules.append(f'{name} ::= "{{" ws ({name}-kv (ws "," ws {name}-kv)*)? ws "}}"')
+        return name
+
+    start = rule("model", schema)
+    return "\n".join([f"root ::= ws {start} ws"] + rules) + "\n" + GRAMMAR_RULES.strip() + "\n"
+
+
+_schema_cache = {}
+
+
+def _cached(metamodel_path: str, kind: str, allow_placeholders: bool):
+    with open(metamodel_path, "rb") as f:
+        data = f.read()
+    key = (hashlib.sha256(data).hexdigest(), kind, allow_placeholders)
+    if key not in _schema_cache:
+        schema = build_schema(json.loads(data), allow_placeholders)
+        _schema_cache[key] = build_grammar(schema) if kind == "grammar" else schema
+    return _schema_cache[key]
+
+
+def schema_for_file(metamodel_path: str, allow_placeholders: bool = True) -> dict:
+    """Build (once per file content and options) the schema for a metamodel JSON file."""
+    return _cached(metamodel_path, "schema", allow_placeholders)
+
+
+def grammar_for_file(metamodel_path: str, allow_placeholders: bool = True) -> str:
+    """Build (once per file content and options) the GBNF grammar for a metamodel JSON file."""
+    return _cached(metamodel_path, "grammar", allow_placeholders)
+
+
+def parse(response: str) -> dict:
+    """
+    Return the JSON model contained in an LLM response.
+
+    Raises:
+        ValueError: If the response holds no JSON object
+    """
+    match = JSON_OBJECT.search(response)
+    if not match:
+        raise ValueError("Response contains no JSON object")
+    model = json.loads(match.group(0))
+    if not isinstance(model, dict):
+        raise ValueError("JSON model must be an object")
+    return model
+
+
+def to_json(model: dict) -> str:
+    """Serialize a JSON model on one line without spaces, as the prompts ask the LLM to."""
+    return json.dumps(model, ensure_ascii=False, separators=(",", ":"))
+
+
+def _attribute_value(name: str, value) -> str:
+    if isinstance(value, list):
+        if not all(isinstance(index, int) and not isinstance(index, bool) and index >= 0 for index in value):
+            raise ValueError(f"'{name}' must be a list of indices")
+        return " ".join(f"//@{name}.{index}" for index in value)
+    if name in seir_grammar.REFERENCE_ATTRIBUTES:
+        if isinstance(value, str):
+            return value  # An XMI path written out in full; seir_validator checks its format
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"'{name}' must be a 0-based index, got {value!r}")
+        return f"//@{seir_grammar.REFERENCE_ATTRIBUTES[name]}.{value}"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float, str)):
+        return str(value)
+    raise ValueError(f"'{name}' has unsupported value {value!r}")
+
+
+def _xml_text(value: str, quote: bool = False) -> str:
+    """Escape text for an XML attribute (quote=True) or element, dropping characters XML cannot hold."""
+    text = XML_ILLEGAL.sub("", str(value))
+    return escape(text, {'"': "&quot;"}) if quote else escape(text)
+
+
+def _write_element(tag: str, data: dict, depth: int, lines: list):
+    if not isinstance(data, dict):
+        raise ValueError(f"<{tag}> must be a JSON object, got {data!r}")
+    indent = "  " * depth
+    attributes, children = [], []
+    if tag == "outgoingFlows" and data.get("type"):
+        attributes.append(("xsi:type", f"seir:{data['type']}"))
+    for key, value in data.items():
+        if tag == "outgoingFlows" and key == "type" or value is None or value == []:
+            continue
+        if isinstance(value, list) and (key == "values" or any(isinstance(item, dict) for item in value)):
+            children.append((key, value))
+        else:
+            attributes.append((key, _attribute_value(key, value)))
+
+    head = indent + "<" + " ".join([tag] + [f'{name}="{_xml_text(value, quote=True)}"' for name, value in attributes])
+    if not children:
+        lines.append(head + "/>")
+        return
+    lines.append(head + ">")
+    for key, items in children:
+        for item in items:
+            if key == "values":
+                lines.append(f"{indent}  <values>{_xml_text(item)}</values>")
+            else:
+                _write_element(key, item, depth + 1, lines)
+    lines.append(f"{indent}</{tag}>")
+
+
+def to_xml(model: dict) -> str:
+    """
+    Serialize a JSON model to SEIRModel XML in the metamodel's layout.
+
+    Raises:
+        ValueError: If the model does not have the expected shape
+    """
+    attributes = dict(ROOT_ATTRIBUTES)
+    elements = {}
+    for key, value in model.items():
+        if key == "notes" or value is None:
+            continue
+        if isinstance(value, list):
+            elements[key] = value
+        else:
+            attributes[key] = _attribute_value(key, value)
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>']
+    lines.append("<seir:SEIRModel " + " ".join(f'{name}="{_xml_text(value, quote=True)}"' for name, value in attributes.items()) + ">")
+    for note in model.get("notes") or []:
+        lines.append(f"  <!-- {XML_ILLEGAL.sub('', str(note)).replace('--', '- -')} -->")
+    order = [name for name in seir_grammar.TOP_LEVEL_ELEMENTS if name in elements]
+    for name in order + [name for name in elements if name not in order]:
+        for item in elements[name]:
+            _write_element(name, item, 1, lines)
+    lines.append("</seir:SEIRModel>")
+    return "\n".join(lines) + "\n"
+
+
+def _local_name(name: str) -> str:
+    return name.rsplit("}", 1)[-1]
+
+
+def _read_element(element) -> dict:
+    data = {}
+    if seir_xml.XSI_TYPE in element.attrib:
+        data["type"] = element.attrib[seir_xml.XSI_TYPE].split(":")[-1]
+    for name, value in element.attrib.items():
+        name = _local_name(name)
+        if name == "type" and "type" in data:
+            continue
+        match = REFERENCE.match(value)
+        if name in seir_grammar.REFERENCE_ATTRIBUTES and match:
+            data[name] = int(match.group(2))
+        elif name == "groups" and value.startswith("//@groups."):
+            data[name] = [int(ref.rsplit(".", 1)[1]) for ref in value.split()]
+        else:
+            data[name] = value
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+        tag = _local_name(child.tag)
+        data.setdefault(tag, []).append((child.text or "").strip() if tag == "values" else _read_element(child))
+    return data
+
+
+def from_xml(xml_text: str) -> dict:
+    """
+    Convert SEIRModel XML to a JSON model (comments are dropped).
+
+    Raises:
+        xml.etree.ElementTree.ParseError: If the XML is malformed
+    """
+    root = seir_xml.parse(xml_text)
+    model = _read_element(root)
+    model.pop("version", None)  # xmi:version is written by to_xml
+    return model
+
+
+def convert(response: str) -> str:
+    """
+    Turn a JSON-model LLM response into SEIRModel XML.
+
+    Returns:
+        str: The XML document, or an "ERROR: ..." message if the response is not a usable JSON model
+    """
+    try:
+        return to_xml(parse(response))
+    except ValueError as err:
+        error_msg = f"ERROR: JSON model could not be converted to XML: {err}"
+        print(error_msg)
+        return error_msg
+
+
+def validate(response: str, allow_placeholders: bool = False) -> list:
+    """Convert a JSON-model response to XML and check it with seir_validator."""
+    try:
+        xml_text = to_xml(parse(response))
+    except ValueError as err:
+        return [seir_validator.Issue("well_formed", f"JSON model could not be converted to XML: {err}")]
+    return seir_validator.validate(xml_text, allow_placeholders)
@@ -0,0 +1,218 @@
+"""
+Local structural validator for generated SEIRModel XML.
+
+Checks a response against the metamodel's `validation_rules` that can be
+decided from the XML alone: well-formedness, the root element, unique
+compartments and parameters, `//@compartments.X` / `//@parameters.X` /
+`//@products.X` / `//@groups.X` references, flow types, ContactFlow
+attributes, numeric rate formats and stratum names. Each problem is reported
+as an Issue named after the rule it breaks, so the rule text can be looked up
+in the metamodel.
+
+LLM1 leaves `[[rate_missing]]` in numeric attributes on purpose; pass
+`allow_placeholders=True` when validating Stage 1 output.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+import seir_xml
+
+
+FLOW_TYPES = ("seir:RateFlow", "seir:ContactFlow")
+NUMERIC_ATTRIBUTES = ("rate", "contactRate", "multiplier", "population")
+PARAMETER_ATTRIBUTES = ("rateParameter", "contactRateParameter", "multiplierParameter")
+COMPARTMENT_ATTRIBUTES = ("target", "contactCompartment", "targetCompartment", "sourceCompartment")
+REFERENCE = re.compile(r"^//@(\w+)\.(\d+)$")
+PLACEHOLDER = "[[rate_missing]]"
+
+
+class Issue:
+    """One broken validation rule at one element."""
+
+    def __init__(self, rule: str, message: str, path: str = "/"):
+        self.rule = rule
+        self.message = message
+        self.path = path
+
+    def __repr__(self):
+        return f"Issue({self.rule!r}, {self.message!r}, {self.path!r})"
+
+    def __str__(self):
+        return f"[{self.rule}] {self.path}: {self.message}"
+
+
+def _check_reference(issues, rule, path, attribute, value, kind, count):
+    match = REFERENCE.match(value.strip())
+    if not match or match.group(1) != kind:
+        issues.append(Issue("reference_consistency", f"{attribute}='{value}' must use the format '//@{kind}.X'", path))
+    elif int(match.group(2)) >= count:
+        issues.append(Issue(rule, f"{attribute}='{value}' refers to a missing element ({count} {kind} exist)", path))
+
+
+def _is_float(value: str) -> bool:
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def validate_tree(root: ET.Element, allow_placeholders: bool = False) -> list:
+    """
+    Validate a parsed SEIRModel tree.
+
+    Args:
+        root: The seir:SEIRModel element
+        allow_placeholders: Accept [[rate_missing]] in numeric attributes (Stage 1 output)
+
+    Returns:
+        list: Issue objects; empty if every rule passes
+    """
+    issues = []
+    if root.tag != seir_xml.ROOT_TAG:
+        issues.append(Issue("structure", f"Root element must be seir:SEIRModel, found '{root.tag}'"))
+
+    compartments = root.findall("compartments")
+    parameters = root.findall("parameters")
+    products = root.findall("products")
+    groups = root.findall("groups")
+    group_values = [[value.text or "" for value in group.findall("values")] for group in groups]
+
+    seen_parameters = {}
+    for index, parameter in enumerate(parameters):
+        path = f"//@parameters.{index}"
+        name = parameter.get("name")
+        if not name:
+            issues.append(Issue("parameter_references", "Parameter has no name", path))
+        elif name in seen_parameters:
+            issues.append(Issue("parameter_uniqueness", f"Parameter name '{name}' is also used by //@parameters.{seen_parameters[name]}", path))
+        else:
+            seen_parameters[name] = index
+
+    for index, product in enumerate(products):
+        for reference in (product.get("groups") or "").split():
+            _check_reference(issues, "reference_consistency", f"//@products.{index}", "groups", reference, "groups", len(groups))
+
+    seen_compartments = {}
+    for index, compartment in enumerate(compartments):
+        path = f"//@compartments.{index}"
+        key = (compartment.get("PrimaryName"), compartment.get("SecondaryName"))
+        if key[0] is None:
+            issues.append(Issue("compartment_uniqueness", "Compartment has no PrimaryName", path))
+        elif key in seen_compartments:
+            issues.append(Issue("compartment_uniqueness", f"(PrimaryName, SecondaryName) {key} repeats //@compartments.{seen_compartments[key]}", path))
+        else:
+            seen_compartments[key] = index
+
+        strata = None
+        if compartment.get("product"):
+            _check_reference(issues, "reference_consistency", path, "product", compartment.get("product"), "products", len(products))
+            match = REFERENCE.match(compartment.get("product"))
+            if match and match.group(1) == "products" and int(match.group(2)) < len(products):
+                strata = _product_strata(products[int(match.group(2))], group_values)
+
+        for flow_index, flow in enumerate(compartment.findall("outgoingFlows")):
+            issues.extend(_validate_flow(flow, f"{path}/@outgoingFlows.{flow_index}", len(compartments), len(parameters), strata, allow_placeholders))
+
+    for collection, endpoint in (("birthSources", "targetCompartment"), ("deathSinks", "sourceCompartment")):
+        for index, element in enumerate(root.findall(collection)):
+            path = f"//@{collection}.{index}"
+            if not element.get(endpoint):
+                issues.append(Issue("index_consistency", f"{collection} element has no {endpoint}", path))
+            if element.get("rate") is None and element.get("rateParameter") is None:
+                issues.append(Issue("rate_format_numeric", "Needs a rate or rateParameter", path))
+            issues.extend(_validate_attributes(element, path, len(compartments), len(parameters), allow_placeholders))
+
+    return issues
+
+
+def _product_strata(product: ET.Element, group_values: list) -> set:
+    """Collect the stratum names of a product's groups, given by reference or nested inline."""
+    references = (product.get("groups") or "").split()
+    strata = set()
+    for group in product.findall("groups"):
+        if group.get("href"):
+            references.append(group.get("href"))
+        strata.update(value.text or "" for value in group.findall("values"))
+    for reference in references:
+        match = REFERENCE.match(reference)
+        if match and int(match.group(2)) < len(group_values):
+            strata.update(group_values[int(match.group(2))])
+    return strata
+
+
+def _validate_attributes(element, path, n_compartments, n_parameters, allow_placeholders) -> list:
+    issues = []
+    for attribute in COMPARTMENT_ATTRIBUTES:
+        if element.get(attribute) is not None:
+            _check_reference(issues, "index_consistency", path, attribute, element.get(attribute), "compartments", n_compartments)
+    for attribute in PARAMETER_ATTRIBUTES:
+        if element.get(attribute) is not None:
+            _check_reference(issues, "parameter_references", path, attribute, element.get(attribute), "parameters", n_parameters)
+    for attribute in NUMERIC_ATTRIBUTES:
+        value = element.get(attribute)
+        if value is not None and not _is_float(value) and not (allow_placeholders and value == PLACEHOLDER):
+            issues.append(Issue("rate_format_numeric", f"{attribute}='{value}' is not a number", path))
+    return issues
+
+
+def _validate_flow(flow, path, n_compartments, n_parameters, strata, allow_placeholders) -> list:
+    issues = []
+    flow_type = flow.get(seir_xml.XSI_TYPE)
+    if flow_type not in FLOW_TYPES:
+        issues.append(Issue("flow_type_consistency", f"xsi:type='{flow_type}' must be one of {', '.join(FLOW_TYPES)}", path))
+    if flow.get("target") is None:
+        issues.append(Issue("index_consistency", "Flow has no target", path))
+    if flow_type == "seir:ContactFlow":
+        if flow.get("contactCompartment") is None:
+            issues.append(Issue("contact_flow_validation", "ContactFlow has no contactCompartment", path))
+        if flow.get("contactRate") is None and flow.get("contactRateParameter") is None:
+            issues.append(Issue("contact_flow_validation", "ContactFlow needs contactRate or contactRateParameter", path))
+    elif flow_type == "seir:RateFlow" and flow.get("rate") is None and flow.get("rateParameter") is None:
+        issues.append(Issue("rate_format_numeric", "RateFlow needs rate or rateParameter", path))
+    issues.extend(_validate_attributes(flow, path, n_compartments, n_parameters, allow_placeholders))
+
+    for index, stratum_rate in enumerate(flow.findall("stratumSpecificRates")):
+        stratum_path = f"{path}/@stratumSpecificRates.{index}"
+        stratum = stratum_rate.get("stratum")
+        if strata is not None and stratum not in strata:
+            issues.append(Issue("stratum_validation", f"stratum='{stratum}' is not a value of the compartment's product groups", stratum_path))
+        issues.extend(_validate_attributes(stratum_rate, stratum_path, n_compartments, n_parameters, allow_placeholders))
+    return issues
+
+
+def validate(response: str, allow_placeholders: bool = False) -> list:
+    """
+    Validate the SEIRModel XML contained in an LLM response.
+
+    Args:
+        response: Raw LLM response or bare XML
+        allow_placeholders: Accept [[rate_missing]] in numeric attributes (Stage 1 output)
+
+    Returns:
+        list: Issue objects; empty if every rule passes
+    """
+    xml_text = seir_xml.extract_xml(response)
+    if xml_text is None:
+        return [Issue("well_formed", "No <seir:SEIRModel> document found")]
+    try:
+        root = seir_xml.parse(xml_text)
+    except ET.ParseError as err:
+        return [Issue("well_formed", f"XML is not well-formed: {err}")]
+    return validate_tree(root, allow_placeholders)
+
+
+def score(issues: list) -> float:
+    """Higher is better: 0 for a fully valid model, minus one per issue, -1000 if the XML is unusable."""
+    if any(issue.rule == "well_formed" for issue in issues):
+        return -1000.0
+    return -float(len(issues))
+
+
+def rule_text(metamodel: dict, rule: str) -> str:
+    """Return the metamodel's description of a validation rule, or an empty string."""
+    for body in metamodel.values():
+        rules = body.get("validation_rules", {}) if isinstance(body, dict) else {}
+        if rule in rules:
+            return rules[rule] if isinstance(rules[rule], str) else str(rules[rule])
+    return ""
@@ -0,0 +1,117 @@
+"""
+Helpers for reading, addressing and writing SEIRModel XML.
+
+LLM responses wrap the XML in prose, code fences and reasoning comments;
+`extract_xml` pulls out the `seir:SEIRModel` document. Elements are addressed
+with the same XMI paths the metamodel uses for references, e.g.
+`//@compartments.3/@outgoingFlows.1` or `//@parameters.9`.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+
+NAMESPACES = {
+    "xmi": "http://www.omg.org/XMI",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "seir": "http://example.com/seirmodel",
+}
+for _prefix, _uri in NAMESPACES.items():
+    ET.register_namespace(_prefix, _uri)
+
+ROOT_TAG = f"{{{NAMESPACES['seir']}}}SEIRModel"
+XSI_TYPE = f"{{{NAMESPACES['xsi']}}}type"
+NAMESPACE_DECLARATIONS = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in NAMESPACES.items())
+
+PATH_STEP = re.compile(r"@(\w+)\.(\d+)")
+FULL_PATH = re.compile(r"^//?@\w+\.\d+(/@\w+\.\d+)*$")
+XML_DOCUMENT = re.compile(r"(<\?xml[^>]*\?>\s*)?<seir:SEIRModel\b.*?</seir:SEIRModel>", re.DOTALL)
+
+
+def extract_xml(text: str) -> str:
+    """
+    Return the SEIRModel document contained in an LLM response.
+
+    Args:
+        text: Raw response, possibly with prose and code fences around the XML
+
+    Returns:
+        str: The XML document, or None if the response contains none
+    """
+    match = XML_DOCUMENT.search(text)
+    return match.group(0).strip() if match else None
+
+
+def parse(xml_text: str) -> ET.Element:
+    """Parse SEIRModel XML and return the root element. Raises ET.ParseError on malformed XML."""
+    return ET.fromstring(xml_text.strip())
+
+
+def parse_fragment(fragment: str) -> list:
+    """
+    Parse one or more sibling elements that may use the xsi/xmi/seir prefixes.
+
+    Returns:
+        list: The parsed elements
+    """
+    wrapper = ET.fromstring(f"<fragment {NAMESPACE_DECLARATIONS}>{fragment.strip()}</fragment>")
+    return list(wrapper)
+
+
+def to_string(root: ET.Element) -> str:
+    """Serialize a SEIRModel tree with the XML declaration and two-space indentation."""
+    ET.indent(root, space="  ")
+    # ElementTree writes "<tag />"; the metamodel's layout is "<tag/>"
+    body = ET.tostring(root, encoding="unicode").replace(" />", "/>")
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n{body}\n'
+
+
+def parse_path(path: str) -> list:
+    """
+    Split an XMI path into (child tag, index) steps.
+
+    "//@compartments.3/@outgoingFlows.1" -> [("compartments", 3), ("outgoingFlows", 1)].
+    "/" or "//" addresses the root and gives [].
+    """
+    path = path.strip()
+    if path in ("/", "//"):
+        return []
+    if not FULL_PATH.match(path):
+        raise ValueError(f"Invalid XMI path '{path}'")
+    return [(tag, int(index)) for tag, index in PATH_STEP.findall(path)]
+
+
+def resolve(root: ET.Element, path: str) -> ET.Element:
+    """
+    Return the element an XMI path refers to.
+
+    Raises:
+        KeyError: If a step's index is out of range
+    """
+    element = root
+    for tag, index in parse_path(path):
+        children = element.findall(tag)
+        if index >= len(children):
+            raise KeyError(f"'{path}' refers to {tag} {index}, but only {len(children)} exist")
+        element = children[index]
+    return element
+
+
+def path_of(root: ET.Element, target: ET.Element) -> str:
+    """Return the XMI path of an element in the tree, or None if it is not part of it."""
+    def walk(element, prefix):
+        counts = {}
+        for child in element:
+            index = counts.get(child.tag, 0)
+            counts[child.tag] = index + 1
+            path = f"{prefix}/@{child.tag}.{index}"
+            if child is target:
+                return path
+            found = walk(child, path)
+            if found:
+                return found
+        return None
+
+    if target is root:
+        return "/"
+    found = walk(root, "")
+    return f"/{found}" if found else None
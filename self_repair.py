@@ -0,0 +1,166 @@
+"""
+Localized repair of SEIRModel XML that fails local validation.
+
+When seir_validator finds, say, a dangling `//@parameters.24` reference or a
+repeated (PrimaryName, SecondaryName) pair in the Stage 2 output, re-running
+LLM1 and LLM2 would regenerate the whole model to fix one attribute. A repair
+request instead sends only what is broken:
+
+* every validation error with the text of the rule it breaks, looked up in
+  the metamodel's `validation_rules` (seir_validator.rule_text),
+* the offending elements, addressed by their XMI paths (compartments and the
+  root without their children, everything else in full),
+* a short index of the names the broken references can point to.
+
+The LLM answers with xml_patch edits (SET/ADD/DEL) against those paths, which
+are spliced into the model locally. A round is kept only if it lowers the
+number of issues, so a repair never makes the model worse. Malformed XML
+cannot be repaired piece by piece and is left to a regeneration.
+"""
+import copy
+import xml.etree.ElementTree as ET
+
+import seir_validator
+import seir_xml
+import xml_patch
+
+
+SEPARATOR = "\n" + "*" * 80 + "\n"
+
+# Rules whose fixes need the list of existing compartments / parameters / groups
+COMPARTMENT_RULES = ("index_consistency", "compartment_uniqueness", "contact_flow_validation")
+PARAMETER_RULES = ("parameter_references", "parameter_uniqueness")
+GROUP_RULES = ("reference_consistency", "stratum_validation")
+
+
+def is_repairable(issues: list) -> bool:
+    """Return True if there are issues and all of them can be fixed locally (the XML is usable)."""
+    return bool(issues) and not any(issue.rule == "well_formed" for issue in issues)
+
+
+def is_shallow(path: str) -> bool:
+    """Return True if `fragment` sends the element at `path` without its children."""
+    return path.strip() in ("/", "//") or seir_xml.parse_path(path)[-1][0] == "compartments"
+
+
+def fragment(root: ET.Element, path: str) -> str:
+    """Serialize the element at an XMI path; the root and compartments are sent without their children."""
+    element = copy.deepcopy(seir_xml.resolve(root, path))
+    if is_shallow(path):
+        element[:] = []
+        element.text = None
+    element.tail = None
+    ET.indent(element, space="  ")
+    return ET.tostring(element, encoding="unicode").replace(" />", "/>").replace(
+        f' xmlns:xsi="{seir_xml.NAMESPACES["xsi"]}"', ""
+    )
+
+
+def index_tables(root: ET.Element, rules: set) -> str:
+    """List the elements the broken references may point to, only for the rules that need them."""
+    lines = []
+    if rules & set(COMPARTMENT_RULES):
+        lines.append("Compartments:")
+        for index, compartment in enumerate(root.findall("compartments")):
+            secondary = compartment.get("SecondaryName")
+            name = compartment.get("PrimaryName", "") + (f" / {secondary}" if secondary else "")
+            lines.append(f"  //@compartments.{index} {name}")
+    if rules & set(PARAMETER_RULES):
+        lines.append("Parameters:")
+        for index, parameter in enumerate(root.findall("parameters")):
+            lines.append(f"  //@parameters.{index} {parameter.get('name', '')}")
+    if rules & set(GROUP_RULES):
+        for collection in ("groups", "products"):
+            lines.append(f"{collection.capitalize()}:")
+            for index in range(len(root.findall(collection))):
+                lines.append(f"  //@{collection}.{index} {fragment(root, f'//@{collection}.{index}')}")
+    return "\n".join(lines)
+
+
+def build_prompt(instructions: str, root: ET.Element, issues: list, metamodel: dict) -> str:
+    """
+    Build a repair request for the given issues.
+
+    Args:
+        instructions: The repair prompt from prompts.json
+        root: The parsed SEIRModel
+        issues: seir_validator issues of the model
+        metamodel: The full metamodel, for the rule texts
+
+    Returns:
+        str: The prompt
+    """
+    rules = {issue.rule for issue in issues}
+    rule_lines = [
+        f"- {rule}: {seir_validator.rule_text(metamodel, rule) or '(no rule text)'}" for rule in sorted(rules)
+    ]
+    error_lines = [f"- {issue}" for issue in issues]
+
+    # An element inside a fragment that is sent in full (e.g. a stratum rate of a broken flow) is not sent again
+    fragments, complete = [], []
+    for path in dict.fromkeys(issue.path for issue in issues):
+        if any(path.startswith(f"{parent}/") for parent in complete):
+            continue
+        try:
+            fragments.append(f"{path}\n{fragment(root, path)}")
+        except (KeyError, ValueError):
+            continue
+        if not is_shallow(path):
+            complete.append(path)
+
+    prompt = (
+        f"{SEPARATOR}"
+        f"PROMPT:\n{instructions.strip()}\n"
+        f"{SEPARATOR}"
+        f"VALIDATION ERRORS:\n" + "\n".join(error_lines) + "\n"
+        f"{SEPARATOR}"
+        f"RULES:\n" + "\n".join(rule_lines) + "\n"
+        f"{SEPARATOR}"
+        f"FRAGMENTS:\n" + "\n\n".join(fragments) + "\n"
+    )
+    tables = index_tables(root, rules)
+    if tables:
+        prompt += f"{SEPARATOR}INDEX:\n{tables}\n"
+    return prompt + SEPARATOR
+
+
+def repair(xml_text: str, issues: list, call, instructions: str, metamodel: dict, max_rounds: int = 2) -> tuple:
+    """
+    Repair the issues of a model with small patch requests.
+
+    Args:
+        xml_text: The model (may still contain prose or code fences)
+        issues: Its seir_validator issues
+        call: Function sending a prompt to the LLM and returning its response or "ERROR: ..."
+        instructions: The repair prompt from prompts.json
+        metamodel: The full metamodel, for the rule texts
+        max_rounds: Repair requests at most; each one sees the issues left by the previous round
+
+    Returns:
+        tuple: (XML text, remaining issues, list of (prompt, patch) of the rounds that were kept)
+    """
+    rounds = []
+    for round_number in range(1, max_rounds + 1):
+        if not is_repairable(issues):
+            break
+        document = seir_xml.extract_xml(xml_text)
+        prompt = build_prompt(instructions, seir_xml.parse(document), issues, metamodel)
+        print(f"Repair round {round_number}: {len(issues)} issue(s), {len(prompt)} characters sent")
+        patch = call(prompt)
+        if patch.startswith("ERROR:"):
+            print(f"Repair round {round_number} failed: {patch}")
+            break
+        try:
+            repaired = xml_patch.apply_patch(document, patch)
+        except (xml_patch.PatchError, ValueError, ET.ParseError) as err:
+            # A patch the LLM got wrong only costs this round, never the run
+            print(f"Repair round {round_number}: patch could not be applied: {err}")
+            break
+        repaired_issues = seir_validator.validate(repaired)
+        if seir_validator.score(repaired_issues) <= seir_validator.score(issues):
+            print(f"Repair round {round_number} did not reduce the issues ({len(repaired_issues)} left); discarded")
+            break
+        print(f"Repair round {round_number}: {len(issues)} -> {len(repaired_issues)} issue(s)")
+        xml_text, issues = repaired, repaired_issues
+        rounds.append((prompt, patch))
+    return xml_text, issues, rounds
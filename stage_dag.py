@@ -0,0 +1,95 @@
+"""
+Checkpointed stage graph for the SEIR model and simulation chains.
+
+Each chain is a small DAG of stages:
+
+    prompt + metamodel + user input -> llm1 -> llm2 -> extract (final XML) -> run record
+    prompt + ODE + skeleton         -> 3a   -> 3b   -> simulation script
+
+The backend stages (llm1, llm2, 3a, 3b) are checkpointed nodes. Extracting,
+patching or converting the XML and writing the outputs are local steps that
+are recomputed from the restored outputs in milliseconds.
+
+`StageGraph.run` executes one node. Its checkpoint key is the SHA-256 of the
+node name, the hashes of its inputs and the hashes of the outputs of the nodes
+it depends on, so a node only runs again when something it was computed from
+changed, and every node downstream of it runs again because its inputs
+changed. A node's output is checkpointed as soon as it finishes, so an
+interrupted or partly failed batch resumes at the first node that had not
+completed. "ERROR: ..." outputs are never checkpointed, and `reject` drops
+the checkpoint of an output a later local step could not use (e.g. a Stage 2
+patch that does not apply).
+
+The response cache stores single backend responses; a checkpoint stores what
+a node finally produced (e.g. the best-of-N winner), so a resumed node neither
+draws samples again nor calls the backend.
+"""
+import hashlib
+import json
+
+
+def digest(value) -> str:
+    """Hash a text, or any JSON-serializable value."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class StageGraph:
+    """
+    The nodes of one chain run, checkpointed in a response_cache.ResponseCache.
+
+    Args:
+        store: ResponseCache holding the checkpoints, or None to disable checkpointing
+        label: Chain name used in log messages, e.g. "finalHivModel.txt"
+        resume: Reuse checkpointed outputs; False runs every node again (and overwrites its checkpoint)
+    """
+
+    def __init__(self, store, label: str, resume: bool = True):
+        self.store = store
+        self.label = label
+        self.resume = resume
+        self.outputs = {}
+        self.keys = {}
+        self.restored = []
+
+    def key(self, name: str, inputs: dict = None, deps: tuple = ()) -> str:
+        """Return the checkpoint key of a node from its inputs and the outputs of the nodes it depends on."""
+        missing = [dep for dep in deps if dep not in self.outputs]
+        if missing:
+            raise ValueError(f"Node '{name}' depends on {', '.join(missing)}, which did not run yet")
+        return digest([
+            name,
+            {input_name: digest(value) for input_name, value in (inputs or {}).items()},
+            {dep: self.outputs[dep] for dep in deps},
+        ])
+
+    def run(self, name: str, fn, inputs: dict = None, deps: tuple = ()) -> str:
+        """
+        Run a node, or restore its output from the checkpoint of an earlier run with the same inputs.
+
+        Args:
+            name: Node name, unique within the chain (e.g. "llm1")
+            fn: Zero-argument function computing the node's text output
+            inputs: Everything besides `deps` the output depends on (prompt text, model, settings, ...)
+            deps: Names of earlier nodes of this graph whose outputs the node uses
+
+        Returns:
+            str: The node's output
+        """
+        key = self.keys[name] = self.key(name, inputs, deps)
+        output = self.store.get(key) if self.store is not None and self.resume else None
+        if output is not None:
+            print(f"[{self.label}] {name}: restored from checkpoint {key[:12]}")
+            self.restored.append(name)
+        else:
+            output = fn()
+            if self.store is not None and not output.startswith("ERROR:"):
+                self.store.put(key, output)
+        self.outputs[name] = digest(output)
+        return output
+
+    def reject(self, name: str):
+        """Drop a node's checkpoint because a later step could not use its output, so the next run redoes it."""
+        if self.store is not None and name in self.keys:
+            self.store.delete(self.keys[name])
@@ -0,0 +1,215 @@
+"""
+Streaming helpers shared by the Gemini, ChatGPT and Llama.cpp runners.
+
+A backend streams its completion as an iterator of text chunks. `collect_stream`
+writes each chunk to the run's log file as it arrives, records time-to-first-token,
+and stops generation as soon as the SEIRModel closing tag or the end of the first
+fenced code block has been emitted, so trailing commentary is never generated.
+A stream is also abandoned when the cancel event set for its thread fires
+(used by best-of-N sampling and hedged routes once another request has won).
+"""
+import os
+import threading
+import time
+
+
+XML_CLOSING_TAG = "</seir:SEIRModel>"
+FENCE = "```"
+
+_local = threading.local()
+
+
+class StreamCancelled(Exception):
+    """Raised by collect_stream when the current thread's cancel event is set."""
+
+
+def set_cancel_event(event: threading.Event = None):
+    """Make streams collected on the current thread stop once `event` is set (None clears it)."""
+    _local.cancel_event = event
+
+
+def get_cancel_event() -> threading.Event:
+    """Return the cancel event set for the current thread, or None."""
+    return getattr(_local, "cancel_event", None)
+
+
+class StopScanner:
+    """
+    Incremental search for the end of a response: the closing SEIRModel tag, or the end of the first fenced
+    code block (a line starting with ``` after a line starting with ```).
+
+    Each chunk is scanned once, together with a tail as long as the closing tag and the first characters of the
+    current line, so detecting the stop costs linear time in the output length however many chunks arrive.
+    """
+
+    def __init__(self):
+        self.length = 0        # characters fed so far
+        self.tail = ""         # last characters fed, too short to hold the closing tag
+        self.line_start = 0    # offset of the current line
+        self.line_head = ""    # its first (up to 3) characters
+        self.in_fence = False  # an opening fence line has been completed
+
+    def feed(self, chunk: str) -> int:
+        """
+        Scan the next chunk of the response.
+
+        Returns:
+            int: Index (into the whole response) just past the closing tag or closing fence, or -1 if neither
+                has been emitted yet
+        """
+        offset = self.length
+        candidates = []
+
+        window = self.tail + chunk
+        tag_pos = window.find(XML_CLOSING_TAG)
+        if tag_pos != -1:
+            candidates.append(offset - len(self.tail) + tag_pos + len(XML_CLOSING_TAG))
+        self.tail = window[-(len(XML_CLOSING_TAG) - 1):]
+
+        position = 0
+        while True:
+            newline = chunk.find("\n", position)
+            line_end = newline if newline != -1 else len(chunk)
+            if len(self.line_head) < len(FENCE):
+                self.line_head += chunk[position:min(line_end, position + len(FENCE) - len(self.line_head))]
+                if self.in_fence and self.line_head == FENCE:
+                    candidates.append(self.line_start + len(FENCE))
+                    break
+            if newline == -1:
+                break
+            if self.line_head == FENCE:
+                self.in_fence = True
+            self.line_start = offset + newline + 1
+            self.line_head = ""
+            position = newline + 1
+
+        self.length += len(chunk)
+        return min(candidates) if candidates else -1
+
+
+def find_stop(text: str) -> int:
+    """
+    Find where a response is complete.
+
+    Args:
+        text: Response text generated so far
+
+    Returns:
+        int: Index just past the closing XML tag or closing code fence, or -1 if neither has been emitted
+    """
+    return StopScanner().feed(text)
+
+
+PARTIAL_OUTPUT_HEADER = "\nPARTIAL OUTPUT:\n"
+
+
+def with_partial_output(error: str, output: str) -> str:
+    """Append the output a failed generation had produced to its "ERROR: ..." message."""
+    return f"{error}{PARTIAL_OUTPUT_HEADER}{output}" if output else error
+
+
+def partial_output(response: str) -> str:
+    """Return the partial output carried by an "ERROR: ..." message, or an empty string."""
+    if not response.startswith("ERROR:"):
+        return ""
+    return response.partition(PARTIAL_OUTPUT_HEADER)[2]
+
+
+def stream_log_path(output_dir: str, output_fileName: str) -> str:
+    """
+    Create an empty stream log next to an output file and return its path.
+
+    For "finalHivModel.txt" in "prompt_sample" this is "prompt_sample/finalHivModel.stream.log".
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(output_fileName)[0]
+    log_path = os.path.join(output_dir, f"{stem}.stream.log")
+    open(log_path, "w", encoding="utf-8").close()
+    return log_path
+
+
+class StreamResult:
+    """Text and timing metrics of one streamed completion."""
+
+    def __init__(self):
+        self.text = ""
+        self.time_to_first_token = None
+        self.total_time = None
+        self.chunks = 0
+        self.stopped_early = False
+        self.timed_out = False
+
+    def summary(self) -> str:
+        ttft = "n/a" if self.time_to_first_token is None else f"{self.time_to_first_token:.2f}s"
+        stop = ", stopped at closing tag/fence" if self.stopped_early else ""
+        if self.timed_out:
+            stop = ", timed out"
+        return (
+            f"time to first token {ttft}, {len(self.text)} characters "
+            f"in {self.total_time:.2f}s ({self.chunks} chunks{stop})"
+        )
+
+
+def collect_stream(chunks, log_path: str = None, label: str = "", timeout: float = None) -> StreamResult:
+    """
+    Consume a chunk iterator, logging as it goes and stopping once the output is complete.
+
+    Closing the iterator on early stop lets the backend generator cancel the request.
+    When `timeout` runs out the stream is stopped the same way and the text generated
+    so far is kept, with `timed_out` set on the result.
+
+    Args:
+        chunks: Iterator of text chunks from a backend
+        log_path: File the chunks are appended to as they arrive (optional)
+        label: Stage name written as a header in the log
+        timeout: Seconds after which generation is cut off (optional)
+
+    Returns:
+        StreamResult: The collected text and its timing metrics
+
+    Raises:
+        StreamCancelled: If the thread's cancel event is set before the stream completes
+    """
+    result = StreamResult()
+    scanner = StopScanner()
+    parts = []  # joined once at the end; growing one string chunk by chunk would copy it every time
+    cancel = get_cancel_event()
+    start = time.monotonic()
+    log = open(log_path, "a", encoding="utf-8") if log_path else None
+    try:
+        if log:
+            log.write(f"\n{'*' * 80}\n{label} (streaming):\n")
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                raise StreamCancelled(f"{label or 'Stream'} cancelled: another request already passed validation")
+            if not chunk:
+                continue
+            if result.time_to_first_token is None:
+                result.time_to_first_token = time.monotonic() - start
+            result.chunks += 1
+            stop = scanner.feed(chunk)
+            if stop != -1:
+                chunk = chunk[:len(chunk) - (scanner.length - stop)]
+                parts.append(chunk)
+                if log:
+                    log.write(chunk)
+                result.stopped_early = True
+                break
+            parts.append(chunk)
+            if log:
+                log.write(chunk)
+                log.flush()
+            if timeout is not None and time.monotonic() - start > timeout:
+                result.timed_out = True
+                break
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        result.text = "".join(parts)
+        result.total_time = time.monotonic() - start
+        if log:
+            log.write(f"\n[{result.summary()}]\n")
+            log.close()
+
+    print(f"{label or 'Stream'}: {result.summary()}")
+    return result
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# The pipeline modules and their data files (metamodel.json, prompts.json, ...) live in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def run_from_repository_root(monkeypatch):
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,141 @@
+"""
+A small GBNF reader for the tests: enough of llama.cpp's grammar format to check which strings a
+generated grammar accepts and to derive random strings from it.
+"""
+import random
+import re
+
+
+TOKEN = re.compile(r'\s*(?:(::=)|("(?:\\.|[^"\\])*")|(\[(?:\\.|[^\]\\])*\])|([\w-]+)|([()|*+?]))')
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+# Characters derived for negated classes such as [^"<&]
+ALPHABET = "abcXYZ019 ._/-"
+
+
+def _unescape_one(escape: str) -> str:
+    if escape[1] == "x":
+        return chr(int(escape[2:], 16))
+    return ESCAPES.get(escape[1], escape[1])
+
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\x[0-9a-fA-F]{2}|\\.", lambda m: _unescape_one(m.group(0)), text)
+
+
+def _char_class(text: str) -> tuple:
+    body = text[1:-1]
+    negated = body.startswith("^")
+    chars = re.findall(r"\\x[0-9a-fA-F]{2}|\\.|.", body[1:] if negated else body)
+    chars = [_unescape(c) for c in chars]
+    ranges, i = [], 0
+    while i < len(chars):
+        if i + 2 < len(chars) and chars[i + 1] == "-":
+            ranges.append((chars[i], chars[i + 2]))
+            i += 3
+        else:
+            ranges.append((chars[i], chars[i]))
+            i += 1
+    return ("cls", negated, tuple(ranges))
+
+
+class Grammar:
+    """Parsed GBNF rules, with a recognizer (`matches`) and a random derivation (`sample`)."""
+
+    def __init__(self, text: str):
+        self.rules = {}
+        for line in text.splitlines():
+            if "::=" in line and not line.startswith("#"):
+                name, expression = line.split("::=", 1)
+                tokens = [next(t for t in m.groups() if t) for m in TOKEN.finditer(expression) if m.group(0).strip()]
+                node, rest = self._alternatives(tokens)
+                assert not rest, f"unparsed {rest} in {name}"
+                self.rules[name.strip()] = node
+
+    def _alternatives(self, tokens):
+        options = []
+        node, tokens = self._sequence(tokens)
+        options.append(node)
+        while tokens and tokens[0] == "|":
+            node, tokens = self._sequence(tokens[1:])
+            options.append(node)
+        return (("alt", tuple(options)) if len(options) > 1 else options[0]), tokens
+
+    def _sequence(self, tokens):
+        items = []
+        while tokens and tokens[0] not in ("|", ")"):
+            token, tokens = tokens[0], tokens[1:]
+            if token == "(":
+                node, tokens = self._alternatives(tokens)
+                tokens = tokens[1:]
+            elif token.startswith('"'):
+                node = ("lit", _unescape(token[1:-1]))
+            elif token.startswith("["):
+                node = _char_class(token)
+            else:
+                node = ("ref", token)
+            if tokens and tokens[0] in ("*", "+", "?"):
+                node = ("rep", node, 1 if tokens[0] == "+" else 0, 1 if tokens[0] == "?" else None)
+                tokens = tokens[1:]
+            items.append(node)
+        return ("seq", tuple(items)), tokens
+
+    def matches(self, text: str, start: str = "root") -> bool:
+        """Return True if the whole text derives from the start rule."""
+        memo = {}
+
+        def ends(node, pos):
+            kind = node[0]
+            if kind == "lit":
+                return {pos + len(node[1])} if text.startswith(node[1], pos) else set()
+            if kind == "cls":
+                if pos >= len(text):
+                    return set()
+                inside = any(low <= text[pos] <= high for low, high in node[2])
+                return {pos + 1} if inside != node[1] else set()
+            if kind == "ref":
+                key = (node[1], pos)
+                if key not in memo:
+                    memo[key] = set()
+                    memo[key] = ends(self.rules[node[1]], pos)
+                return memo[key]
+            if kind == "seq":
+                positions = {pos}
+                for child in node[1]:
+                    positions = set().union(*(ends(child, p) for p in positions)) if positions else set()
+                return positions
+            if kind == "alt":
+                return set().union(*(ends(option, pos) for option in node[1]))
+            _, child, low, high = node
+            found, frontier, seen, count = ({pos} if low == 0 else set()), {pos}, {pos}, 0
+            while frontier and (high is None or count < high):
+                frontier = set().union(*(ends(child, p) for p in frontier)) - seen
+                seen |= frontier
+                count += 1
+                if count >= low:
+                    found |= frontier
+            return found
+
+        return len(text) in ends(("ref", start), 0)
+
+    def sample(self, rng: random.Random, start: str = "root", max_depth: int = 12) -> str:
+        """Derive a random string; below max_depth rule references, repetitions stop at their minimum."""
+        def derive(node, depth):
+            kind = node[0]
+            if kind == "lit":
+                return node[1]
+            if kind == "cls":
+                if node[1]:
+                    return rng.choice([c for c in ALPHABET if not any(lo <= c <= hi for lo, hi in node[2])])
+                low, high = rng.choice(node[2])
+                return chr(rng.randint(ord(low), ord(high)))
+            if kind == "ref":
+                return derive(self.rules[node[1]], depth + 1)
+            if kind == "seq":
+                return "".join(derive(child, depth) for child in node[1])
+            if kind == "alt":
+                return derive(rng.choice(node[1]), depth)
+            _, child, low, high = node
+            count = low if depth >= max_depth else rng.randint(low, high if high is not None else low + 2)
+            return "".join(derive(child, depth) for _ in range(count))
+
+        return derive(("ref", start), 0)
@@ -0,0 +1,54 @@
+import threading
+
+import best_of_n
+import seir_validator
+
+
+VALID = """<seir:SEIRModel xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:seir="http://example.com/seirmodel">
+  <compartments PrimaryName="Susceptible">
+    <outgoingFlows xsi:type="seir:RateFlow" rate="0.3" target="//@compartments.1"/>
+  </compartments>
+  <compartments PrimaryName="Infectious"/>
+</seir:SEIRModel>"""
+ONE_ISSUE = VALID.replace("//@compartments.1", "//@compartments.4")
+TWO_ISSUES = ONE_ISSUE.replace('PrimaryName="Infectious"', 'PrimaryName="Susceptible"')
+
+
+def test_keeps_the_best_scoring_sample():
+    samples = [TWO_ISSUES, ONE_ISSUE, "ERROR: timeout"]
+    response, issues = best_of_n.sample_best(lambda index: samples[index], 3, seir_validator.validate, "LLM1")
+    assert response == ONE_ISSUE
+    assert [issue.rule for issue in issues] == ["index_consistency"]
+
+
+def test_a_valid_sample_cancels_the_others():
+    release = threading.Event()
+    started = []
+
+    def generate(index):
+        started.append(index)
+        if index == 0:
+            return VALID
+        release.wait(5)
+        return TWO_ISSUES
+
+    response, issues = best_of_n.sample_best(generate, 3, seir_validator.validate)
+    release.set()
+    assert (response, issues) == (VALID, [])
+
+
+def test_returns_the_first_error_when_every_sample_fails():
+    def generate(index):
+        if index == 1:
+            raise RuntimeError("boom")
+        return "ERROR: down"
+
+    response, issues = best_of_n.sample_best(generate, 2, seir_validator.validate)
+    assert response.startswith("ERROR:") and issues == []
+
+
+def test_stage2_validator_applies_the_patch_first():
+    validate = best_of_n.stage2_validator(ONE_ISSUE, patch=True)
+    assert validate('SET //@compartments.0/@outgoingFlows.0 target="//@compartments.1"') == []
+    assert [issue.rule for issue in validate("DEL //@compartments.9")] == ["well_formed"]
+    assert best_of_n.stage2_validator(ONE_ISSUE)(VALID) == []
@@ -0,0 +1,48 @@
+import cassette
+import response_cache
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / "cassettes" / "run.jsonl")
+    recorder = cassette.Cassette(path, "record")
+    responses = iter(["first sample", "second sample"])
+    for _ in range(2):
+        recorder.call("gemini", "model", {"temperature": 0}, "prompt", lambda: next(responses), label="LLM1")
+    recorder.call("gemini", "model", {}, "other prompt", lambda: "other", label="LLM2")
+    assert recorder.recorded == 3
+
+    player = cassette.Cassette(path, "replay")
+
+    def backend():
+        return "called the backend"
+
+    replayed = [player.call("gemini", "model", {"temperature": 0}, "prompt", backend) for _ in range(3)]
+    assert replayed == ["first sample", "second sample", "second sample"]  # the last recording repeats
+    assert player.call("gemini", "model", {}, "other prompt", backend) == "other"
+    assert player.replayed == 4
+
+
+def test_unrecorded_request_is_an_error(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    cassette.Cassette(path, "record").call("gemini", "model", {}, "prompt", lambda: "answer")
+    player = cassette.Cassette(path, "replay")
+    assert player.call("gemini", "model", {}, "new prompt", lambda: "live", label="LLM1").startswith("ERROR:")
+
+
+def test_missing_cassette_is_an_error(tmp_path):
+    player = cassette.Cassette(str(tmp_path / "missing.jsonl"), "replay")
+    response = player.call("gemini", "model", {}, "prompt", lambda: "live")
+    assert response.startswith("ERROR:") and "missing.jsonl" in response
+
+
+def test_off_passes_calls_through(tmp_path):
+    tape = cassette.Cassette(str(tmp_path / "run.jsonl"))
+    assert not tape.active
+    assert tape.call("gemini", "model", {}, "prompt", lambda: "live") == "live"
+    assert not (tmp_path / "run.jsonl").exists()
+
+
+def test_recording_uses_the_response_cache_key(tmp_path):
+    path = tmp_path / "run.jsonl"
+    cassette.Cassette(str(path), "record").call("chatgpt", "gpt-4o", {"n": 1}, "prompt", lambda: "answer")
+    assert response_cache.make_key("chatgpt", "gpt-4o", {"n": 1}, "prompt") in path.read_text()
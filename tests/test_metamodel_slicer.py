@@ -0,0 +1,50 @@
+import json
+
+import metamodel_slicer
+
+
+def load(name):
+    with open(name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_detects_the_features_of_the_sample_inputs():
+    models = load("models.json")
+    assert {"births", "deaths", "parametric"} <= metamodel_slicer.detect_features(models["smartEbolaInput"])
+    hiv = metamodel_slicer.detect_features(models["hivModel"])
+    assert {"births", "deaths", "numeric", "stratified"} <= hiv and "parametric" not in hiv
+    assert {"trm", "flow_network", "numeric"} <= metamodel_slicer.detect_features("TRM junctions")
+
+
+def test_slice_keeps_only_what_the_input_uses():
+    metamodel = load("metamodel.json")
+    sliced = metamodel_slicer.slice_metamodel(metamodel, "Compartments S, I, R with a death rate of 0.01.")
+    body = sliced["seirmodel_metamodel"]
+    assert {"groups", "products", "stratumSpecificRates", "parameters", "birthSources"}.isdisjoint(body["structure"])
+    assert {"compartments", "deathSinks", "RateFlow"} <= set(body["structure"])
+    assert "rate_format_numeric" in body["validation_rules"] and "rate_format_parametric" not in body["validation_rules"]
+    assert len(json.dumps(sliced)) < len(json.dumps(metamodel))
+
+
+def test_slice_keeps_only_the_modelling_mode_used():
+    metamodel = {"mm": {"structure": {"compartments": {
+        "modeling_modes": {"numeric": "rate=\"0.1\"", "parametric": "rateParameter=\"//@parameters.0\""},
+        "examples": {"numeric": "<a/>", "parametric": "<b/>"},
+    }}}}
+    compartments = metamodel_slicer.slice_metamodel(metamodel, "MODEL TYPE: Parametric compartments")["mm"]["structure"]["compartments"]
+    assert compartments == {"modeling_modes": {"parametric": "rateParameter=\"//@parameters.0\""}, "examples": {"parametric": "<b/>"}}
+
+
+def test_inputs_without_compartments_get_a_full_copy():
+    metamodel = load("metamodel.json")
+    sliced = metamodel_slicer.slice_metamodel(metamodel, "No input available")
+    assert sliced == metamodel
+    sliced["seirmodel_metamodel"]["structure"].clear()
+    assert metamodel["seirmodel_metamodel"]["structure"]
+
+
+def test_cached_slices_are_independent_copies():
+    metamodel = load("metamodel.json")
+    first = metamodel_slicer.slice_metamodel(metamodel, "compartments S and I")
+    first["seirmodel_metamodel"]["structure"].clear()
+    assert metamodel_slicer.slice_metamodel(metamodel, "compartments S and I")["seirmodel_metamodel"]["structure"]
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+import model_routing
+import seir_validator
+
+
+ROUTES = {
+    "LLM1": ["gemini:flash", "chatgpt:gpt-4o"],
+    "LLM2": ["gemini:pro"],
+    "LLM3A": ["llama_cpp:model.gguf"],
+    "LLM3B": ["gemini:pro", "chatgpt:gpt-4o", "llama_cpp:model.gguf"],
+}
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """Fake backends answering from a table of model -> response (or function of the prompt)."""
+    answers, calls = {}, []
+
+    def make(name):
+        def call(prompt, model, **kwargs):
+            calls.append((name, model, kwargs))
+            answer = answers[model]
+            return answer(prompt) if callable(answer) else answer
+        return call
+
+    for name in model_routing.BACKEND_MODULES:
+        monkeypatch.setitem(model_routing._backends, name, make(name))
+    return answers, calls
+
+
+def invalid_unless_ok(response):
+    return [] if response == "ok" else [seir_validator.Issue("reference_consistency", "broken")]
+
+
+def test_targets_must_name_a_known_backend():
+    assert model_routing.parse_target("gemini:gemini-2.5-pro") == ("gemini", "gemini-2.5-pro")
+    for target in ("gemini", ":model", "bard:model"):
+        with pytest.raises(ValueError):
+            model_routing.parse_target(target)
+    with pytest.raises(ValueError):
+        model_routing.Router(dict(ROUTES, LLM2=[]))
+    with pytest.raises(ValueError):
+        model_routing.Router(ROUTES, hedged=["LLM4"])
+
+
+def test_router_describes_its_routes():
+    router = model_routing.Router(ROUTES)
+    assert router.primary("LLM1") == ("gemini", "flash")
+    assert router.describe("LLM1") == "gemini:flash -> chatgpt:gpt-4o"
+    assert router.uses("llama_cpp") and not model_routing.Router(dict(ROUTES, LLM3A=["gemini:pro"], LLM3B=["gemini:pro"])).uses("llama_cpp")
+
+
+def test_falls_back_to_the_next_target_on_error(backends):
+    answers, calls = backends
+    answers.update({"flash": "ERROR: 503 UNAVAILABLE", "gpt-4o": "<model/>"})
+    assert model_routing.Router(ROUTES).call("LLM1", "prompt", label="LLM1") == "<model/>"
+    assert [(name, model) for name, model, _ in calls] == [("gemini", "flash"), ("chatgpt", "gpt-4o")]
+    assert calls[0][2]["label"] == "LLM1"
+
+
+def test_returns_the_last_error_when_every_target_fails(backends):
+    answers, _ = backends
+    answers.update({"flash": "ERROR: first", "gpt-4o": "ERROR: second"})
+    assert model_routing.Router(ROUTES).call("LLM1", "prompt") == "ERROR: second"
+
+
+def test_first_success_stops_the_route(backends):
+    answers, calls = backends
+    answers.update({"flash": "<model/>", "gpt-4o": "unused"})
+    model_routing.Router(ROUTES).call("LLM1", "prompt")
+    assert len(calls) == 1
+
+
+def test_backend_options_go_to_their_backend_only(backends):
+    answers, calls = backends
+    answers.update({"model.gguf": "script"})
+    model_routing.Router(ROUTES).call("LLM3A", "prompt", options={"llama_cpp": {"prefix": "P"}, "gemini": {"x": 1}})
+    assert calls[0][2] == {"prefix": "P"}
+
+
+def test_race_hedges_a_slow_target(backends):
+    answers, calls = backends
+    released = threading.Event()
+    answers.update({"pro": lambda prompt: released.wait(5) and "ok", "gpt-4o": "ok", "model.gguf": "ok"})
+    router = model_routing.Router(ROUTES, hedged=["LLM3B"], hedge_delay=0.05)
+    started = time.monotonic()
+    assert router.call("LLM3B", "prompt", validate=invalid_unless_ok) == "ok"
+    released.set()
+    assert time.monotonic() - started < 2
+    assert [model for _, model, _ in calls] == ["pro", "gpt-4o"]
+
+
+def test_race_starts_the_next_target_at_once_after_an_invalid_answer(backends):
+    answers, calls = backends
+    answers.update({"pro": "broken", "gpt-4o": "ok", "model.gguf": "ok"})
+    router = model_routing.Router(ROUTES, hedged=["LLM3B"], hedge_delay=30)
+    started = time.monotonic()
+    assert router.call("LLM3B", "prompt", validate=invalid_unless_ok) == "ok"
+    assert time.monotonic() - started < 5
+
+
+def test_race_returns_the_best_answer_when_none_is_valid(backends):
+    answers, _ = backends
+    answers.update({"pro": "ERROR: down", "gpt-4o": "broken", "model.gguf": "ERROR: crashed"})
+    router = model_routing.Router(ROUTES, hedged=["LLM3B"], hedge_delay=0.01)
+    assert router.call("LLM3B", "prompt", validate=invalid_unless_ok) == "broken"
+
+
+def test_cost_cap_limits_hedges(backends):
+    answers, calls = backends
+    answers.update({"pro": lambda prompt: time.sleep(0.2) or "ok", "gpt-4o": "ok", "model.gguf": "ok"})
+    router = model_routing.Router(ROUTES, hedged=["LLM3B"], hedge_delay=0.01, cost_cap=model_routing.CostCap(0))
+    assert router.call("LLM3B", "prompt", validate=invalid_unless_ok) == "ok"
+    assert [model for _, model, _ in calls] == ["pro"]
+
+
+def test_cost_cap_budget():
+    cap = model_routing.CostCap(100)
+    assert cap.spend(60) and not cap.spend(50) and cap.spend(40)
+    assert cap.spent == 100
+    assert model_routing.CostCap().spend(10 ** 9)
@@ -0,0 +1,46 @@
+import pytest
+
+import pipeline_cli
+
+
+PROMPT_KEYS = {"LLM1": "LLM1_PROMPT", "LLM2": "LLM2_PROMPT"}
+
+
+def parse(*argv):
+    return pipeline_cli.parse_args(list(argv), "test", ["hiv"], ["hiv", "covid"], PROMPT_KEYS)
+
+
+def test_defaults():
+    args = parse()
+    assert (args.models, args.simulations, args.prompts) == (["hiv"], ["hiv", "covid"], {})
+    assert not args.fresh and not args.dry_run
+
+
+def test_selections():
+    args = parse("--models", "covid", "hiv", "covid", "--simulations", "none", "--fresh", "--dry-run")
+    assert (args.models, args.simulations, args.fresh, args.dry_run) == (["covid", "hiv"], [], True, True)
+    assert parse("--models", "all").models == list(pipeline_cli.MODELS)
+
+
+def test_prompt_overrides():
+    assert parse("--prompt", "LLM1=smart_LLM1_PROMPT").prompts == {"LLM1": "smart_LLM1_PROMPT"}
+    for override in ("LLM4=KEY", "LLM1"):
+        with pytest.raises(SystemExit):
+            parse("--prompt", override)
+    with pytest.raises(SystemExit):
+        parse("--models", "measles")
+
+
+def test_load_jobs_reads_inputs_only_when_needed():
+    def load_inputs():
+        raise AssertionError("input file read")
+
+    assert pipeline_cli.load_jobs([], pipeline_cli.SIMULATIONS, load_inputs) == []
+    jobs = pipeline_cli.load_jobs(["hiv"], pipeline_cli.SIMULATIONS, lambda: {"hivModel": "odes"})
+    assert jobs == [("HIV", "odes", "hiv_simulation.py")]
+
+
+def test_print_plan(capsys):
+    pipeline_cli.print_plan([("HIV", "input", "finalHivModel.txt")], [], PROMPT_KEYS)
+    out = capsys.readouterr().out
+    assert "HIV -> finalHivModel.txt" in out and "Simulations:  none" in out and "LLM1=LLM1_PROMPT" in out
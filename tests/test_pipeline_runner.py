@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pipeline_runner
+
+
+SEIR_JOBS = [("HIV", "hiv input", "finalHivModel.txt"), ("COVID", "covid input", "finalCovidModel.txt")]
+SIMULATION_JOBS = [("HIV", "hiv odes", "hiv_simulation.py")]
+
+
+def recorder(kind, calls):
+    def run(text, output_fileName):
+        calls.append((kind, output_fileName))
+        return f"{kind} {text}"
+    return run
+
+
+def test_jobs_are_grouped_by_model():
+    calls = []
+    generate, simulate = recorder("model", calls), recorder("simulation", calls)
+    groups = pipeline_runner.group_by_model(generate, simulate, SEIR_JOBS, SIMULATION_JOBS)
+    assert [label for label, _ in groups] == ["HIV", "COVID"]
+    assert [(kind, job[2]) for kind, _, job in groups[0][1]] == [("Model", "finalHivModel.txt"), ("Simulation", "hiv_simulation.py")]
+
+
+def test_run_sequentially_runs_model_by_model():
+    calls = []
+    results = pipeline_runner.run_sequentially(recorder("model", calls), recorder("simulation", calls), SEIR_JOBS, SIMULATION_JOBS)
+    assert calls == [("model", "finalHivModel.txt"), ("simulation", "hiv_simulation.py"), ("model", "finalCovidModel.txt")]
+    assert results["hiv_simulation.py"] == "simulation hiv odes"
+
+
+def test_run_concurrently_overlaps_chains_up_to_the_limit():
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def chain(text, output_fileName):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return output_fileName
+
+    results = pipeline_runner.run_concurrently(chain, chain, SEIR_JOBS, SIMULATION_JOBS, max_concurrency=2)
+    assert peak[0] == 2
+    assert results == {name: name for _, _, name in SEIR_JOBS + SIMULATION_JOBS}
+
+
+def test_a_failing_chain_does_not_stop_the_others():
+    def generate(text, output_fileName):
+        if output_fileName == "finalHivModel.txt":
+            raise RuntimeError("backend down")
+        return "done"
+
+    results = pipeline_runner.run_concurrently(generate, lambda text, name: "done", SEIR_JOBS, SIMULATION_JOBS)
+    assert results == {"finalHivModel.txt": "ERROR: backend down", "finalCovidModel.txt": "done", "hiv_simulation.py": "done"}
@@ -0,0 +1,45 @@
+import json
+
+import prompt_compaction
+
+
+METAMODEL = {
+    "mm": {
+        "structure": {
+            "compartments": {"examples": ["Susceptible", "Infectious"], "element": "compartments"},
+            "RateFlow": {"examples": {"numeric": "<outgoingFlows rate=\"0.1\"/>"}},
+        },
+        "best_practices": ["Name compartments clearly"],
+        "unicode_reference": {"beta": "β"},
+    }
+}
+
+
+def test_drops_sections_the_input_does_not_need():
+    compacted = prompt_compaction.compact_metamodel(METAMODEL, "A numeric SIR model")
+    assert compacted == {"mm": {"structure": {
+        "compartments": {"element": "compartments"},
+        "RateFlow": {"examples": {"numeric": "<outgoingFlows rate=\"0.1\"/>"}},
+    }}}
+    assert "best_practices" in METAMODEL["mm"]
+
+
+def test_unicode_reference_only_when_symbols_are_asked_for():
+    assert prompt_compaction.needs_unicode_reference("MODEL TYPE: Parametric, use Greek letters")
+    assert not prompt_compaction.needs_unicode_reference("Parametric with β = 0.3")
+    assert not prompt_compaction.needs_unicode_reference("Numeric model")
+    assert "unicode_reference" in prompt_compaction.compact_metamodel(METAMODEL, "parametric model")["mm"]
+
+
+def test_compact_text_is_minified_json(capsys):
+    text = prompt_compaction.compact_metamodel_text(METAMODEL, "", label="Test")
+    assert json.loads(text) == prompt_compaction.compact_metamodel(METAMODEL)
+    assert "\n" not in text and ", " not in text
+    assert capsys.readouterr().out.startswith("Test block:")
+
+
+def test_real_metamodel_gets_smaller():
+    with open("metamodel.json", encoding="utf-8") as f:
+        metamodel = json.load(f)
+    text = prompt_compaction.compact_metamodel_text(metamodel)
+    assert prompt_compaction.count_tokens(text) < prompt_compaction.count_tokens(json.dumps(metamodel, indent=2))
@@ -0,0 +1,62 @@
+import rate_limiter
+
+
+def test_transient_errors_are_retried():
+    for response in (
+        "ERROR: RateLimitError: Error code: 429 - {'error': {'message': 'Rate limit reached'}}",
+        "ERROR: ResourceExhausted: 429 Resource has been exhausted (e.g. check quota).",
+        "ERROR: APIConnectionError: Connection error.",
+        "ERROR: APITimeoutError: Request timed out.",
+        "ERROR: InternalServerError: Error code: 502 - Bad gateway",
+        "ERROR: ServiceUnavailable: 503 The service is currently unavailable.",
+        "ERROR: DeadlineExceeded: 504 Deadline Exceeded",
+        "ERROR: 503 UNAVAILABLE. The model is overloaded.",
+    ):
+        assert rate_limiter.is_retryable(response), response
+
+
+def test_numbers_and_words_in_other_errors_are_not_retried():
+    for response in (
+        "ERROR: BadRequestError: Error code: 400 - the prompt describes 500 compartments",
+        "ERROR: InvalidArgument: 400 Request contains an invalid argument (connection rates).",
+        "ERROR: AuthenticationError: Error code: 401 - Incorrect API key",
+        "ERROR: Stage 2 patch could not be applied: DEL //@compartments.503",
+        "ERROR: Generation timed out with unfinished output (429 characters kept after 2 resumes)",
+        "<seir:SEIRModel totalPopulation=\"500\"/>",
+    ):
+        assert not rate_limiter.is_retryable(response), response
+
+
+def test_only_rate_limits_slow_the_limiter_down():
+    assert rate_limiter.is_rate_limit("ERROR: RateLimitError: Error code: 429 - quota")
+    assert rate_limiter.is_rate_limit("ERROR: ResourceExhausted: 429 Quota exceeded")
+    assert not rate_limiter.is_rate_limit("ERROR: InternalServerError: Error code: 500 - oops")
+    assert not rate_limiter.is_rate_limit("ERROR: BadRequestError: Error code: 400 - 429 tokens too many")
+
+
+def test_error_message_names_the_exception_type():
+    class RateLimitError(Exception):
+        pass
+
+    response = rate_limiter.error_message(RateLimitError("Error code: 429"))
+    assert response == "ERROR: RateLimitError: Error code: 429"
+    assert rate_limiter.is_rate_limit(response)
+
+
+def test_call_with_retry_retries_transient_errors_only(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: None)
+    responses = iter(["ERROR: APIConnectionError: Connection error.", "ERROR: 503 UNAVAILABLE.", "done"])
+    assert rate_limiter.call_with_retry(lambda: next(responses), "prompt", max_retries=3) == "done"
+
+    attempts = []
+    permanent = "ERROR: BadRequestError: Error code: 400 - 500 compartments"
+    assert rate_limiter.call_with_retry(lambda: attempts.append(1) or permanent, "prompt") == permanent
+    assert len(attempts) == 1
+
+
+def test_rate_limit_halves_the_limiter_rate(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: None)
+    limiter = rate_limiter.RateLimiter(60_000, 1_000_000)
+    responses = iter(["ERROR: RateLimitError: Error code: 429", "done"])
+    rate_limiter.call_with_retry(lambda: next(responses), "prompt", limiter)
+    assert limiter.fraction == 0.6  # halved, then 10% recovered by the successful retry
@@ -0,0 +1,83 @@
+import os
+import time
+
+import response_cache
+
+
+def make_cache(tmp_path, max_bytes=10_000):
+    return response_cache.ResponseCache(str(tmp_path / "cache"), max_bytes)
+
+
+def key(name):
+    return response_cache.make_key("gemini", "model", {"temperature": 0}, name)
+
+
+def test_miss_generates_and_hit_reuses(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "<seir:SEIRModel/>"
+
+    assert cache.call("gemini", "model", {}, "prompt", generate) == "<seir:SEIRModel/>"
+    assert cache.call("gemini", "model", {}, "prompt", generate) == "<seir:SEIRModel/>"
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_every_request_field():
+    base = response_cache.make_key("gemini", "model", {"temperature": 0}, "prompt")
+    assert base == response_cache.make_key("gemini", "model", {"temperature": 0}, "prompt")
+    assert base != response_cache.make_key("chatgpt", "model", {"temperature": 0}, "prompt")
+    assert base != response_cache.make_key("gemini", "other", {"temperature": 0}, "prompt")
+    assert base != response_cache.make_key("gemini", "model", {"temperature": 1}, "prompt")
+    assert base != response_cache.make_key("gemini", "model", {"temperature": 0}, "prompt!")
+
+
+def test_errors_are_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.call("gemini", "model", {}, "prompt", lambda: "ERROR: 503 overloaded").startswith("ERROR:")
+    assert cache.call("gemini", "model", {}, "prompt", lambda: "fresh") == "fresh"
+    assert cache.misses == 2
+
+
+def test_bypass_draws_a_fresh_sample_and_stores_it(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.call("gemini", "model", {}, "prompt", lambda: "first")
+    assert cache.call("gemini", "model", {}, "prompt", lambda: "second", bypass=True) == "second"
+    assert cache.call("gemini", "model", {}, "prompt", lambda: "third") == "second"
+
+
+def test_missing_entry_is_a_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get(key("never stored")) is None
+    cache.delete(key("never stored"))
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = make_cache(tmp_path)
+    payload = os.urandom(1500).hex()  # random text barely compresses
+    for name in ("a", "b", "c"):
+        cache.put(key(name), payload)
+        time.sleep(0.02)
+    entry_size = os.path.getsize(cache.path(key("a")))
+    cache.max_bytes = 3 * entry_size + entry_size // 2
+
+    assert cache.get(key("a")) is not None  # "a" is now more recently used than "b"
+    time.sleep(0.02)
+    cache.put(key("d"), payload)
+
+    assert cache.get(key("b")) is None
+    for name in ("a", "c", "d"):
+        assert cache.get(key(name)) == payload
+    assert sum(size for _, size, _ in cache.entries()) <= cache.max_bytes
+
+
+def test_running_size_follows_puts_and_deletes(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(key("a"), "x" * 100)
+    cache.put(key("b"), "y" * 100)
+    cache.put(key("a"), "z" * 5000)  # replacing an entry counts only its new size
+    cache.delete(key("b"))
+    assert cache._size == sum(size for _, size, _ in cache.entries())
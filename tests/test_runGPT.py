@@ -0,0 +1,78 @@
+import cassette
+import llama_pool
+import response_cache
+import runGPT
+
+
+def fake_pipeline(monkeypatch, tmp_path, calls):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(runGPT, "get_prompt", lambda stage: f"{stage} prompt")
+    monkeypatch.setattr(runGPT, "get_simulation_skeleton", lambda: "def simulate(): pass")
+    monkeypatch.setattr(runGPT, "STREAM_OUTPUT", False)
+    monkeypatch.setattr(runGPT, "RESPONSE_CACHE", response_cache.ResponseCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(runGPT, "CHECKPOINTS", response_cache.ResponseCache(str(tmp_path / "checkpoints")))
+
+    def generate(prompt, *args):
+        calls.append(prompt)
+        return f"script {len(calls)}"
+    monkeypatch.setattr(runGPT, "generate_llama_cpp", generate)
+
+
+def test_cassette_records_after_a_checkpointed_run(monkeypatch, tmp_path):
+    calls = []
+    fake_pipeline(monkeypatch, tmp_path, calls)
+    monkeypatch.setattr(runGPT, "CASSETTE", cassette.Cassette(str(tmp_path / "off.jsonl")))
+    runGPT.simulate("dS/dt = -b*S*I", "sim.py")
+    assert len(calls) == 2
+
+    recorder = cassette.Cassette(str(tmp_path / "run.jsonl"), "record")
+    monkeypatch.setattr(runGPT, "CASSETTE", recorder)
+    runGPT.simulate("dS/dt = -b*S*I", "sim.py")
+    assert len(calls) == 4
+    assert recorder.recorded == 2
+
+    player = cassette.Cassette(str(tmp_path / "run.jsonl"), "replay")
+    monkeypatch.setattr(runGPT, "CASSETTE", player)
+    runGPT.simulate("dS/dt = -b*S*I", "sim.py")
+    assert len(calls) == 4
+    assert player.replayed == 2
+
+
+def test_checkpoints_are_restored_without_a_cassette(monkeypatch, tmp_path):
+    calls = []
+    fake_pipeline(monkeypatch, tmp_path, calls)
+    monkeypatch.setattr(runGPT, "CASSETTE", cassette.Cassette(str(tmp_path / "off.jsonl")))
+    runGPT.simulate("dS/dt = -b*S*I", "sim.py")
+    runGPT.simulate("dS/dt = -b*S*I", "sim.py")
+    assert len(calls) == 2
+
+
+def test_pool_workers_keep_separate_prompt_caches(monkeypatch, tmp_path):
+    monkeypatch.setattr(runGPT, "PROMPT_CACHE_DIR", str(tmp_path / "prompt_cache"))
+    monkeypatch.setattr(runGPT, "LLAMA_WORKERS", 2)
+    sessions = []
+    for index in (0, 1):
+        monkeypatch.setattr(llama_pool._local, "worker", llama_pool.Worker(index, (index,)), raising=False)
+        cmd = runGPT.build_llama_cmd("prompt", cache_key="abc")
+        sessions.append(cmd[cmd.index("--prompt-cache") + 1])
+    assert sessions[0] != sessions[1]
+    assert runGPT.prompt_cache_dir(1) != runGPT.prompt_cache_dir(0)
+
+    monkeypatch.setattr(runGPT, "LLAMA_WORKERS", 1)
+    assert runGPT.prompt_cache_dir(0) == runGPT.PROMPT_CACHE_DIR
+
+
+def test_failed_stage_3b_keeps_the_previous_script(monkeypatch, tmp_path):
+    calls = []
+    fake_pipeline(monkeypatch, tmp_path, calls)
+    monkeypatch.setattr(runGPT, "CASSETTE", cassette.Cassette(str(tmp_path / "off.jsonl")))
+    runGPT.simulate("dS/dt = -b*S*I", "sim.py")
+    script = (tmp_path / "simulation_scripts" / "sim.py").read_text()
+
+    monkeypatch.setattr(
+        runGPT, "generate_llama_cpp",
+        lambda prompt, *args: "ERROR: llama.cpp crashed" if "LLM3B prompt" in prompt else "stage 3a",
+    )
+    monkeypatch.setattr(runGPT, "RESPONSE_CACHE_BYPASS", True)
+    assert runGPT.simulate("dS/dt = -b*S*I", "sim.py").startswith("ERROR:")
+    assert (tmp_path / "simulation_scripts" / "sim.py").read_text() == script
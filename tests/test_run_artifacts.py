@@ -0,0 +1,54 @@
+import zipfile
+
+import pytest
+
+import run_artifacts
+
+
+def test_record_path():
+    assert run_artifacts.record_path("prompt_sample", "finalHivModel.txt") == "prompt_sample/finalHivModel.run.zip"
+
+
+def test_fields_round_trip_and_share_blobs(tmp_path):
+    path = str(tmp_path / "out" / "model.run.zip")
+    with run_artifacts.RunRecord(path, {"backend": "gemini"}) as record:
+        record.add("llm2_response", "<seir:SEIRModel/>")
+        record.add("model_xml", "<seir:SEIRModel/>")
+        record.add("user_input", "An SIR model. ✓")
+        record.add("llm1_response", "")
+        record.add_stage("LLM1", 1.23456, "prompt text", "response")
+
+    assert run_artifacts.read_field(path, "user_input") == "An SIR model. ✓"
+    assert run_artifacts.read_field(path, "model_xml") == "<seir:SEIRModel/>"
+    index = run_artifacts.read_index(path)
+    assert index["status"] == "ok" and index["meta"] == {"backend": "gemini"}
+    assert index["stages"]["LLM1"]["seconds"] == 1.235
+    assert "llm1_response" not in index["fields"]
+    assert index["fields"]["model_xml"]["blob"] == index["fields"]["llm2_response"]["blob"]
+    with zipfile.ZipFile(path) as archive:
+        assert len([name for name in archive.namelist() if name.startswith("blobs/")]) == 2
+    with pytest.raises(KeyError):
+        run_artifacts.read_field(path, "llm1_response")
+
+
+def test_a_failed_run_is_still_recorded(tmp_path):
+    path = str(tmp_path / "model.run.zip")
+    with pytest.raises(RuntimeError):
+        with run_artifacts.RunRecord(path) as record:
+            record.add("user_input", "input")
+            assert not (tmp_path / "model.run.zip").exists()
+            raise RuntimeError("backend down")
+    assert run_artifacts.read_index(path)["status"] == "error: backend down"
+    assert not (tmp_path / "model.run.zip.tmp").exists()
+
+
+def test_main_prints_fields(tmp_path, capsys):
+    path = str(tmp_path / "model.run.zip")
+    with run_artifacts.RunRecord(path) as record:
+        record.add("model_xml", "<xml/>")
+    run_artifacts.main([path, "model_xml"])
+    assert capsys.readouterr().out == "<xml/>\n"
+    run_artifacts.main([path])
+    assert "model_xml" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        run_artifacts.main([path, "missing"])
@@ -0,0 +1,63 @@
+import random
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import seir_grammar
+import seir_xml
+from gbnf import Grammar
+
+
+ROOT = (
+    '<seir:SEIRModel xmi:version="2.0" xmlns:xmi="http://www.omg.org/XMI" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:seir="http://example.com/seirmodel"'
+)
+
+
+def grammar(metamodel="metamodel.json", **options):
+    return Grammar(seir_grammar.grammar_for_file(metamodel, **options))
+
+
+def model(body, attributes=""):
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n{ROOT}{attributes}>\n{body}\n</seir:SEIRModel>\n'
+
+
+@pytest.mark.parametrize("metamodel", ["metamodel.json", "compartmental_metamodel.json"])
+def test_derived_documents_are_well_formed(metamodel):
+    rules = grammar(metamodel)
+    rng = random.Random(7)
+    for _ in range(40):
+        document = rules.sample(rng)
+        assert rules.matches(document)
+        root = seir_xml.parse(document)
+        assert root.tag == seir_xml.ROOT_TAG
+
+
+def test_accepts_a_model_with_reasoning_comments():
+    document = model(
+        '  <compartments PrimaryName="S" population="990">\n'
+        '    <!-- beta from the user input -->\n'
+        '    <outgoingFlows xsi:type="seir:RateFlow" target="//@compartments.1" rate="[[rate_missing]]"/>\n'
+        "  </compartments>\n"
+        '  <compartments PrimaryName="I"/>',
+        ' totalPopulation="1000"',
+    ).replace("<seir:SEIRModel", "<!-- Two compartments, one flow -->\n<seir:SEIRModel")
+    assert grammar().matches(document)
+    assert not grammar(allow_comments=False).matches(document)
+    assert not grammar(allow_placeholders=False).matches(document)
+
+
+def test_rejects_duplicate_attributes():
+    rules = grammar()
+    assert rules.matches(model('<compartments PrimaryName="S"/>'))
+    assert not rules.matches(model('<compartments PrimaryName="S" PrimaryName="E"/>'))
+    assert not rules.matches(model("", ' totalPopulation="1" totalPopulation="2"'))
+    with pytest.raises(ET.ParseError):
+        ET.fromstring('<compartments PrimaryName="S" PrimaryName="E"/>')
+
+
+def test_rejects_unknown_attributes_and_prose():
+    rules = grammar()
+    assert not rules.matches(model('<compartments color="red"/>'))
+    assert not rules.matches("Here is the model:\n" + model(""))
+    assert not rules.matches(model("").replace("</seir:SEIRModel>", "</seir:SEIRModel>\n```"))
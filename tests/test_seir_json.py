@@ -0,0 +1,104 @@
+import json
+import random
+
+import pytest
+
+import seir_json
+import seir_validator
+import seir_xml
+from gbnf import Grammar
+
+
+MODEL = {
+    "totalPopulation": "1000",
+    "parameters": [{"name": "beta", "expression": "0.3"}],
+    "compartments": [
+        {
+            "PrimaryName": "Susceptible",
+            "SecondaryName": "Young",
+            "population": "990",
+            "outgoingFlows": [
+                {"type": "ContactFlow", "contactRate": "0.3", "target": 1, "contactCompartment": 1},
+            ],
+        },
+        {
+            "PrimaryName": "Infectious",
+            "outgoingFlows": [
+                {"type": "RateFlow", "rate": "0.1", "target": 2, "description": "Recovery & \"immunity\""},
+            ],
+        },
+        {"PrimaryName": "Recovered"},
+    ],
+    "groups": [{"name": "age", "values": ["Young", "Old"]}],
+}
+
+
+def test_json_to_xml_to_json_round_trip():
+    xml_text = seir_json.to_xml(dict(MODEL, notes=["three compartments"]))
+    assert "<!-- three compartments -->" in xml_text
+    assert seir_json.from_xml(xml_text) == MODEL
+
+
+def test_xml_to_json_to_xml_round_trip():
+    xml_text = seir_json.to_xml(MODEL)
+    assert seir_json.to_xml(seir_json.from_xml(xml_text)) == xml_text
+
+
+def test_xml_uses_the_metamodel_layout():
+    root = seir_xml.parse(seir_json.to_xml(MODEL))
+    assert root.tag == seir_xml.ROOT_TAG
+    contact = seir_xml.resolve(root, "//@compartments.0/@outgoingFlows.0")
+    assert contact.get(seir_xml.XSI_TYPE) == "seir:ContactFlow"
+    assert contact.get("target") == "//@compartments.1"
+    assert seir_xml.resolve(root, "//@compartments.1/@outgoingFlows.0").get("description") == 'Recovery & "immunity"'
+
+
+@pytest.mark.parametrize("path", ["old_seirmodel_output/hiv.xml", "old_seirmodel_output/covid.xml"])
+def test_saved_model_survives_a_round_trip(path):
+    with open(path, encoding="utf-8") as f:
+        model = seir_json.from_xml(seir_xml.extract_xml(f.read()))
+    assert seir_json.from_xml(seir_json.to_xml(model)) == model
+
+
+def test_compact_json_is_one_line():
+    text = seir_json.to_json(MODEL)
+    assert "\n" not in text and ", " not in text
+    assert seir_json.parse(f"Here it is: {text} done") == MODEL
+
+
+@pytest.mark.parametrize("response", [
+    "no JSON at all",
+    '{"compartments": [{"PrimaryName": "S", "outgoingFlows": [{"type": "RateFlow", "target": -1}]}]}',
+    '{"compartments": ["S"]}',
+])
+def test_unusable_models_become_errors(response):
+    assert seir_json.convert(response).startswith("ERROR:")
+    assert seir_json.validate(response)[0].rule == "well_formed"
+
+
+def test_valid_model_passes_the_validator():
+    assert seir_json.validate(seir_json.to_json(MODEL)) == []
+
+
+def test_gemini_schema_has_no_patterns():
+    schema = seir_json.schema_for_file("metamodel.json")
+    assert '"pattern"' in json.dumps(schema)
+    assert '"pattern"' not in json.dumps(seir_json.for_gemini(schema))
+
+
+@pytest.mark.parametrize("allow_placeholders", [True, False])
+def test_grammar_accepts_the_model_and_derives_convertible_json(allow_placeholders):
+    rules = Grammar(seir_json.grammar_for_file("metamodel.json", allow_placeholders=allow_placeholders))
+    assert rules.matches(seir_json.to_json(MODEL))
+    assert not rules.matches(seir_json.to_json(dict(MODEL, totalPopulation="a lot")))
+    rng = random.Random(3)
+    for _ in range(30):
+        model = json.loads(rules.sample(rng))
+        seir_xml.parse(seir_json.to_xml(model))
+
+
+def test_characters_xml_cannot_hold_are_dropped():
+    model = {"notes": ["form\x0cfeed"], "compartments": [{"PrimaryName": "S\x0b\x00", "SecondaryName": "<&>"}]}
+    root = seir_xml.parse(seir_json.convert(seir_json.to_json(model)))
+    assert root.find("compartments").get("PrimaryName") == "S"
+    assert root.find("compartments").get("SecondaryName") == "<&>"
@@ -0,0 +1,61 @@
+import self_repair
+import seir_validator
+import seir_xml
+
+
+MODEL = """<seir:SEIRModel xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:seir="http://example.com/seirmodel">
+  <compartments PrimaryName="Susceptible">
+    <outgoingFlows xsi:type="seir:RateFlow" rate="0.3" target="//@compartments.4"/>
+  </compartments>
+  <compartments PrimaryName="Infectious">
+    <outgoingFlows xsi:type="seir:RateFlow" rate="0.1" target="//@compartments.0"/>
+  </compartments>
+  <parameters name="beta" expression="0.3"/>
+</seir:SEIRModel>"""
+METAMODEL = {"seirmodel_metamodel": {"validation_rules": {"index_consistency": "References must point to existing compartments."}}}
+FIX = 'SET //@compartments.0/@outgoingFlows.0 target="//@compartments.1"'
+
+
+def repair(responses, max_rounds=2):
+    prompts = []
+
+    def call(prompt):
+        prompts.append(prompt)
+        return responses.pop(0)
+
+    issues = seir_validator.validate(MODEL)
+    return self_repair.repair(MODEL, issues, call, "Fix the model.", METAMODEL, max_rounds), prompts
+
+
+def test_prompt_sends_only_the_broken_fragment():
+    root = seir_xml.parse(MODEL)
+    prompt = self_repair.build_prompt("Fix the model.", root, seir_validator.validate(MODEL), METAMODEL)
+    assert "References must point to existing compartments." in prompt
+    assert 'target="//@compartments.4"' in prompt
+    assert 'target="//@compartments.0"' not in prompt
+    assert "//@compartments.1 Infectious" in prompt
+    assert "Parameters:" not in prompt
+
+
+def test_compartments_are_sent_without_their_flows():
+    root = seir_xml.parse(MODEL)
+    assert self_repair.fragment(root, "//@compartments.1") == '<compartments PrimaryName="Infectious"/>'
+
+
+def test_a_patch_that_fixes_the_model_is_kept():
+    (xml_text, issues, rounds), prompts = repair([FIX])
+    assert issues == [] and len(rounds) == 1 and len(prompts) == 1
+    assert seir_xml.resolve(seir_xml.parse(xml_text), "//@compartments.0/@outgoingFlows.0").get("target") == "//@compartments.1"
+
+
+def test_bad_patches_and_errors_leave_the_model_unchanged():
+    for response in ("ERROR: quota", "DEL //@compartments.7", 'SET //@parameters.0 name="beta"'):
+        (xml_text, issues, rounds), _ = repair([response])
+        assert xml_text == MODEL and len(issues) == 1 and rounds == []
+
+
+def test_malformed_xml_is_not_repairable():
+    assert not self_repair.is_repairable([seir_validator.Issue("well_formed", "broken")])
+    assert not self_repair.is_repairable([])
+    (_, _, rounds), prompts = repair([FIX], max_rounds=0)
+    assert rounds == [] and prompts == []
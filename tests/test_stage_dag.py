@@ -0,0 +1,76 @@
+import response_cache
+import stage_dag
+
+
+def counted(output, calls, name):
+    def fn():
+        calls.append(name)
+        return output
+    return fn
+
+
+def run_chain(store, calls, prompt="prompt", llm1="<llm1/>", resume=True):
+    graph = stage_dag.StageGraph(store, "chain", resume)
+    graph.run("llm1", counted(llm1, calls, "llm1"), {"prompt": prompt})
+    graph.run("llm2", counted("<llm2/>", calls, "llm2"), {"prompt": "refine"}, deps=("llm1",))
+    return graph
+
+
+def test_completed_nodes_are_restored(tmp_path):
+    store = response_cache.ResponseCache(str(tmp_path))
+    calls = []
+    run_chain(store, calls)
+    graph = run_chain(store, calls)
+    assert calls == ["llm1", "llm2"]
+    assert graph.restored == ["llm1", "llm2"]
+
+
+def test_changed_input_reruns_the_node_and_everything_downstream(tmp_path):
+    store = response_cache.ResponseCache(str(tmp_path))
+    calls = []
+    run_chain(store, calls)
+    run_chain(store, calls, prompt="new prompt", llm1="<changed/>")
+    assert calls == ["llm1", "llm2", "llm1", "llm2"]
+
+
+def test_same_upstream_output_keeps_downstream_checkpoint(tmp_path):
+    store = response_cache.ResponseCache(str(tmp_path))
+    calls = []
+    run_chain(store, calls)
+    graph = run_chain(store, calls, prompt="new prompt")  # llm1 reruns but answers the same
+    assert calls == ["llm1", "llm2", "llm1"]
+    assert graph.restored == ["llm2"]
+
+
+def test_errors_are_not_checkpointed(tmp_path):
+    store = response_cache.ResponseCache(str(tmp_path))
+    calls = []
+    run_chain(store, calls, llm1="ERROR: 503 overloaded")
+    run_chain(store, calls)
+    assert calls == ["llm1", "llm2", "llm1", "llm2"]
+
+
+def test_resume_false_runs_every_node(tmp_path):
+    store = response_cache.ResponseCache(str(tmp_path))
+    calls = []
+    run_chain(store, calls)
+    run_chain(store, calls, resume=False)
+    assert calls == ["llm1", "llm2", "llm1", "llm2"]
+
+
+def test_rejected_node_runs_again(tmp_path):
+    store = response_cache.ResponseCache(str(tmp_path))
+    calls = []
+    run_chain(store, calls).reject("llm2")
+    run_chain(store, calls)
+    assert calls == ["llm1", "llm2", "llm2"]
+
+
+def test_dependency_must_run_first():
+    graph = stage_dag.StageGraph(None, "chain")
+    try:
+        graph.run("llm2", lambda: "<llm2/>", deps=("llm1",))
+    except ValueError as err:
+        assert "llm1" in str(err)
+    else:
+        raise AssertionError("llm2 ran before llm1")
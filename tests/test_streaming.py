@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import streaming
+
+
+MODEL = '<seir:SEIRModel totalPopulation="1000">\n  <compartments PrimaryName="S"/>\n</seir:SEIRModel>'
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 17, 1000])
+def test_stops_at_the_closing_tag_across_chunk_boundaries(size):
+    result = streaming.collect_stream(iter(chunked(MODEL + "\n\nThis model has one compartment.", size)))
+    assert result.text == MODEL
+    assert result.stopped_early
+
+
+@pytest.mark.parametrize("size", [1, 3, 4, 1000])
+def test_stops_at_the_end_of_the_first_code_block(size):
+    text = "Here it is:\n```python\nx = 1\n```\nExplanation:\n```\nmore\n```"
+    result = streaming.collect_stream(iter(chunked(text, size)))
+    assert result.text == "Here it is:\n```python\nx = 1\n```"
+
+
+def test_backticks_inside_a_line_do_not_close_a_block():
+    text = "```\nprint('```')\n```"
+    assert streaming.find_stop(text) == len(text)
+    assert streaming.find_stop("no fence ``` here\n```") == -1
+
+
+def test_unfinished_output_is_kept_whole():
+    result = streaming.collect_stream(iter(chunked(MODEL[:-5], 4)))
+    assert result.text == MODEL[:-5]
+    assert not result.stopped_early
+
+
+def test_scanner_matches_find_stop_on_the_whole_text():
+    text = "```xml\n" + MODEL + "\n```"
+    scanner = streaming.StopScanner()
+    stops = [scanner.feed(chunk) for chunk in chunked(text, 3)]
+    assert [stop for stop in stops if stop != -1][0] == streaming.find_stop(text)
+
+
+def test_stream_is_logged_up_to_the_stop(tmp_path):
+    log_path = streaming.stream_log_path(str(tmp_path), "model.txt")
+    streaming.collect_stream(iter(chunked(MODEL + " trailing prose", 6)), log_path, "LLM1")
+    log = open(log_path, encoding="utf-8").read()
+    assert MODEL in log and "trailing prose" not in log
+
+
+def test_cancel_event_abandons_the_stream():
+    event = threading.Event()
+    event.set()
+    streaming.set_cancel_event(event)
+    try:
+        with pytest.raises(streaming.StreamCancelled):
+            streaming.collect_stream(iter(["<seir:"]), label="LLM2")
+    finally:
+        streaming.set_cancel_event(None)
+
+
+def test_partial_output_round_trip():
+    error = streaming.with_partial_output("ERROR: Generation timed out", "<seir:SEIRModel>")
+    assert error.startswith("ERROR:")
+    assert streaming.partial_output(error) == "<seir:SEIRModel>"
+    assert streaming.partial_output("ERROR: Generation timed out") == ""
+    assert streaming.partial_output(MODEL) == ""
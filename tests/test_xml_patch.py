@@ -0,0 +1,95 @@
+import pytest
+
+import seir_xml
+import xml_patch
+
+
+MODEL = """Here is the model:
+```xml
+<?xml version="1.0" encoding="UTF-8"?>
+<seir:SEIRModel xmlns:xmi="http://www.omg.org/XMI" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xmlns:seir="http://example.com/seirmodel" totalPopulation="1000">
+  <compartments PrimaryName="Susceptible">
+    <outgoingFlows rate="0.3" target="//@compartments.1"/>
+  </compartments>
+  <compartments PrimaryName="Infectious">
+    <outgoingFlows rate="0.1" target="//@compartments.2"/>
+    <outgoingFlows rate="0.01" target="//@compartments.0"/>
+  </compartments>
+  <compartments PrimaryName="Recovered"/>
+  <parameters name="beta" expression="0.3"/>
+</seir:SEIRModel>
+```"""
+
+
+def patched(patch_text):
+    return seir_xml.parse(xml_patch.apply_patch(MODEL, patch_text))
+
+
+def test_extract_and_resolve_paths():
+    root = seir_xml.parse(seir_xml.extract_xml(MODEL))
+    assert seir_xml.parse_path("//@compartments.1/@outgoingFlows.1") == [("compartments", 1), ("outgoingFlows", 1)]
+    flow = seir_xml.resolve(root, "//@compartments.1/@outgoingFlows.1")
+    assert flow.get("rate") == "0.01"
+    assert seir_xml.path_of(root, flow) == "//@compartments.1/@outgoingFlows.1"
+    assert seir_xml.resolve(root, "/") is root
+
+
+def test_invalid_paths():
+    root = seir_xml.parse(seir_xml.extract_xml(MODEL))
+    with pytest.raises(ValueError):
+        seir_xml.parse_path("compartments.1")
+    with pytest.raises(KeyError):
+        seir_xml.resolve(root, "//@compartments.7")
+
+
+def test_set_changes_attributes():
+    root = patched('SET //@compartments.0/@outgoingFlows.0 rate="0.25"\nSET / totalPopulation="2000"')
+    assert seir_xml.resolve(root, "//@compartments.0/@outgoingFlows.0").get("rate") == "0.25"
+    assert root.get("totalPopulation") == "2000"
+
+
+def test_add_keeps_new_children_next_to_their_siblings():
+    root = patched('ADD / <compartments PrimaryName="Dead"/>')
+    assert [c.get("PrimaryName") for c in root.findall("compartments")][-1] == "Dead"
+    assert [child.tag for child in root][-1] == "parameters"
+
+
+def test_add_with_xsi_type():
+    root = patched('ADD //@compartments.2 <outgoingFlows xsi:type="seir:RateFlow" rate="0.002" target="//@compartments.0"/>')
+    flow = seir_xml.resolve(root, "//@compartments.2/@outgoingFlows.0")
+    assert flow.get(seir_xml.XSI_TYPE) == "seir:RateFlow"
+
+
+def test_paths_refer_to_the_unpatched_model():
+    # Deleting the first flow must not shift the index the SET refers to
+    root = patched('DEL //@compartments.1/@outgoingFlows.0\nSET //@compartments.1/@outgoingFlows.1 rate="0.02"')
+    flows = root.findall("compartments")[1].findall("outgoingFlows")
+    assert [flow.get("rate") for flow in flows] == ["0.02"]
+
+
+def test_comments_and_fences_are_ignored():
+    root = patched('```\n# lower the infection rate\nSET //@parameters.0 expression="0.2"\n```')
+    assert root.find("parameters").get("expression") == "0.2"
+
+
+@pytest.mark.parametrize("patch_text", [
+    "MOVE //@compartments.0 //@compartments.1",
+    'SET //@compartments.9 rate="1"',
+    'SET //@compartments.0 rate',
+    "SET compartments.0 rate=\"1\"",
+    "ADD //@compartments.0 <outgoingFlows rate=",
+    "DEL /",
+    "DEL //@compartments.1/@outgoingFlows.0\nDEL //@compartments.1/@outgoingFlows.0",
+    "DEL //@compartments.1\nDEL //@compartments.1/@outgoingFlows.1",
+])
+def test_bad_patches_raise_patch_error(patch_text):
+    with pytest.raises(xml_patch.PatchError):
+        xml_patch.apply_patch(MODEL, patch_text)
+
+
+def test_bad_documents_raise_patch_error():
+    with pytest.raises(xml_patch.PatchError):
+        xml_patch.apply_patch("No XML here", 'SET / totalPopulation="1"')
+    with pytest.raises(xml_patch.PatchError):
+        xml_patch.apply_patch("<seir:SEIRModel totalPopulation='1'><compartments></seir:SEIRModel>", 'SET / a="1"')
@@ -0,0 +1,134 @@
+"""
+Patch-based Stage 2 refinement.
+
+Instead of re-emitting the whole SEIRModel XML, the Stage 2 LLM answers with a
+short list of edits against LLM1's XML, one per line, addressed with XMI paths:
+
+    SET //@compartments.3/@outgoingFlows.0 rate="0.120342"
+    SET //@parameters.4 expression="0.0129" unit="1/year"
+    SET / totalPopulation="14800000"
+    ADD //@compartments.2 <outgoingFlows xsi:type="seir:RateFlow" rate="0.1" target="//@compartments.3"/>
+    DEL //@compartments.3/@outgoingFlows.1
+
+All paths refer to LLM1's XML as it was before any edit, so earlier edits never
+shift the indices used by later ones. `apply_patch` applies the edits locally
+and returns the final XML.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+import seir_xml
+
+
+EDIT_LINE = re.compile(r"^(SET|ADD|DEL)\s+(\S+)\s*(.*)$")
+ATTRIBUTE = re.compile(r'([\w:]+)="([^"]*)"')
+
+
+class PatchError(ValueError):
+    """Raised when an edit line cannot be parsed or applied."""
+
+
+def _attribute_name(name: str) -> str:
+    """Turn a prefixed attribute name (xsi:type) into ElementTree's {namespace}name form."""
+    if ":" in name:
+        prefix, local = name.split(":", 1)
+        if prefix in seir_xml.NAMESPACES:
+            return f"{{{seir_xml.NAMESPACES[prefix]}}}{local}"
+    return name
+
+
+def parse_edits(patch_text: str) -> list:
+    """
+    Parse the LLM's edit list.
+
+    Blank lines, code fences and lines starting with '#' are ignored.
+
+    Returns:
+        list: (operation, path, argument) tuples
+    """
+    edits = []
+    for number, line in enumerate(patch_text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("```") or line.startswith("#"):
+            continue
+        match = EDIT_LINE.match(line)
+        if not match:
+            raise PatchError(f"Line {number}: cannot parse edit '{line}'")
+        edits.append(match.groups())
+    return edits
+
+
+def apply_patch(xml_text: str, patch_text: str) -> str:
+    """
+    Apply an edit list to LLM1's XML.
+
+    Args:
+        xml_text: LLM1's SEIRModel XML (may still contain prose or code fences)
+        patch_text: The Stage 2 edit list
+
+    Returns:
+        str: The patched SEIRModel XML
+
+    Raises:
+        PatchError: If the XML cannot be found or an edit is invalid
+    """
+    document = seir_xml.extract_xml(xml_text)
+    if document is None:
+        raise PatchError("No SEIRModel XML found in LLM1's response")
+    try:
+        root = seir_xml.parse(document)
+    except ET.ParseError as err:
+        raise PatchError(f"The XML to patch is not well-formed: {err}") from err
+
+    # Resolve every path against the unmodified tree before changing anything
+    resolved = []
+    for operation, path, argument in parse_edits(patch_text):
+        try:
+            element = seir_xml.resolve(root, path)
+        except (KeyError, ValueError) as err:
+            raise PatchError(f"{operation} {path}: {err}") from err
+        resolved.append((operation, path, element, argument))
+
+    parents = {child: parent for parent in root.iter() for child in parent}
+
+    # An element can only be removed once: reject repeated DELs and DELs inside an element that is deleted too
+    deleted = {element: path for operation, path, element, _ in resolved if operation == "DEL"}
+    seen = set()
+    for operation, path, element, _ in resolved:
+        if operation != "DEL":
+            continue
+        if element in seen:
+            raise PatchError(f"DEL {path}: the element is deleted more than once")
+        seen.add(element)
+        ancestor = parents.get(element)
+        while ancestor is not None:
+            if ancestor in deleted:
+                raise PatchError(f"DEL {path}: the element is inside {deleted[ancestor]}, which is deleted too")
+            ancestor = parents.get(ancestor)
+    for operation, path, element, argument in resolved:
+        if operation == "SET":
+            attributes = ATTRIBUTE.findall(argument)
+            if not attributes:
+                raise PatchError(f"SET {path}: no attribute=\"value\" pairs given")
+            for name, value in attributes:
+                element.set(_attribute_name(name), value)
+        elif operation == "ADD":
+            try:
+                new_children = seir_xml.parse_fragment(argument)
+            except Exception as err:
+                raise PatchError(f"ADD {path}: invalid XML fragment: {err}") from err
+            for child in new_children:
+                # Keep new children next to existing siblings of the same kind
+                same_tag = [i for i, existing in enumerate(element) if existing.tag == child.tag]
+                element.insert(same_tag[-1] + 1 if same_tag else len(element), child)
+        elif operation == "DEL":
+            if element is root:
+                raise PatchError("DEL /: the root element cannot be deleted")
+            parents[element].remove(element)
+
+    return seir_xml.to_string(root)
+
+
+def patch_size_ratio(patch_text: str, xml_text: str) -> float:
+    """Return the size of the patch relative to the full XML it replaces."""
+    return len(patch_text) / max(1, len(xml_text))